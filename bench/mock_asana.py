@@ -0,0 +1,287 @@
+""" mock_asana.py file for an in-process stand-in of the Asana API endpoints
+used by the migrator."""
+import json
+import time
+import random
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import parsers
+
+API_PATH_PREFIX = '/api/1.0'
+
+
+class MockAsanaState():
+    """MockAsanaState class holding the workspace users, time periods and goals served
+    by the mock Asana server, along with the requests it received."""
+
+    def __init__(self, users=(), time_periods=(), goals=(), latency=0.0, rate_limit_share=0.0,
+                 retry_after=0.1, seed=0) -> None:
+        self.collections = {
+            '/users': list(users),
+            '/time_periods': list(time_periods),
+            '/goals': list(goals),
+        }
+        self.latency = latency
+        self.rate_limit_share = rate_limit_share
+        self.retry_after = retry_after
+        self.request_counts = Counter()
+        self.rate_limited_count = 0
+        # Every write applied, as (method, path, data) tuples in order
+        self.writes = []
+        # The (parent goal GID, supporting goal GID) pairs of the linked goals
+        self.relationships = set()
+        self.status_updates = []
+        self._faults = {}
+        self._gids = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_gid(self):
+        """Gets a new GID for a created object."""
+        with self._lock:
+            self._gids += 1
+            return str(9000000000 + self._gids)
+
+    def add_goal(self, gid, notes):
+        """Adds a created goal to the workspace goals."""
+        with self._lock:
+            self.collections['/goals'].append({'gid': gid, 'notes': notes})
+
+    def get_goal_gids(self):
+        """Gets the GIDs of the workspace goals by their Ally reference ID."""
+        with self._lock:
+            return {
+                parsers.parse_reference_id(goal['notes']): goal['gid']
+                for goal in self.collections['/goals']
+            }
+
+    def count_request(self, endpoint):
+        """Counts a request and decides whether it gets rate limited."""
+        with self._lock:
+            self.request_counts[endpoint] += 1
+            is_rate_limited = self._random.random() < self.rate_limit_share
+            if is_rate_limited:
+                self.rate_limited_count += 1
+            return is_rate_limited
+
+    def add_fault(self, endpoint, status_code=None, delay=0.0, applied=True, headers=None):
+        """Makes the next request (or batch action) to an endpoint, e.g. POST /status_updates,
+        fail with a status code and/or respond only after a delay, e.g. longer than the
+        read timeout of the client. An applied fault applies the write before failing."""
+        with self._lock:
+            self._faults.setdefault(endpoint, []).append(
+                {'status_code': status_code, 'delay': delay, 'applied': applied,
+                 'headers': headers or {}})
+
+    def take_fault(self, endpoint):
+        """Takes the next fault added for an endpoint, if any."""
+        with self._lock:
+            faults = self._faults.get(endpoint)
+            return faults.pop(0) if faults else None
+
+    def apply_write(self, method, path, data):
+        """Applies a write to the workspace and gets the GID of the object written."""
+        parts = path.split('/')
+        gid = parts[2] if method == 'PUT' and path.startswith('/goals/') else self.next_gid()
+        with self._lock:
+            self.writes.append((method, path, data))
+        if path == '/goals':
+            self.add_goal(gid, data.get('notes'))
+        elif path == '/status_updates':
+            with self._lock:
+                self.status_updates.append({'gid': gid, **data})
+        elif path.endswith('/addSupportingRelationship'):
+            with self._lock:
+                self.relationships.add((parts[2], data.get('supporting_resource')))
+        elif path.endswith('/removeSupportingRelationship'):
+            with self._lock:
+                self.relationships.discard((parts[2], data.get('supporting_resource')))
+        return gid
+
+    def get_collection(self, path, query):
+        """Gets the items of a collection endpoint, or None for an unknown path."""
+        if path == '/status_updates':
+            return [
+                status_update for status_update in self.status_updates
+                if status_update.get('parent') == query.get('parent')
+            ]
+        if path.startswith('/goals/') and path.endswith('/parentGoals'):
+            goal_gid = path.split('/')[2]
+            return [
+                {'gid': parent_gid} for parent_gid, supporting_gid in sorted(self.relationships)
+                if supporting_gid == goal_gid
+            ]
+        return self.collections.get(path)
+
+
+class MockAsanaHandler(BaseHTTPRequestHandler):
+    """MockAsanaHandler class answering the Asana API requests of the migrator:
+    paginated users, time periods and goals, creating and updating goals, goal metrics,
+    goal relationships and status updates, also as the actions of batch requests.
+    The parent goals of a goal and the status updates of a goal are served as well."""
+    # Keep the connections alive like the Asana API does, without delaying small responses
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serves a page of the users, time periods or goals, or of the parent goals
+        or status updates of a goal."""
+        path, query = self.parse_path()
+        endpoint = parsers.parse_api_endpoint('GET', path)
+        if not self.start_request(endpoint):
+            return
+        self.respond(endpoint, lambda: self.get_page(path, query))
+
+    def get_page(self, path, query):
+        """Gets the status code and body to respond to a request for a page with."""
+        items = self.server.state.get_collection(path, query)
+        if items is None:
+            return 404, {'errors': [{'message': f'Unknown path {path}'}]}
+        limit = int(query.get('limit') or 100)
+        start = int(query.get('offset') or 0)
+        end = start + limit
+        next_page = None
+        if end < len(items):
+            next_page = {'offset': str(end), 'path': path, 'uri': self.path}
+        return 200, {'data': items[start:end], 'next_page': next_page}
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Creates a goal, goal metric, goal relationship or status update,
+        or runs the actions of a batch request."""
+        path, _ = self.parse_path()
+        data = self.read_data()
+        endpoint = parsers.parse_api_endpoint('POST', path)
+        if not self.start_request(endpoint):
+            return
+        if path == '/batch':
+            self.respond(endpoint, lambda: (
+                200, {'data': [self.run_action(action) for action in data['actions']]}))
+            return
+        self.respond(endpoint, lambda: self.write('POST', path, data))
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Updates a goal."""
+        path, _ = self.parse_path()
+        data = self.read_data()
+        endpoint = parsers.parse_api_endpoint('PUT', path)
+        if not self.start_request(endpoint):
+            return
+        self.respond(endpoint, lambda: self.write('PUT', path, data))
+
+    def respond(self, endpoint, run):
+        """Runs a request and responds with its result, unless a fault was added for its
+        endpoint (see MockAsanaState.add_fault)."""
+        fault = self.server.state.take_fault(endpoint)
+        if fault is None:
+            self.send_json(*run())
+            return
+        result = run() if fault['applied'] else None
+        time.sleep(fault['delay'])
+        if fault['status_code']:
+            self.send_json(
+                fault['status_code'], {'errors': [{'message': 'Injected fault'}]},
+                fault['headers'])
+        else:
+            self.send_json(*(result or run()))
+
+    def write(self, method, path, data):
+        """Creates or updates an object and gets the status code and body to respond with."""
+        gid = self.server.state.apply_write(method, path, data)
+        return (200 if method == 'PUT' else 201), {'data': {'gid': gid, **data}}
+
+    def run_action(self, action):
+        """Runs an action of a batch request, which gets rate limited and fails on its own."""
+        state = self.server.state
+        method = action['method'].upper()
+        path = action['relative_path']
+        endpoint = parsers.parse_api_endpoint(method, path)
+        if state.count_request(endpoint):
+            return {
+                'status_code': 429,
+                'headers': {'Retry-After': str(state.retry_after)},
+                'body': {'errors': [{'message': 'Rate limit enforced'}]},
+            }
+        fault = state.take_fault(endpoint)
+        if fault and fault['status_code']:
+            if fault['applied']:
+                self.write(method, path, action.get('data') or {})
+            return {
+                'status_code': fault['status_code'],
+                'headers': fault['headers'],
+                'body': {'errors': [{'message': 'Injected fault'}]},
+            }
+        status_code, body = self.write(method, path, action.get('data') or {})
+        return {'status_code': status_code, 'headers': {}, 'body': body}
+
+    def parse_path(self):
+        """Gets the API path and query parameters of the request."""
+        path, _, query_string = self.path.partition('?')
+        query = dict(
+            parameter.split('=', 1) for parameter in query_string.split('&') if '=' in parameter)
+        return path[len(API_PATH_PREFIX):], query
+
+    def read_data(self):
+        """Reads the data of the JSON request body."""
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body)['data'] if body else {}
+
+    def start_request(self, endpoint):
+        """Counts the request, waits for the configured latency and responds with
+        a rate limited (429) error if the request gets rate limited."""
+        state = self.server.state
+        if state.latency:
+            time.sleep(state.latency)
+        if state.count_request(endpoint):
+            self.send_json(
+                429, {'errors': [{'message': 'Rate limit enforced'}]},
+                {'Retry-After': str(state.retry_after)})
+            return False
+        return True
+
+    def send_json(self, status_code, body, headers=None):
+        """Sends a JSON response, unless the client gave up on it, e.g. after a timeout."""
+        content = json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Doesn't log every request."""
+
+
+class MockAsanaServer():
+    """MockAsanaServer class running the mock Asana API on a local port in a background
+    thread, e.g. as the base URL of the Asana client:
+        with MockAsanaServer(state) as server:
+            asana_client.options['base_url'] = server.base_url
+    """
+
+    def __init__(self, state, host='127.0.0.1', port=0) -> None:
+        self.state = state
+        self.httpd = ThreadingHTTPServer((host, port), MockAsanaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = state
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        """The base URL of the mock Asana API."""
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}{API_PATH_PREFIX}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,122 @@
+""" parser_benchmark.py file to micro-benchmark parsing check-in cell values.
+
+Compares scanning every check-in three times, once per value (as the migrator did, with
+the pattern strings of earlier versions and with pandas per column), against the single
+pass check-in tokenizer of parsers.py, on synthetic check-ins with long multi-line notes.
+Usage from the repository root:
+    python bench/parser_benchmark.py --checkins 20000 --notes-lines 40
+"""
+# pylint: disable=wrong-import-position
+import os
+import sys
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [BENCH_DIR, REPO_DIR, os.path.join(REPO_DIR, 'utils')]
+# pylint: enable=wrong-import-position
+import re
+import time
+import random
+import argparse
+import pandas as pd
+import parsers
+from synthetic_data import STATUSES
+
+# The pattern strings earlier versions of the migrator searched every check-in with
+LEGACY_STATUS_PATTERN = r'Status:\s(.*)'
+LEGACY_TIMESTAMP_PATTERN = r'(\[.*UTC.*\]).*'
+LEGACY_NOTES_PATTERN = r'Note:\s(.*[\s\S]+)Metric Name:'
+WORDS = ['progress', 'blocked', 'review', 'launch', 'customer', 'metric', 'team', 'Q3', 'plan']
+
+
+def generate_checkins(count, notes_lines, seed=0):
+    """Generates check-in cell values like the Ally export, with notes of the given
+    number of lines of random words."""
+    rng = random.Random(seed)
+    checkins = []
+    for number in range(count):
+        notes = '\n'.join(
+            ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(5, 20)))
+            for _ in range(rng.randrange(1, notes_lines + 1))
+        )
+        checkins.append(
+            f'[2023-{number % 12 + 1:02d}-01 10:00:00 UTC] Status: {rng.choice(STATUSES)}\n'
+            f'Note: {notes}\nMetric Name: Progress'
+        )
+    return checkins
+
+
+def parse_legacy(checkins):
+    """Scans every check-in three times with the legacy pattern strings."""
+    return [
+        tuple(
+            match.group(1) if match else None
+            for match in (
+                re.search(LEGACY_STATUS_PATTERN, checkin),
+                re.search(LEGACY_TIMESTAMP_PATTERN, checkin),
+                re.search(LEGACY_NOTES_PATTERN, checkin),
+            )
+        )
+        for checkin in checkins
+    ]
+
+
+def parse_vectorized(checkins):
+    """Scans the check-ins three times with pandas, once per value, like ingest.py did."""
+    cells = pd.Series(checkins)
+    parsed = pd.DataFrame({
+        'status': cells.str.extract(parsers.CHECKIN_STATUS_PATTERN, expand=False),
+        'timestamp': cells.str.extract(parsers.CHECKIN_TIMESTAMP_PATTERN, expand=False),
+        'notes': cells.str.extract(parsers.CHECKIN_NOTES_PATTERN, expand=False),
+    })
+    parsed = parsed.astype(object).where(parsed.notna(), None)
+    return list(parsed.itertuples(index=False, name=None))
+
+
+def parse_tokenized(checkins):
+    """Scans every check-in once with the check-in tokenizer."""
+    return [parsers.tokenize_checkin(checkin)[:3] for checkin in checkins]
+
+
+def time_parser(parse, checkins, repeat):
+    """Gets the fastest time in seconds of parsing all check-ins, and the results."""
+    best = None
+    results = None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        results = parse(checkins)
+        seconds = time.perf_counter() - started_at
+        best = seconds if best is None else min(best, seconds)
+    return best, results
+
+
+def run_benchmark(options):
+    """Times every parser on the same check-ins and prints the speedups."""
+    checkins = generate_checkins(options.checkins, options.notes_lines, options.seed)
+    size_mb = sum(len(checkin) for checkin in checkins) / 1024 / 1024
+    print(f'{len(checkins)} check-ins, {size_mb:.1f}MB of text')
+    baseline_seconds = baseline_results = None
+    for name, parse in [('legacy', parse_legacy), ('vectorized', parse_vectorized),
+                        ('tokenized', parse_tokenized)]:
+        seconds, results = time_parser(parse, checkins, options.repeat)
+        if baseline_results is None:
+            baseline_seconds, baseline_results = seconds, results
+        elif results != baseline_results:
+            print(f'{name}: results differ from the legacy parser')
+            continue
+        print(
+            f'{name}: {seconds * 1000:.1f}ms, {len(checkins) / seconds:.0f} check-ins/s, '
+            f'{baseline_seconds / seconds:.1f}x the legacy parser'
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkins", type=int, default=20000,
+                        help="number of synthetic check-in cell values to parse")
+    parser.add_argument("--notes-lines", type=int, default=40,
+                        help="maximum number of lines of notes per check-in")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of times to time every parser, keeping the fastest")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the synthetic check-ins")
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,187 @@
+""" run_benchmark.py file to benchmark the migrator end to end against the mock Asana API.
+
+Every goals CSV size is migrated in its own process, in a temporary directory with
+synthetic goals.csv/members.csv files, so the peak RSS of each size is measured on its own.
+Usage from the repository root:
+    python bench/run_benchmark.py --sizes 1000 10000 --latency 0.005 --rate-limit-share 0.01
+"""
+# pylint: disable=wrong-import-position
+import os
+import sys
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [BENCH_DIR, REPO_DIR, os.path.join(REPO_DIR, 'src'), os.path.join(REPO_DIR, 'utils')]
+# pylint: enable=wrong-import-position
+import json
+import time
+import argparse
+import resource
+import tempfile
+import threading
+import statistics
+import traceback
+import multiprocessing
+import synthetic_data
+from mock_asana import MockAsanaState, MockAsanaServer
+
+BENCHMARK_SIZES = [1000, 10000, 100000]
+
+
+class TimedSession():
+    """TimedSession class wrapping the requests session of the Asana client
+    to measure the latency of every API call."""
+
+    def __init__(self, session) -> None:
+        self.session = session
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def request(self, method, url, **options):
+        """Sends a request through the wrapped session and records its latency."""
+        started_at = time.perf_counter()
+        try:
+            return getattr(self.session, method)(url, **options)
+        finally:
+            latency = time.perf_counter() - started_at
+            with self._lock:
+                self.latencies.append(latency)
+
+    def get(self, url, **options):
+        """Sends a timed GET request."""
+        return self.request('get', url, **options)
+
+    def post(self, url, **options):
+        """Sends a timed POST request."""
+        return self.request('post', url, **options)
+
+    def put(self, url, **options):
+        """Sends a timed PUT request."""
+        return self.request('put', url, **options)
+
+    def delete(self, url, **options):
+        """Sends a timed DELETE request."""
+        return self.request('delete', url, **options)
+
+
+def get_percentile(values, percentile):
+    """Gets a percentile (1-99) of the values, or None without enough values."""
+    if len(values) < 2:
+        return None
+    return statistics.quantiles(values, n=100)[percentile - 1]
+
+
+def run_migration(size, options):
+    """Migrates a synthetic goals CSV of the given size against the mock Asana API
+    and measures it. Runs in its own process and working directory."""
+    users = synthetic_data.get_users(size)
+    synthetic_data.write_goals_csv('./goals.csv', size, users, options.seed)
+    synthetic_data.write_members_csv('./members.csv', users)
+    os.makedirs('./output_logs', exist_ok=True)
+    state = MockAsanaState(
+        users, synthetic_data.get_time_periods(),
+        synthetic_data.get_existing_goals(size, options.seed),
+        latency=options.latency, rate_limit_share=options.rate_limit_share,
+        retry_after=options.retry_after, seed=options.seed)
+
+    os.environ.update(
+        ASANA_TOKEN='benchmark', WORKSPACE_GID='1', SUPER_ADMIN_GID='u1',
+        ASANA_RATE_LIMIT=str(options.rate_limit),
+        # The mock Asana API is served over plain HTTP on localhost
+        OAUTHLIB_INSECURE_TRANSPORT='1')
+    # The migrator logs every goal, so only keep its log file
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+
+    with MockAsanaServer(state) as server:
+        # pylint: disable=import-outside-toplevel
+        import migrator
+        from auth import client as asana_client
+        asana_client.options['base_url'] = server.base_url
+        timed_session = TimedSession(asana_client.session)
+        asana_client.session = timed_session
+
+        started_at = time.perf_counter()
+        migrator.main(migrator.MigrationOptions(
+            workers=options.workers, page_size=options.page_size))
+        seconds = time.perf_counter() - started_at
+
+    latencies = timed_session.latencies
+    p50 = get_percentile(latencies, 50)
+    p99 = get_percentile(latencies, 99)
+    return {
+        'size': size,
+        'seconds': round(seconds, 3),
+        'goals_per_second': round(size / seconds, 1),
+        # The actions of batch requests are counted as requests, like Asana's rate limits do
+        'requests': sum(state.request_counts.values()),
+        'http_requests': len(latencies),
+        'rate_limited': state.rate_limited_count,
+        'requests_per_endpoint': dict(state.request_counts.most_common()),
+        'p50_latency_ms': round(p50 * 1000, 2) if p50 is not None else None,
+        'p99_latency_ms': round(p99 * 1000, 2) if p99 is not None else None,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_migration_process(size, options, results):
+    """Runs the migration benchmark of a size in a temporary working directory."""
+    try:
+        with tempfile.TemporaryDirectory(prefix=f'goals_migrator_bench_{size}_') as work_dir:
+            os.chdir(work_dir)
+            results.put(run_migration(size, options))
+    except Exception:  # pylint: disable=broad-except
+        results.put({'size': size, 'error': traceback.format_exc()})
+
+
+def run_benchmark(options):
+    """Benchmarks every size in its own process and prints the results."""
+    context = multiprocessing.get_context('spawn')
+    all_results = []
+    for size in options.sizes:
+        results = context.Queue()
+        process = context.Process(target=run_migration_process, args=(size, options, results))
+        process.start()
+        result = results.get()
+        process.join()
+        all_results.append(result)
+        if 'error' in result:
+            print(f'{size} goals: failed\n{result["error"]}')
+            continue
+        print(
+            f'{size} goals: {result["seconds"]}s, {result["goals_per_second"]} goals/s, '
+            f'{result["requests"]} requests ({result["rate_limited"]} rate limited) '
+            f'in {result["http_requests"]} HTTP requests, '
+            f'p50 {result["p50_latency_ms"]}ms, p99 {result["p99_latency_ms"]}ms, '
+            f'peak RSS {result["peak_rss_mb"]}MB'
+        )
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            json.dump(all_results, file, indent=2)
+    return all_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs='+', default=BENCHMARK_SIZES,
+                        help="numbers of goals in the synthetic goals CSVs to migrate")
+    parser.add_argument("-w", "--workers", type=int, default=8,
+                        help="number of concurrent workers for Asana API calls")
+    parser.add_argument("-p", "--page-size", type=int, default=100,
+                        help="number of items per page when fetching workspace data")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the mock Asana API takes to answer each request")
+    parser.add_argument("--rate-limit-share", type=float, default=0.0,
+                        help="share of requests answered with a rate limited (429) error")
+    parser.add_argument("--retry-after", type=float, default=0.1,
+                        help="seconds to retry rate limited requests after")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="client-side requests per minute (ASANA_RATE_LIMIT), 0 to not pace")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the synthetic data and the rate limited requests")
+    parser.add_argument("-o", "--output", help="JSON file to write the results to")
+    run_benchmark(parser.parse_args())
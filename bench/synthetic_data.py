@@ -0,0 +1,152 @@
+""" synthetic_data.py file to generate realistic goals.csv/members.csv exports and the
+matching workspace data for benchmarking the migrator."""
+import csv
+import random
+from datetime import datetime, timedelta
+import mappings
+
+# Share of goals at each alignment depth, e.g. 5% company goals aligned to nothing
+ALIGNMENT_DEPTH_SHARES = [0.05, 0.15, 0.30, 0.35, 0.15]
+# Share of goals with the given number of check-ins (status updates)
+CHECKIN_COUNT_SHARES = {0: 0.35, 1: 0.25, 2: 0.15, 3: 0.10, 4: 0.06, 6: 0.05, 10: 0.03, 14: 0.01}
+# Share of goals that already exist in the workspace, e.g. from a previous migration
+EXISTING_GOAL_SHARE = 0.1
+# Share of goal owners that can't be found in the workspace
+UNKNOWN_OWNER_SHARE = 0.02
+STATUSES = ['On Track', 'At Risk', 'Behind', 'Closed']
+YEARS = [2022, 2023]
+QUARTER_DATES = [('01-01', '03-31'), ('04-01', '06-30'), ('07-01', '09-30'), ('10-01', '12-31')]
+
+
+def get_time_periods():
+    """Gets the workspace time periods (annual and quarterly) for the synthetic goals."""
+    time_periods = []
+    for year in YEARS:
+        time_periods.append({
+            'gid': f'tp{year}', 'display_name': f'FY{str(year)[-2:]}',
+            'start_on': f'{year}-01-01', 'end_on': f'{year}-12-31',
+        })
+        for quarter, (start_on, end_on) in enumerate(QUARTER_DATES, 1):
+            time_periods.append({
+                'gid': f'tp{year}q{quarter}', 'display_name': f'Q{quarter} FY{str(year)[-2:]}',
+                'start_on': f'{year}-{start_on}', 'end_on': f'{year}-{end_on}',
+            })
+    return time_periods
+
+
+def get_users(size):
+    """Gets the workspace users owning the synthetic goals, about one per ten goals."""
+    return [
+        {'gid': f'u{number}', 'name': f'Owner {number}', 'email': f'owner.{number}@example.com'}
+        for number in range(1, max(10, size // 10) + 1)
+    ]
+
+
+def choose_weighted(rng, shares):
+    """Chooses a key of a dict of shares (or an index of a list of shares)."""
+    if isinstance(shares, dict):
+        return rng.choices(list(shares), weights=list(shares.values()))[0]
+    return rng.choices(range(len(shares)), weights=shares)[0]
+
+
+def format_checkin(timestamp, status, number):
+    """Formats a check-in cell value like the Ally export."""
+    return (
+        f'[{timestamp:%Y-%m-%d %H:%M:%S} UTC] Status: {status}\n'
+        f'Note: Check-in {number} notes\nwith a second line\n'
+        'Metric Name: Progress'
+    )
+
+
+def generate_goal_rows(size, users, seed=0):
+    """A generator yielding the rows of a synthetic goals CSV with the given number of goals.
+    Every goal is aligned to a goal of the previous alignment depth, and newer check-ins
+    come first, like the Ally export."""
+    rng = random.Random(seed)
+    goal_ids_by_depth = [[] for _ in ALIGNMENT_DEPTH_SHARES]
+    checkin_columns = len(mappings.CSV_COLUMN_NAMES) - mappings.CSV_COLUMN_NAMES.index('Checkins')
+    for number in range(size):
+        goal_id = str(1000000 + number)
+        depth = choose_weighted(rng, ALIGNMENT_DEPTH_SHARES)
+        # Goals are listed in any order, so a parent can only be one found earlier
+        while depth and not goal_ids_by_depth[depth - 1]:
+            depth -= 1
+        goal_ids_by_depth[depth].append(goal_id)
+        aligned_to = ''
+        if depth:
+            aligned_to = f'weight: 1, Id: {rng.choice(goal_ids_by_depth[depth - 1])}'
+
+        year = rng.choice(YEARS)
+        if depth == 0:
+            period, start_on, end_on = f'Annual {year}', f'{year}-01-01', f'{year}-12-31'
+        else:
+            quarter = rng.randrange(4)
+            period = f'Q{quarter + 1} {year}'
+            start_on = f'{year}-{QUARTER_DATES[quarter][0]}'
+            end_on = f'{year}-{QUARTER_DATES[quarter][1]}'
+        owner = rng.choice(users)['name']
+        if rng.random() < UNKNOWN_OWNER_SHARE:
+            owner = f'Former Employee {number}'
+
+        checkin_count = min(choose_weighted(rng, CHECKIN_COUNT_SHARES), checkin_columns)
+        last_checkin = datetime(year, 1, 1) + timedelta(days=rng.randrange(300))
+        checkins = [
+            format_checkin(last_checkin - timedelta(days=7 * index), rng.choice(STATUSES), index)
+            for index in range(checkin_count)
+        ]
+        status = rng.choice(STATUSES)
+
+        row = {
+            'Id': goal_id,
+            'Title': f'Synthetic goal {goal_id}',
+            'OKR type': 'Organization' if depth == 0 else 'Team',
+            'Creator': owner,
+            'Owner': owner,
+            'Period': period,
+            'Start Date': start_on,
+            'End Date': end_on,
+            'Description': f'Synthetic goal {goal_id} description',
+            'Aligned To (weight, Objective ID)': aligned_to,
+            'Metric Name': 'Progress',
+            'Target': '100.0',
+            'Object Type': 'OKR',
+            'Goal Type': 'Aspirational Goal',
+            'Start': '0.0',
+            'Last Check-in': f'{last_checkin:%Y-%m-%d %H:%M:%S} UTC' if checkins else '',
+            'Progress %': f'{rng.uniform(0, 100):.1f}',
+            'Status': status,
+            'Last Check-in Note': 'Latest notes' if checkins else '',
+        }
+        values = [row.get(column, '') for column in mappings.CSV_COLUMN_NAMES]
+        first_checkin_column = mappings.CSV_COLUMN_NAMES.index('Checkins')
+        values[first_checkin_column:first_checkin_column + len(checkins)] = checkins
+        yield values
+
+
+def write_goals_csv(file_path, size, users, seed=0):
+    """Writes a synthetic goals CSV, with the blank check-in column names of the Ally export."""
+    headers = [
+        '' if column.startswith('Blank') else column for column in mappings.CSV_COLUMN_NAMES
+    ]
+    with open(file_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(headers)
+        writer.writerows(generate_goal_rows(size, users, seed))
+
+
+def write_members_csv(file_path, users):
+    """Writes a synthetic members CSV of the organization users export."""
+    with open(file_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Name', 'Email Address', 'Department'])
+        for user in users:
+            writer.writerow([user['name'], user['email'], 'Synthetic'])
+
+
+def get_existing_goals(size, seed=0):
+    """Gets the goals that already exist in the workspace for a share of the synthetic goals."""
+    rng = random.Random(seed)
+    return [
+        {'gid': f'g{number}', 'notes': f'[Ref: Ally Id: {1000000 + number}]\n\nExisting goal'}
+        for number in range(size) if rng.random() < EXISTING_GOAL_SHARE
+    ]
@@ -1,12 +1,14 @@
 """logger.py file for timestamped output logging for info and errors."""
+import os
 import logging
 from datetime import datetime
 
 filename = datetime.now().strftime('logs_%H_%M_%d_%m_%Y.log')
 log_filepath = f"./output_logs/{filename}"
 
+# Set LOG_LEVEL=DEBUG to also log the full results of the Asana API calls
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
     format="[%(levelname)s][%(asctime)s]: %(message)s",
     handlers=[
         logging.FileHandler(log_filepath),
@@ -20,6 +22,12 @@ def log_info(msg):
     logging.info(msg)
 
 
+def log_debug(msg, *args):
+    """Helper method to log [DEBUG] messages. The arguments are only formatted
+    into the message if debug messages are logged, e.g. for API results"""
+    logging.debug(msg, *args)
+
+
 def log_error(msg):
     """Helper method to log [ERROR] messages"""
     logging.error(msg)
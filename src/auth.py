@@ -1,20 +1,27 @@
 """ auth.py file authenticating into the Asana API."""
 import os
-import asana
 from logger import log_info, log_error
+from rate_limiting import RateLimitedClient
+from dry_run import PLAN_TOKEN
 
 ASANA_TOKEN = os.getenv('ASANA_TOKEN')
 
-if not ASANA_TOKEN:
-    MSG = '''
-    Missing ASANA_TOKEN. Please add the token for the super admin or service account to the environment variables.
-    > Example: "export ASANA_TOKEN=1/1000000000000001:e123abc456def789ghi1011jklmn01"
-    '''
-    log_error(MSG)
-    raise ValueError(MSG)
+
+def check_token():
+    """Checks that the Asana token is set, which every run needs but planning offline.
+    It is checked once the command line is parsed rather than on import, so the plan mode
+    is known however its option is given."""
+    if not ASANA_TOKEN:
+        msg = '''
+        Missing ASANA_TOKEN. Please add the token for the super admin or service account to the environment variables.
+        > Example: "export ASANA_TOKEN=1/1000000000000001:e123abc456def789ghi1011jklmn01"
+        '''
+        log_error(msg)
+        raise ValueError(msg)
+
 
 # Authenticate and get the Asana client
-client = asana.Client.access_token(ASANA_TOKEN)
+# Every request is paced to the rate limit and retried on rate limits and transient errors
+# Without a token, no request is ever sent (see check_token)
+client = RateLimitedClient.access_token(ASANA_TOKEN or PLAN_TOKEN)
 log_info('Authenticated Asana client.')
-
-# TODO: Handle Asana request options for max_retries
@@ -0,0 +1,81 @@
+""" backfill.py file to backfill the historical status updates of the created goals."""
+from goal import Goal
+from ingest import iterate_goal_records
+from workers import run_bounded
+from rate_limiting import UnconfirmedWriteError
+from state import STEP_STATUS_UPDATE
+from metrics import metrics, ProgressReporter
+from logger import log_info, log_error
+
+
+def backfill_goal_status_updates(goal, created_count, state_store, is_unconfirmed=False):
+    """Creates the remaining status updates of a goal in timestamp order and
+    records the progress in the state store after each one.
+    A status update that may have been created without being confirmed isn't created again:
+    it is recorded to be checked in the next run, which skips it if it was created after all.
+    Returns the goal and whether all its status updates were created."""
+    if is_unconfirmed and has_created_status_update(goal, created_count):
+        created_count += 1
+        state_store.set_status_updates_created(goal.data.id, created_count)
+    try:
+        goal.create_historical_status_updates(
+            goal.gid, created_count,
+            on_created=lambda count: state_store.set_status_updates_created(goal.data.id, count))
+    except UnconfirmedWriteError as ex:
+        log_error(f'Unconfirmed status update of goal ID <{goal.data.id}>: {ex}')
+        state_store.mark_unconfirmed(goal.data.id, STEP_STATUS_UPDATE)
+        return goal, False
+    return goal, True
+
+
+def has_created_status_update(goal, created_count):
+    """Checks if the status update of a goal after the ones created so far was created
+    in Asana, based on its title."""
+    status_value, timestamp, _ = goal.get_status_updates()[created_count]
+    title = goal.get_status_update_title(status_value, timestamp)
+    is_created = title in goal.get_status_update_titles(goal.gid)
+    log_info(f'Found unconfirmed status update of goal ID <{goal.data.id}> created: {is_created}')
+    return is_created
+
+
+def iterate_goals_to_backfill(goals_file_path, goals_to_backfill):
+    """A generator yielding the (goal, number of status updates already created) pairs
+    of the queued goals that still have status updates left to create.
+    Only the rows of the queued goals are mapped."""
+    found_goal_ids = set()
+    for _, record in iterate_goal_records(goals_file_path, goal_ids=goals_to_backfill.keys()):
+        if record.id in found_goal_ids:
+            continue
+        found_goal_ids.add(record.id)
+        goal = Goal(record)
+        goal.gid, created_count = goals_to_backfill[record.id]
+        if created_count < len(goal.get_status_updates()):
+            yield goal, created_count
+
+
+def backfill_status_updates(executor, goals_file_path, state_store, max_pending, goal_ids=None):
+    """Backfills the historical status updates of every newly created goal queued in the
+    state store, or only of the given goal IDs, e.g. the goals of a shard. Goals are
+    backfilled concurrently on the executor's worker pool, while the status updates of
+    each goal are created in timestamp order. A goal whose status update is unconfirmed
+    stays queued for the next run.
+    """
+    goals_to_backfill = state_store.get_goals_to_backfill()
+    if goal_ids is not None:
+        goals_to_backfill = {
+            goal_id: progress for goal_id, progress in goals_to_backfill.items()
+            if goal_id in goal_ids
+        }
+    log_info(f'Backfilling status updates for up to <{len(goals_to_backfill)}> goal(s).')
+    unconfirmed_goal_ids = state_store.get_unconfirmed_goal_ids(STEP_STATUS_UPDATE)
+    goals = iterate_goals_to_backfill(goals_file_path, goals_to_backfill)
+    progress = ProgressReporter('goals', len(goals_to_backfill))
+    for goal, is_backfilled in run_bounded(
+            executor, lambda item: backfill_goal_status_updates(
+                *item, state_store, item[0].data.id in unconfirmed_goal_ids),
+            goals, max_pending):
+        if is_backfilled:
+            log_info(f'Backfilled status updates for goal ID: {goal.data.id}')
+            metrics.increment('goals_backfilled')
+        progress.update()
+    progress.report()
@@ -0,0 +1,176 @@
+""" batching.py file to group the small Asana API writes of the worker threads into batches."""
+import os
+import threading
+import asana
+import requests
+import parsers
+from auth import client as asana_client
+from rate_limiting import is_idempotent, UnconfirmedWriteError
+from metrics import metrics
+from logger import log_debug, log_info
+
+# Maximum number of writes sent together in a batch request, 1 to send every write on its own
+ASANA_BATCH_SIZE = int(os.getenv('ASANA_BATCH_SIZE', '10'))
+# Seconds a write waits for writes of other worker threads to share a batch request with
+ASANA_BATCH_LINGER = float(os.getenv('ASANA_BATCH_LINGER', '0.05'))
+# The Asana batch API takes up to 10 actions per request
+# API Reference: https://developers.asana.com/reference/createbatchrequest
+MAX_BATCH_SIZE = 10
+
+
+def get_retry_after(result):
+    """Gets the Retry-After seconds of a rate limited action result of a batch request."""
+    headers = {name.lower(): value for name, value in (result.get('headers') or {}).items()}
+    return float(headers['retry-after']) if headers.get('retry-after') else None
+
+
+class BatchAction():
+    """BatchAction class holding a write waiting to be sent in a batch request and its result.
+    A failed action is retried on its own by the thread that made it."""
+
+    def __init__(self, method, path, data) -> None:
+        self.method = method
+        self.path = path
+        self.data = data
+        self.result = None
+        # Until a result is handed to the action, it is retried on its own
+        self.failed = True
+        # The error of a batch request the action may have been applied by, see send_batch
+        self.error = None
+        self.done = threading.Event()
+
+    def get_action(self):
+        """Gets the action to send in a batch request."""
+        return {'method': self.method, 'relative_path': self.path, 'data': self.data}
+
+
+class BatchWriter():
+    """BatchWriter class packing the independent small writes of the worker threads,
+    e.g. goal metrics, owner and status changes, goal links and status updates,
+    into batch requests of up to batch_size actions. Every write blocks its thread
+    until its own result is back, so the writes of one goal keep their order.
+
+    A write waits up to ASANA_BATCH_LINGER seconds for writes of other threads, and is
+    sent right away once there are as many writes as the batch size or worker threads.
+    The thread that fills (or times out) a batch sends it, without any extra thread.
+    Actions that fail in the batch, or every action of a batch request that fails,
+    are retried on their own with the rate limited client, which retries them further.
+    The batch request itself isn't retried as a whole. When it fails in a way its actions
+    may have been applied (e.g. its response timed out), only the idempotent actions are
+    retried, and the others raise an UnconfirmedWriteError instead of being applied twice,
+    like an action that isn't idempotent and failed on the Asana side (5xx) in the batch.
+    """
+
+    def __init__(self, client, batch_size=ASANA_BATCH_SIZE, linger=ASANA_BATCH_LINGER) -> None:
+        self.client = client
+        self.batch_size = batch_size
+        self.linger = linger
+        # Number of worker threads that can make writes at the same time
+        self.workers = 1
+        self.pending = []
+        self._lock = threading.Lock()
+
+    def configure(self, workers, batch_size=None):
+        """Sets the number of worker threads, and optionally the batch size, to batch writes for."""
+        self.workers = workers
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+    def write(self, method, path, data):
+        """Makes a write (e.g. 'post' to '/status_updates') as part of a batch request,
+        if batching, and returns its result data. Raises an UnconfirmedWriteError for a
+        write that may have been applied without being confirmed, for the caller to record."""
+        batch_size = min(self.batch_size, self.workers, MAX_BATCH_SIZE)
+        if batch_size <= 1:
+            return self.write_one(method, path, data)
+
+        action = BatchAction(method, path, data)
+        with self._lock:
+            self.pending.append(action)
+            batch = self._take_batch() if len(self.pending) >= batch_size else None
+        if batch is None and not action.done.wait(self.linger):
+            with self._lock:
+                # Unless another thread took it in the meantime, send the writes so far
+                batch = self._take_batch() if action in self.pending else None
+        if batch and len(batch) == 1:
+            # There are no other writes to share a batch request with
+            return self.write_one(method, path, data)
+        if batch:
+            self.send_batch(batch)
+        action.done.wait()
+
+        if action.error is not None:
+            log_info(f'Batched {method.upper()} {path} may have been applied, not retrying it.')
+            raise UnconfirmedWriteError(
+                parsers.parse_api_endpoint(method, path), action.error) from action.error
+        if action.failed:
+            metrics.increment('batch_actions_retried')
+            return self.write_one(method, path, data)
+        return action.result
+
+    def write_one(self, method, path, data):
+        """Makes a write on its own."""
+        return getattr(self.client, method)(path, data)
+
+    def send_batch(self, batch):
+        """Sends the actions in a single batch request and hands every action its result.
+        Rate limited actions are retried once the Retry-After of the API has passed."""
+        try:
+            # Every action of a batch request counts against the rate limit
+            self.client.reserve(len(batch) - 1)
+            # The client doesn't retry the batch request, see handle_batch_error
+            results = self.client.batch_api.create_batch_request(
+                {'actions': [action.get_action() for action in batch]}, max_retries=0)
+            metrics.increment('batch_requests')
+            metrics.increment('batched_actions', len(batch))
+            retry_after = None
+            for action, result in zip(batch, results):
+                if 200 <= result['status_code'] < 300:
+                    action.result = (result.get('body') or {}).get('data')
+                    action.failed = False
+                    continue
+                if result['status_code'] == 429:
+                    retry_after = max(retry_after or 0.0, get_retry_after(result) or 0.0)
+                elif result['status_code'] >= 500 and not is_idempotent(
+                        parsers.parse_api_endpoint(action.method, action.path)):
+                    # The action may have been applied, like any request that failed with
+                    # a server error (see may_have_been_applied)
+                    action.error = asana.error.ServerError()
+                    continue
+                log_debug(
+                    'Batched %s %s failed with status <%s>, retrying it on its own.',
+                    action.method.upper(), action.path, result['status_code'])
+            if retry_after is not None:
+                self.client.wait_for_rate_limit(retry_after)
+        except (asana.error.AsanaError, requests.exceptions.RequestException,
+                UnconfirmedWriteError) as ex:
+            self.handle_batch_error(batch, ex)
+        finally:
+            # Every action without a result is retried, so no thread waits for it forever
+            for action in batch:
+                action.done.set()
+
+    def handle_batch_error(self, batch, error):
+        """Decides which actions of a failed batch request are retried on their own:
+        all of them if the batch request wasn't applied (e.g. it was rate limited, once its
+        Retry-After has passed), otherwise only the idempotent ones (see is_idempotent).
+        The client raises an UnconfirmedWriteError for a batch request that may have been
+        applied, like for any other request that isn't idempotent."""
+        if isinstance(error, asana.error.RateLimitEnforcedError):
+            self.client.wait_for_rate_limit(error.retry_after)
+        if not isinstance(error, UnconfirmedWriteError):
+            log_debug('Batch request failed with %s, retrying its actions on their own.', error)
+            return
+        log_debug('Batch request failed with %s, retrying its idempotent actions.', error)
+        for action in batch:
+            if not is_idempotent(parsers.parse_api_endpoint(action.method, action.path)):
+                action.error = error
+
+    def _take_batch(self):
+        batch = self.pending
+        self.pending = []
+        return batch
+
+
+# Shared batch writer to export and use throughout
+batch_writer = BatchWriter(asana_client)
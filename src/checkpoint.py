@@ -0,0 +1,22 @@
+""" checkpoint.py file to read the output CSVs of processed goals and status updates
+written by earlier versions of the migrator, see state.py."""
+import os
+import csv
+
+CHECKPOINT_HEADERS = ('goal_index', 'goal_id', 'asana_goal_gid', 'payload_hash')
+
+
+def read_checkpoint_rows(file_path, headers=CHECKPOINT_HEADERS):
+    """A generator yielding the rows of an output CSV, if it exists.
+    A partially written last row from a crashed run is ignored, and rows written
+    before columns were added are padded with empty values.
+    """
+    if not os.path.isfile(file_path):
+        return
+    with open(file_path, newline='', encoding='utf-8') as file:
+        # A row without a line ending was only partially written
+        reader = csv.reader(line for line in file if line.endswith('\n'))
+        next(reader, None)  # skip the header row
+        for row in reader:
+            if row and len(row) <= len(headers):
+                yield row + [''] * (len(headers) - len(row))
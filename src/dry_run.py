@@ -0,0 +1,180 @@
+""" dry_run.py file to plan a migration offline by recording the Asana API calls it would make."""
+import os
+import re
+import json
+import threading
+from collections import Counter
+import parsers
+from logger import log_info, log_error
+
+# The plan mode never sends requests to Asana, so the client can do without an Asana token
+PLAN_TOKEN = 'dry-run'
+API_PLAN_FILE_PATH = './api_plan.jsonl'
+# Snapshot file of every workspace dataset, e.g. users.json, served for its endpoint
+SNAPSHOT_ENDPOINTS = {
+    '/users': 'users',
+    '/time_periods': 'time_periods',
+    '/goals': 'goals',
+}
+# Number of most costly goals to report
+COSTLY_GOALS_COUNT = 10
+
+
+class DryRunResponse():
+    """DryRunResponse class standing in for a requests response of the Asana API."""
+
+    def __init__(self, status_code, body) -> None:
+        self.status_code = status_code
+        self.headers = {}
+        self.body = body
+
+    def json(self):
+        """Gets the response body."""
+        return self.body
+
+
+class DryRunSession():
+    """DryRunSession class standing in for the requests session of the Asana client.
+    Workspace users, time periods and goals are served page by page from snapshot files,
+    every other request gets a planned GID, and all requests are recorded in order
+    along with the goal ID they are made for.
+    """
+
+    def __init__(self, snapshot_dir) -> None:
+        self.snapshot_dir = snapshot_dir
+        self.operations = []
+        self.goal_ids = {}
+        self.batch_count = 0
+        self._planned_gids = 0
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        for name in SNAPSHOT_ENDPOINTS.values():
+            self._snapshots[name] = self.read_snapshot(name)
+        for goal in self._snapshots['goals']:
+            self.goal_ids[goal['gid']] = parsers.parse_reference_id(goal.get('notes'))
+
+    def read_snapshot(self, name):
+        """Reads a workspace dataset from its snapshot file. Both a list of items and
+        a workspace cache file holding the items in its data are supported."""
+        file_path = os.path.join(self.snapshot_dir, f'{name}.json')
+        if not os.path.isfile(file_path):
+            log_error(f'Missing snapshot {file_path}. Planning without any workspace {name}.')
+            return []
+        with open(file_path, encoding='utf-8') as file:
+            snapshot = json.load(file)
+        if isinstance(snapshot, dict):
+            snapshot = snapshot['data']
+        log_info(f'Loaded <{len(snapshot)}> workspace {name} from snapshot.')
+        return snapshot
+
+    def get(self, url, **options):
+        """Serves a page of a workspace dataset from its snapshot."""
+        path = get_path(url)
+        params = options.get('params') or {}
+        self.record('GET', path, params)
+        name = SNAPSHOT_ENDPOINTS.get(path)
+        items = self._snapshots[name] if name else []
+        start = int(params.get('offset') or 0)
+        end = start + int(params.get('limit') or len(items) or 1)
+        next_page = {'offset': str(end)} if end < len(items) else None
+        return DryRunResponse(200, {'data': items[start:end], 'next_page': next_page})
+
+    def post(self, url, **options):
+        """Plans a create (or any other POST) request."""
+        return self.plan_write('POST', url, options)
+
+    def put(self, url, **options):
+        """Plans an update request."""
+        return self.plan_write('PUT', url, options)
+
+    def delete(self, url, **options):
+        """Plans a delete request."""
+        return self.plan_write('DELETE', url, options)
+
+    def plan_write(self, method, url, options):
+        """Records a write request and responds with a planned GID,
+        or the goal's own GID if the goal is updated.
+        The actions of a batch request are recorded one by one, since every action
+        counts against the rate limit, and each gets its own result."""
+        path = get_path(url)
+        data = json.loads(options['data'])['data'] if options.get('data') else {}
+        if method == 'POST' and path == '/batch':
+            with self._lock:
+                self.batch_count += 1
+                batch = self.batch_count
+            results = []
+            for action in data['actions']:
+                gid = self.plan_action(
+                    action['method'].upper(), action['relative_path'],
+                    action.get('data') or {}, batch)
+                results.append({'status_code': 200, 'headers': {}, 'body': {'data': {'gid': gid}}})
+            return DryRunResponse(200, {'data': results})
+        return DryRunResponse(201, {'data': {'gid': self.plan_action(method, path, data)}})
+
+    def plan_action(self, method, path, data, batch=None):
+        """Records a write and gets its planned GID."""
+        gid = get_goal_gid(path) if method == 'PUT' else None
+        if not gid:
+            with self._lock:
+                self._planned_gids += 1
+                gid = f'planned_{self._planned_gids}'
+        # Goals created in the plan are mapped to their goal ID by their reference ID
+        if method == 'POST' and path == '/goals':
+            self.goal_ids[gid] = parsers.parse_reference_id(data.get('notes'))
+        self.record(method, path, data, batch)
+        return gid
+
+    def record(self, method, path, data, batch=None):
+        """Records a request along with the ID of the goal it is made for, if any,
+        and the number of the batch request it is part of, if any."""
+        goal_gid = get_goal_gid(path) or data.get('parent')
+        with self._lock:
+            operation = {
+                'seq': len(self.operations) + 1,
+                'method': method,
+                'path': path,
+                'endpoint': parsers.parse_api_endpoint(method, path),
+                'goal_id': self.goal_ids.get(goal_gid),
+                'data': data,
+            }
+            if batch:
+                operation['batch'] = batch
+            self.operations.append(operation)
+
+    def write_plan(self, file_path, rate_limit):
+        """Writes the ordered API operations to a JSONL file and logs their counts per
+        endpoint, the most costly goals and the estimated wall time at the rate limit
+        in requests per minute, if any."""
+        with open(file_path, 'w', encoding='utf-8') as file:
+            for operation in self.operations:
+                file.write(json.dumps(operation) + '\n')
+
+        endpoint_counts = Counter(operation['endpoint'] for operation in self.operations)
+        goal_counts = Counter(
+            operation['goal_id'] for operation in self.operations if operation['goal_id'])
+        log_info(f'Planned <{len(self.operations)}> Asana API request(s) in {file_path}.')
+        if self.batch_count:
+            batched_count = sum(1 for operation in self.operations if 'batch' in operation)
+            log_info(f'  <{batched_count}> of them in <{self.batch_count}> batch request(s).')
+        for endpoint, count in endpoint_counts.most_common():
+            log_info(f'  {endpoint}: <{count}>')
+        for goal_id, count in goal_counts.most_common(COSTLY_GOALS_COUNT):
+            log_info(f'  Goal ID <{goal_id}>: <{count}> request(s)')
+        # Without a rate limit, requests aren't paced, see RateLimitedClient
+        if not rate_limit:
+            return
+        estimated_seconds = len(self.operations) / rate_limit * 60
+        log_info(
+            f'Estimated wall time at <{rate_limit}> requests per minute: '
+            f'<{estimated_seconds:.0f}> second(s).'
+        )
+
+
+def get_path(url):
+    """Gets the API path of a request URL, e.g. /goals/123/setMetric."""
+    return re.sub(r'^.*/api/1\.0', '', url).split('?')[0]
+
+
+def get_goal_gid(path):
+    """Gets the GID of the goal a goal path is for, if any."""
+    return parsers.regex_parse(path, r'^/goals/([^/]+)')
@@ -1,65 +1,21 @@
 """goal.py file for class and operations on goal CSV data to Asana Goals API."""
-# pylint: disable=maybe-no-member
+# pylint: disable=maybe-no-member,too-many-public-methods
 import os
+from functools import partial
 import parsers
-import mappings
-from logger import log_info, log_error
-from users import get_all_users, MEMBERS_MAPPINGS
+from logger import log_info, log_debug, log_error
+from workspace import workspace
 from auth import client as asana_client
+from batching import batch_writer
+from rate_limiting import UnconfirmedWriteError
+from pagination import iterate_items
+from state import STEP_CREATED, STEP_METRIC, STEP_OWNER, STEP_SUBGOAL_METRIC
+from metrics import metrics
 
 
 WORKSPACE_GID = os.getenv('WORKSPACE_GID')
 SUPER_ADMIN_GID = os.getenv('SUPER_ADMIN_GID')
 ASANA_BASE_URL = asana_client.DEFAULT_OPTIONS['base_url']
-WORKSPACE_USERS = get_all_users()
-
-
-def get_all_time_periods(start_on='', end_on=''):
-    """Gets all time periods existing in the workspace
-    API Reference: https://developers.asana.com/reference/gettimeperiods
-    """
-    offset = None
-    params = {'workspace': WORKSPACE_GID}
-    if start_on:
-        params['start_on'] = start_on
-    if end_on:
-        params['end_on'] = end_on
-    data = []
-    while True:
-        result = asana_client.time_periods.get_time_periods(
-            params, offset=offset, full_payload=True, limit=100, iterator_type=None, opt_pretty=True)
-        data += result['data']
-        if 'next_page' in result and result['next_page'] is not None:
-            offset = result['next_page']['offset']
-        else:
-            break
-    return data
-
-
-def get_all_goals():
-    """Gets all the goals existing in the workspace
-    API Reference: https://developers.asana.com/reference/getgoals
-    """
-    offset = None
-    params = {
-        'workspace': WORKSPACE_GID,
-        'opt_fields': 'notes'
-    }
-    data = []
-    while True:
-        result = asana_client.goals.get_goals(
-            params, offset=offset, full_payload=True, limit=100, iterator_type=None, opt_pretty=True)
-        data += result['data']
-        if 'next_page' in result and result['next_page'] is not None:
-            offset = result['next_page']['offset']
-        else:
-            break
-    return data
-
-
-# Store the relevant workspace data once to not make multiple API calls
-TIME_PERIODS = get_all_time_periods()
-workspace_goals = get_all_goals()
 
 
 if not WORKSPACE_GID:
@@ -80,95 +36,141 @@ if not SUPER_ADMIN_GID:
 
 
 class Goal():
-    """Goal class to process CSV data into Asana goal data for API requests."""
-
-    def __init__(self, df_row) -> None:
-        self.df_row = df_row
-        self.data = self.map_data(df_row)
-        self.params = self.get_goal_params()
-        self.gid = None
-
-    def map_data(self, df_row):
-        """Takes in an input dataframe row (Series object) and maps the column values
-        for the specified row based on the fields specified in mappings.py.
-        """
-        data = {}
-        goal_mappings = mappings.GOAL_MAPPINGS
-        for key, value in goal_mappings.items():
-            # Special handling: If this is an array of columns to capture
-            if 'Array::' in value:
-                capture_string = parsers.regex_parse(
-                    value, 'Array::(.*)')
-                data[key] = list(df_row.values[list(df_row.index).index(
-                    capture_string):][::-1])  # reverse to sort
-            else:
-                data[key] = df_row[value]
-        return data
+    """Goal class to process CSV data into Asana goal data for API requests.
+    The small writes (goal metrics, owner and status changes, links and status updates)
+    are packed into batch requests with the writes of other goals, see batching.py."""
+
+    def __init__(self, record, state=None) -> None:
+        # The goal data (GoalRecord object) is mapped from the CSV columns in ingest.py
+        self.data = record
+        self.time_period_gid = None
+        # The parameters are only formatted once the goal is created or updated
+        self.params = None
+        # The migration state (GoalState object) of the goal, see state.py,
+        # so the steps completed in a previous run aren't repeated
+        self.state = state
+        self.gid = state.gid if state else None
+        # Whether the goal was newly created, as opposed to updated
+        self.is_new = state.is_new if state else False
+        # Goal fields to update in a single request once the goal and its metric exist
+        self.pending_changes = {}
+        # The workspace lookups resolved ahead of the API requests, see resolve
+        self.existing_goal = None
+        self.owner_gid = None
+
+    def resolve(self):
+        """Resolves everything from the workspace data that creating or updating the goal
+        needs ahead of its API requests: whether the goal already exists, its parameters
+        (including its time period) and the GID of its owner. This keeps the lookups out
+        of the worker threads making the requests, see create_or_update_goal."""
+        if not self.has_completed(STEP_CREATED):
+            self.existing_goal = self.check_if_goal_exists()
+            self.params = self.get_goal_params(self.existing_goal['exists'])
+        if not self.has_completed(STEP_OWNER) and self.data['owner']:
+            self.owner_gid = self.find_mapped_owner_gid(self.data['owner'])
+        return self
 
     def create_or_update_goal(self):
         """Creates or updates a goal in Asana using the Asana API.
-        Uses the mapped data in self.data to publish data into the Asana goal.
+        Uses the mapped data in self.data to publish data into the Asana goal,
+        and the workspace lookups resolved ahead of it, if any.
         """
         # If the goal doesn't yet exist, create it
         # else update it
-        goal = self.check_if_goal_exists()
-        created_goal_gid = None
-        if not goal['exists']:
-            created_goal_gid = self.create_goal()
-            workspace_goals.append({
-                "gid": created_goal_gid,
-                "notes": self.params['notes'],
-            })
-        else:
-            created_goal_gid = self.update_goal(goal['gid'])
-        self.gid = created_goal_gid
-
-        # We need to call this after the goal is created or updated
-        # in order to grant goal edit/delete permissions to both
-        # the super admin and the actual goal owner
-        if self.data['owner']:
-            self.update_goal_owner()
+        if not self.has_completed(STEP_CREATED):
+            with metrics.phase('create'):
+                goal = self.existing_goal or self.check_if_goal_exists()
+                created_goal_gid = None
+                if not goal['exists']:
+                    created_goal_gid = self.create_goal()
+                    self.is_new = True
+                    workspace.add_goal(created_goal_gid, self.params['notes'])
+                else:
+                    created_goal_gid = self.update_goal(goal['gid'])
+                    # A goal found after its creation was unconfirmed was created by the
+                    # previous run, so its status updates still need to be backfilled
+                    self.is_new = self.is_new or self.is_unconfirmed(STEP_CREATED)
+                self.gid = created_goal_gid
+            if not self.gid:
+                # Every other step needs the goal, e.g. it is retried in the next run
+                return None
+            self.complete_step(STEP_CREATED)
 
         # Create/update the goal progress metric
-        if self.data['current_number_value']:
-            is_parent_goal = self.data['aligned_to'] is None
-            self.create_goal_metric(is_parent_goal)
-
-            if not goal['exists']:
+        if self.data['current_number_value'] and not self.has_completed(STEP_METRIC):
+            # A goal whose metric was switched to subgoal progress (see set_subgoal_metric)
+            # keeps it when it is updated again, e.g. in a sync
+            is_parent_goal = (
+                self.data['aligned_to'] is None or self.has_completed(STEP_SUBGOAL_METRIC))
+            with metrics.phase('metric'):
+                self.create_goal_metric(is_parent_goal)
+            self.complete_step(STEP_METRIC)
+
+        if not self.has_completed(STEP_OWNER):
+            if self.is_new and self.data['current_number_value']:
                 # If no historical status updates or last checkins but there is a status, set it
                 # Note, this requires a goal metric to have been created
                 status_updates = self.data['status_updates']
                 last_status_update = self.data['last_status_update']
-                is_invalid_list = all(item is None for item in status_updates)
-                if is_invalid_list and last_status_update is None and self.data['status']:
+                if not status_updates and last_status_update is None and self.data['status']:
                     self.set_status()
+
+            # We need to call this after the goal is created or updated
+            # in order to grant goal edit/delete permissions to both
+            # the super admin and the actual goal owner
+            if self.data['owner']:
+                self.update_goal_owner()
+
+            # Update the owner and status together in a single request
+            with metrics.phase('owner'):
+                self.flush_pending_changes()
+            self.complete_step(STEP_OWNER)
         return self.gid
 
+    def has_completed(self, step):
+        """Checks if a step of migrating the goal was already completed."""
+        return self.state is not None and step in self.state.steps
+
+    def complete_step(self, step):
+        """Records a completed step of migrating the goal in its migration state, if any.
+        Steps of a goal that failed to be created aren't recorded, so they are retried."""
+        if self.state is not None and self.gid:
+            self.state.complete(step, self.gid, self.is_new)
+
+    def is_unconfirmed(self, step):
+        """Checks if the write of a step of migrating the goal may have been applied
+        without being confirmed, e.g. in a previous run whose response timed out."""
+        return self.state is not None and self.state.unconfirmed_step == step
+
+    def mark_unconfirmed(self, step, error):
+        """Records a step of migrating the goal whose write may have been applied without
+        being confirmed in its migration state, if any, so the next run checks whether it
+        was applied instead of making it again."""
+        log_error(f'Unconfirmed {step} step of goal ID <{self.data["id"]}>: {error}')
+        if self.state is not None:
+            self.state.mark_unconfirmed(step)
+
     def check_if_goal_exists(self):
         """Checks if the Asana goal exists already in the workspace based on
         any reference ID previously published in the goal's description"""
-        does_exist = False
-        goal_gid = None
-        # Loop through all goal data and check against
-        # the id in the goal description (notes)
-        for item in workspace_goals:
-            goal_reference_id = self.get_reference_id(item['notes'])
-            if self.data['id'] == goal_reference_id:
-                does_exist = True
-                goal_gid = item['gid']
-                break
-        return {'exists': does_exist, 'gid': goal_gid}
+        goal_gid = workspace.goal_index.get(self.data['id'])
+        return {'exists': goal_gid is not None, 'gid': goal_gid}
 
     def create_goal(self):
         """Creates a goal in Asana using the Asana API.
         Uses the mapped data in self.data to publish data into the Asana goal.
         API Reference: https://developers.asana.com/reference/creategoal
         """
-        result = asana_client.goals.create_goal(self.params, opt_pretty=True)
-        log_info(f'Received create goal result as: {result}')
-        # Create and fill in the historical status updates
-        if result:
-            self.create_historical_status_updates(result['gid'])
+        self.params = self.params or self.get_goal_params()
+        try:
+            result = asana_client.goals.create_goal(self.params, opt_pretty=True)
+        except UnconfirmedWriteError as ex:
+            # The goal may have been created anyway, so the next run looks it up by its
+            # Ally reference ID in the goals fetched again before creating it again
+            self.mark_unconfirmed(STEP_CREATED, ex)
+            return None
+        log_debug('Received create goal result as: %s', result)
+        # Note the historical status updates are filled in separately, see backfill.py
         return result['gid'] if result else None
 
     def update_goal(self, goal_gid):
@@ -176,20 +178,19 @@ class Goal():
         Uses the mapped data in self.data to publish data into the Asana goal.
         API Reference: https://developers.asana.com/reference/updategoal
         """
-        self.params = self.get_goal_params(True)
+        self.params = self.params or self.get_goal_params(True)
         result = asana_client.goals.update_goal(
             goal_gid, self.params, opt_pretty=True)
-        log_info(f'Received update goal result as: {result}')
+        log_debug('Received update goal result as: %s', result)
         return result['gid'] if result else None
 
-    def link_child_goal(self, child_goal, parent_goal_has_parent=False):
+    def link_child_goal(self, child_goal_gid, parent_goal_has_parent=False):
         """Link a child goal to the parent goal in Asana using the Asana API.
         This method updates the parent goals existing goal metric to manual
         if it itself has it's own parent (since new subgoals can't be set to automatic progress)
         API Reference: https://developers.asana.com/reference/addsupportingrelationship
         """
         parent_goal_gid = self.gid
-        child_goal_gid = child_goal.gid
         log_info(
             f'Linking child goal <{child_goal_gid}> to parent goal <{parent_goal_gid}>'
         )
@@ -203,13 +204,43 @@ class Goal():
         # This is handled in the Asana API by creating a new metric which overwrites
         # the old one
         if parent_goal_has_parent:
-            self.create_goal_metric(True)
+            self.set_subgoal_metric()
 
-        result = asana_client.goal_relationships.add_supporting_relationship(
-            parent_goal_gid,
-            params
-        )
-        log_info(f'Received link goals result as: {result}')
+        with metrics.phase('link'):
+            result = batch_writer.write(
+                'post', f'/goals/{parent_goal_gid}/addSupportingRelationship', params)
+        log_debug('Received link goals result as: %s', result)
+
+    def get_parent_goal_gids(self):
+        """Gets the set of GIDs of the parent goals the goal supports in Asana, e.g. to check
+        whether an unconfirmed link to its parent goal was applied.
+        API Reference: https://developers.asana.com/reference/getparentgoalsforgoal
+        """
+        parent_goals = iterate_items(
+            partial(asana_client.goals.get_parent_goals_for_goal, self.gid), {})
+        return {parent_goal['gid'] for parent_goal in parent_goals}
+
+    def unlink_parent_goal(self, parent_goal_gid):
+        """Removes the goal from the goals supporting a parent goal in Asana using the
+        Asana API, e.g. once it is aligned to another parent goal.
+        API Reference: https://developers.asana.com/reference/removesupportingrelationship
+        """
+        log_info(f'Unlinking child goal <{self.gid}> from parent goal <{parent_goal_gid}>')
+        with metrics.phase('link'):
+            result = batch_writer.write(
+                'post', f'/goals/{parent_goal_gid}/removeSupportingRelationship',
+                {'supporting_resource': self.gid})
+        log_debug('Received unlink goals result as: %s', result)
+
+    def set_subgoal_metric(self):
+        """Switches the goal's metric to automatic progress from its subgoals, unless it
+        was already switched. A goal can only be switched once it has subgoals linked to it.
+        """
+        if self.has_completed(STEP_SUBGOAL_METRIC):
+            return
+        with metrics.phase('metric'):
+            self.create_goal_metric(True)
+        self.complete_step(STEP_SUBGOAL_METRIC)
 
     def get_goal_params(self, is_update=False):
         """Gets and formats the data object into parameters for various API calls."""
@@ -248,76 +279,67 @@ class Goal():
 
     def get_reference_id(self, input_string):
         """A helper method to get the reference ID from the CSV cell value"""
-        return parsers.regex_parse(input_string, r'Ref: Ally Id:\s(\d+)')
+        return parsers.parse_reference_id(input_string)
 
     def get_time_period(self):
         """Gets the corresponding time period from the possible time periods in the workspace
         based on either a start and end date for the time period or the fallback to the string
-        name of the time period.
+        name of the time period. The time period is only resolved once per goal.
         """
+        if self.time_period_gid is not None:
+            return self.time_period_gid or None
+
         # First attempt to get the time period based off the start and end dates
-        start_date = self.data['start_on']
-        end_date = self.data['due_on']
-        # Necessary because it gets used as a generator object
-        time_periods_initial = TIME_PERIODS
-        # Necessary because it gets used as a generator object
-        time_periods_retry = TIME_PERIODS
-        time_period = next((period for period in time_periods_initial
-                            if period['start_on'] == start_date
-                            and period['end_on'] == end_date), None)
+        time_period_index = workspace.time_period_index
+        time_period_gid = time_period_index.get_by_dates(self.data['start_on'], self.data['due_on'])
 
         # If we failed to get a time period from those dates, search and retrieve
-        # using the period string
-        if not time_period:
+        # using the period string converted to the QX FYXX format
+        if not time_period_gid:
             log_info('Couldnt find time period. Checking against period string.')
-            period = self.data['period']
-            year_text = parsers.regex_parse(period, r'.*\s(\d+)')
-            quarter_text = parsers.regex_parse(period, r'(Q\d)\s\d+')
-
-            # Convert the period data to QX FYXX format
-            display_value = ''
-            if year_text and 'Annual' in period:
-                # Get the last two characters of year string
-                display_value = f'FY{year_text[-2:]}'
-            elif quarter_text and year_text:
-                display_value = f'{quarter_text} FY{year_text[-2:]}'
-
-            time_period = next((item for item in time_periods_retry
-                                if item['display_name'] == display_value), None)
-        return time_period['gid'] if time_period else None
-
-    def create_historical_status_updates(self, goal_gid):
-        """Creates all the Asana status update objects on the goal (sorted by timestamp)
-        for every checkin cell value found in the CSV.
-        """
-        status_updates = self.data['status_updates']
-        for item in status_updates:
-            if item is not None:
-                self.create_historical_status_update(goal_gid, item)
+            display_value = parsers.parse_period_display_name(self.data['period'])
+            time_period_gid = time_period_index.get_by_display_name(display_value)
+
+        # Remember a missing time period as well, so it isn't searched for again
+        self.time_period_gid = time_period_gid or ''
+        return time_period_gid
 
-        # If the historical status updates were empty, check for an existing last checkin
-        is_invalid_list = all(item is None for item in status_updates)
+    def get_status_updates(self):
+        """Gets the (status, timestamp, notes) values of the status updates to create on
+        the goal (sorted by timestamp) for every checkin cell value found in the CSV.
+        If the historical status updates are empty, the last checkin is used instead.
+        """
+        status_updates = list(self.data['status_updates'])
         last_status_update = self.data['last_status_update']
-        if is_invalid_list and last_status_update is not None:
-            self.create_checkin_status_update(goal_gid)
-        return
-
-    def create_historical_status_update(self, goal_gid, status_update_data):
-        """Creates Asana status update objects on the goal."""
-        # Parse the status value and map to the correct status type
-        status_value = parsers.parse_checkin_status(status_update_data)
-        # Parse the timestamp for record keeping
-        timestamp = parsers.parse_checkin_timestamp(status_update_data)
-        # Parse the notes text for the update
-        notes = parsers.parse_checkin_notes(status_update_data)
-        return self.create_status_update(goal_gid, status_value, timestamp, notes)
-
-    def create_checkin_status_update(self, goal_gid):
-        """Creates a status update for the specified goal based on its self.data."""
-        status_value = self.data['status']
-        timestamp = self.data['last_status_timestamp']
-        notes = self.data['last_status_update']
-        return self.create_status_update(goal_gid, status_value, timestamp, notes)
+        if not status_updates and last_status_update is not None:
+            status_updates.append(
+                (self.data['status'], self.data['last_status_timestamp'], last_status_update))
+        return status_updates
+
+    def get_status_update_titles(self, goal_gid):
+        """Gets the set of titles of the status updates on the goal in Asana, e.g. to check
+        whether an unconfirmed status update was created.
+        API Reference: https://developers.asana.com/reference/getstatusesforobject
+        """
+        status_updates = iterate_items(
+            asana_client.status_updates.get_statuses_for_object,
+            {'parent': goal_gid, 'opt_fields': 'title'})
+        return {status_update['title'] for status_update in status_updates}
+
+    def get_status_update_title(self, status_value, timestamp):
+        """A helper method to get the title of the status update of a checkin."""
+        return f'Status Update: {status_value} - {timestamp}'
+
+    def create_historical_status_updates(self, goal_gid, start=0, on_created=None):
+        """Creates the Asana status update objects on the goal (sorted by timestamp) one after
+        another, skipping the first start status updates that were already created.
+        The optional on_created callback gets the number of status updates created so far.
+        """
+        status_updates = self.get_status_updates()
+        for count, (status_value, timestamp, notes) in enumerate(status_updates[start:], start + 1):
+            self.create_status_update(goal_gid, status_value, timestamp, notes)
+            if on_created:
+                on_created(count)
 
     def create_status_update(self, goal_gid, status_value, timestamp, notes):
         """Creates a status update in Asana using the Asana API.
@@ -333,9 +355,9 @@ class Goal():
         elif status_value == 'Closed':
             status_type = 'achieved'
         else:
-            return  # if there isn't a status update, return
+            return None  # if there isn't a status update, return
 
-        title = f'Status Update: {status_value} - {timestamp}'
+        title = self.get_status_update_title(status_value, timestamp)
         notes_text = f'[Ref: Ally Checkin Timestamp: {timestamp}]\n\n'
         notes_text += str(notes)
         params = {
@@ -344,13 +366,12 @@ class Goal():
             'text': notes_text,
             'title': title,
         }
-        result = asana_client.status_updates.create_status_for_object(
-            params, opt_pretty=True)
+        result = batch_writer.write('post', '/status_updates', params)
         return result['gid'] if result else None
 
     def set_status(self):
-        """Helper method to update the goal's status using the Asana API.
-        API Reference: https://developers.asana.com/reference/updategoal
+        """Helper method to stage the goal's status to be updated with the
+        next flush of the pending changes.
         """
         status_value = self.data['status']
         status_type = ''
@@ -364,43 +385,36 @@ class Goal():
             status_type = 'achieved'
         else:
             return  # if there isn't a status update, return
-        params = {'status': status_type}
-        result = asana_client.goals.update_goal(
-            self.gid, params, opt_pretty=True)
-        return result['gid'] if result else None
+        self.pending_changes['status'] = status_type
 
     def update_goal_owner(self):
-        """Helper method to update the goal's owner using the Asana API.
-        API Reference: https://developers.asana.com/reference/updategoal
+        """Helper method to stage the goal's owner to be updated with the
+        next flush of the pending changes.
         """
         owner = self.data['owner']
-        owner_gid = self.find_mapped_owner_gid(owner)
+        owner_gid = self.owner_gid or self.find_mapped_owner_gid(owner)
         if not owner_gid:
             return
-        params = {'owner': owner_gid}
-        result = asana_client.goals.update_goal(
-            self.gid, params, opt_pretty=True)
+        self.pending_changes['owner'] = owner_gid
+
+    def flush_pending_changes(self):
+        """Updates all the pending goal field changes with a single request using the Asana API.
+        The goal is created with the super admin as owner (see get_goal_params), so the owner
+        change is sent last along with any status, after the goal metric exists.
+        API Reference: https://developers.asana.com/reference/updategoal
+        """
+        if not self.pending_changes or not self.gid:
+            return None
+        params = self.pending_changes
+        self.pending_changes = {}
+        result = batch_writer.write('put', f'/goals/{self.gid}', params)
         return result['gid'] if result else None
 
     def find_mapped_owner_gid(self, owner):
         """Searches for and return the goal owner's GID based on first and last name,
         the email, and the member mappings in the members.csv"""
-        # TODO: Implement performance improvement of pre-mapping these during initial script run
-        # First check if the owner is in the user mappings
-        valid_email = next(
-            (email for email, name in MEMBERS_MAPPINGS.items() if owner == name), None)
-        if valid_email:
-            # Then use the associated email and check if a user in the workspace
-            found_user = next(
-                (user for user in WORKSPACE_USERS if user['email'] == valid_email), None)
-            if found_user:
-                return found_user['gid']
-        # Since we didn't find the goal owner in the mappings, set the owner to the user admin
-        log_error(
-            f'Could not find owner <{owner}> in members.csv for goal {self.data}. \
-            Setting default owner to super admin.'
-        )
-        return
+        # If we don't find the goal owner in the mappings, the owner stays the super admin
+        return workspace.owner_resolver.resolve(owner)
 
     def create_goal_metric(self, is_parent_goal=False):
         """Creates a goal metric in Asana using the Asana API.
@@ -424,10 +438,9 @@ class Goal():
                 self.data['current_number_value']) / 100
             target_number_value = float(self.data['target_number_value']) / 100
             params['initial_number_value'] = initial_number_value
-            params['current_number_value'] = current_progress_value,
+            params['current_number_value'] = current_progress_value
             params['target_number_value'] = target_number_value
 
-        result = asana_client.goals.create_goal_metric(
-            self.gid, params, opt_pretty=True)
-        log_info(f'Received create goal metric result as: {result}')
+        result = batch_writer.write('post', f'/goals/{self.gid}/setMetric', params)
+        log_debug('Received create goal metric result as: %s', result)
         return result['gid'] if result else None
@@ -0,0 +1,63 @@
+""" goal_record.py file for the compact, immutable record of a goal's mapped CSV data."""
+import json
+import hashlib
+import threading
+import weakref
+import mappings
+
+
+class GoalRecord():
+    """GoalRecord class holding only the goal data mapped from the CSV columns
+    (see GOAL_MAPPINGS in mappings.py) in slots instead of a dict or pandas Series.
+    Records can't be changed once created and are interned by their Ally ID,
+    so every goal's record only exists once while it is in use, e.g. a parent goal
+    kept for linking its child goals in the next alignment level.
+    """
+    __slots__ = tuple(mappings.GOAL_MAPPINGS) + ('__weakref__',)
+
+    _interned = weakref.WeakValueDictionary()
+    _intern_lock = threading.Lock()
+
+    def __init__(self, data) -> None:
+        for key in mappings.GOAL_MAPPINGS:
+            value = data.get(key)
+            # Store the list of checkins as an immutable tuple
+            if isinstance(value, list):
+                value = tuple(value)
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'GoalRecord is immutable, cannot set <{name}>')
+
+    def __getitem__(self, key):
+        """Gets a mapped value by its key, e.g. record['id'], like the goal data dict."""
+        if key not in mappings.GOAL_MAPPINGS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in mappings.GOAL_MAPPINGS
+
+    def __repr__(self):
+        # The slots are named after the mapped keys, so they are looked up by name
+        return f"GoalRecord(id={getattr(self, 'id')!r}, name={getattr(self, 'name')!r})"
+
+    def get_payload_hash(self):
+        """Gets a stable hash of all the mapped goal data, including its check-ins,
+        to find goals that changed since they were last migrated."""
+        payload = {key: getattr(self, key) for key in mappings.GOAL_MAPPINGS}
+        content = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def intern(cls, data):
+        """Gets the record for the goal data's Ally ID if one is already in use,
+        otherwise creates it. A later row with a duplicate Ally ID may get the record
+        of the first row, which is the only one migrated (see AlignmentPlan.is_planned_goal).
+        """
+        with cls._intern_lock:
+            record = cls._interned.get(data['id'])
+            if record is None:
+                record = cls(data)
+                cls._interned[data['id']] = record
+            return record
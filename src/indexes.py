@@ -0,0 +1,112 @@
+""" indexes.py file for lookup indexes built once over the Asana workspace data."""
+import threading
+import parsers
+from logger import log_error
+
+
+class WorkspaceGoalIndex():
+    """WorkspaceGoalIndex class mapping the Ally reference IDs found in the
+    workspace goals' descriptions (notes) to their Asana goal GIDs.
+    The notes are parsed once when a goal is added, so lookups are constant-time.
+    """
+
+    def __init__(self, goals=None) -> None:
+        self._gids = {}
+        self._lock = threading.Lock()
+        for goal in goals or []:
+            self.add(goal['gid'], goal['notes'])
+
+    def __len__(self):
+        return len(self._gids)
+
+    def add(self, goal_gid, notes):
+        """Adds a workspace goal to the index based on the reference ID in its notes.
+        The first goal found for a reference ID is kept."""
+        reference_id = parsers.parse_reference_id(notes)
+        if not reference_id or not goal_gid:
+            return
+        with self._lock:
+            self._gids.setdefault(reference_id, goal_gid)
+
+    def get(self, reference_id):
+        """Gets the Asana goal GID for the given Ally reference ID, if any."""
+        return self._gids.get(reference_id)
+
+
+class OwnerResolver():
+    """OwnerResolver class mapping goal owner names (or emails) to workspace user GIDs.
+    The member mappings and workspace users are indexed once, names shared by several
+    members are reported, and owners that can't be found are only reported once.
+    """
+
+    def __init__(self, members_mappings, users) -> None:
+        self._emails_by_name = {}
+        ambiguous_names = set()
+        for email, name in members_mappings.items():
+            if not isinstance(name, str) or not isinstance(email, str):
+                continue  # skip blank cells in members.csv
+            if name in self._emails_by_name:
+                ambiguous_names.add(name)
+                continue  # keep the first member found with the name
+            self._emails_by_name[name] = email.lower()
+        for name in sorted(ambiguous_names):
+            log_error(
+                f'Found multiple members named <{name}> in members.csv. '
+                f'Using <{self._emails_by_name[name]}> as their email.'
+            )
+
+        self._gids_by_email = {}
+        for user in users:
+            if user.get('email'):
+                self._gids_by_email.setdefault(user['email'].lower(), user['gid'])
+        self._missing_owners = set()
+        self._lock = threading.Lock()
+
+    def resolve(self, owner):
+        """Gets the workspace user GID for the owner's name as found in members.csv
+        or for the owner's email, if any."""
+        email = self._emails_by_name.get(owner)
+        if not email and isinstance(owner, str) and '@' in owner:
+            email = owner.strip().lower()
+        owner_gid = self._gids_by_email.get(email) if email else None
+        if owner_gid:
+            return owner_gid
+
+        with self._lock:
+            is_reported = owner in self._missing_owners
+            self._missing_owners.add(owner)
+        if not is_reported:
+            log_error(
+                f'Could not find owner <{owner}> in members.csv or the workspace users. '
+                'Setting default owner to super admin for their goals.'
+            )
+        return None
+
+
+class TimePeriodIndex():
+    """TimePeriodIndex class mapping the workspace time periods to their GIDs
+    by their start and end dates and by their (normalized) display names.
+    """
+
+    def __init__(self, time_periods) -> None:
+        self._gids_by_dates = {}
+        self._gids_by_display_name = {}
+        for time_period in time_periods:
+            dates = (time_period['start_on'], time_period['end_on'])
+            self._gids_by_dates.setdefault(dates, time_period['gid'])
+            display_name = self.normalize_display_name(time_period['display_name'])
+            self._gids_by_display_name.setdefault(display_name, time_period['gid'])
+
+    @staticmethod
+    def normalize_display_name(display_name):
+        """Normalizes the case and whitespace of a time period display name."""
+        return ' '.join(str(display_name or '').split()).casefold()
+
+    def get_by_dates(self, start_on, end_on):
+        """Gets the GID of the time period with the exact start and end dates, if any."""
+        return self._gids_by_dates.get((start_on, end_on))
+
+    def get_by_display_name(self, display_name):
+        """Gets the GID of the time period with the display name, if any."""
+        display_name = self.normalize_display_name(display_name)
+        return self._gids_by_display_name.get(display_name) if display_name else None
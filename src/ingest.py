@@ -0,0 +1,94 @@
+""" ingest.py file to stream the goals CSV without reading it into memory all at once
+and map its rows into goal data one chunk at a time."""
+from collections import namedtuple
+import pandas as pd
+import parsers
+import mappings
+from goal_record import GoalRecord
+
+# Number of CSV rows to read into memory at a time
+GOALS_CHUNK_SIZE = 1000
+
+# The columns of a goal the alignment plan needs, read without mapping the rest of the row
+GoalAlignment = namedtuple('GoalAlignment', ['id', 'aligned_to'])
+
+
+def iterate_goal_chunks(file_path, chunk_size=GOALS_CHUNK_SIZE, goal_ids=None):
+    """A generator yielding the goals CSV in chunks (DataFrame objects) so memory stays
+    flat regardless of its size. Blank values are converted to None, and duplicate rows
+    are skipped based on a set of hashes of every row read so far.
+    The chunks are indexed by row number, where the column row is index 0.
+    Given a set of goal IDs, only their rows are kept, so no other row is ever mapped.
+    """
+    # TODO: For now hard-code column names to handle blank column names that hold
+    # additional check-in notes in rows
+    column_names = mappings.CSV_COLUMN_NAMES
+    row_hashes = set()
+    chunks = pd.read_csv(
+        file_path, names=column_names, header=None, skiprows=1, dtype=str, chunksize=chunk_size)
+    for chunk in chunks:
+        chunk.index += 1
+        hashes = pd.util.hash_pandas_object(chunk, index=False)
+        is_new = ~hashes.duplicated() & ~hashes.isin(row_hashes)
+        row_hashes.update(hashes[is_new])
+        chunk = chunk[is_new]
+        if goal_ids is not None:
+            chunk = chunk[chunk[mappings.GOAL_MAPPINGS['id']].isin(goal_ids)]
+            if chunk.empty:
+                continue
+        # Convert and handle NaN values to None
+        yield chunk.astype(object).where(chunk.notna(), None)
+
+
+def map_goal_chunk(chunk):
+    """Maps the columns of a chunk of goal rows into goal data based on the fields
+    specified in mappings.py, returning a list of (row index, GoalRecord object) pairs.
+    Check-in cells are parsed in a single scan each by the check-in tokenizer into
+    (status, timestamp, notes) tuples.
+    """
+    columns = list(chunk.columns)
+    column_mappings = {}
+    array_mappings = {}
+    for key, value in mappings.GOAL_MAPPINGS.items():
+        # Special handling: If this is an array of columns to capture
+        if 'Array::' in value:
+            capture_string = parsers.regex_parse(value, 'Array::(.*)')
+            # Reverse to sort by timestamp
+            array_mappings[key] = columns[columns.index(capture_string):][::-1]
+        else:
+            column_mappings[value] = key
+
+    records = chunk[list(column_mappings)].rename(columns=column_mappings).to_dict(orient='records')
+    for key, array_columns in array_mappings.items():
+        checkins = {index: [] for index in chunk.index}
+        for column in array_columns:
+            cells = chunk[column].dropna()
+            if cells.empty:
+                continue
+            # Only the (status, timestamp, notes) are kept, the metric name isn't migrated
+            for index, checkin in zip(cells.index, cells.map(parsers.tokenize_checkin)):
+                checkins[index].append(checkin[:3])
+        for record, index in zip(records, chunk.index):
+            record[key] = checkins[index]
+    return [
+        (index, GoalRecord.intern(record)) for index, record in zip(chunk.index.tolist(), records)
+    ]
+
+
+def iterate_goal_records(file_path, chunk_size=GOALS_CHUNK_SIZE, goal_ids=None):
+    """A generator yielding the row index and the mapped goal record of every goal
+    in the goals CSV, or only of the given goal IDs, one chunk at a time."""
+    for chunk in iterate_goal_chunks(file_path, chunk_size, goal_ids):
+        yield from map_goal_chunk(chunk)
+
+
+def iterate_goal_alignments(file_path, chunk_size=GOALS_CHUNK_SIZE):
+    """A generator yielding the row index and the GoalAlignment of every goal in the
+    goals CSV, e.g. to build the alignment plan without mapping every row and tokenizing
+    its check-ins."""
+    id_column = mappings.GOAL_MAPPINGS['id']
+    aligned_to_column = mappings.GOAL_MAPPINGS['aligned_to']
+    for chunk in iterate_goal_chunks(file_path, chunk_size):
+        alignments = zip(chunk[id_column], chunk[aligned_to_column])
+        for index, (goal_id, aligned_to) in zip(chunk.index.tolist(), alignments):
+            yield index, GoalAlignment(goal_id, aligned_to)
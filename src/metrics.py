@@ -0,0 +1,313 @@
+""" metrics.py file to instrument the migration with API call, phase and progress metrics."""
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from logger import log_info
+
+METRICS_JSON_FILE_PATH = './metrics.json'
+METRICS_PROMETHEUS_FILE_PATH = './metrics.prom'
+METRICS_PREFIX = 'goals_migrator'
+# Upper bounds in seconds of the API call latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Number of seconds between progress lines
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', '10'))
+
+
+class LatencyHistogram():
+    """LatencyHistogram class counting the latencies of API calls in cumulative buckets."""
+
+    def __init__(self) -> None:
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        """Adds a latency to the histogram."""
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        if index < len(self.bucket_counts):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def get_cumulative_counts(self):
+        """Gets the (upper bound, count) pairs of every bucket, including +Inf."""
+        counts = []
+        total = 0
+        for upper_bound, count in zip(LATENCY_BUCKETS, self.bucket_counts):
+            total += count
+            counts.append((str(upper_bound), total))
+        counts.append(('+Inf', self.count))
+        return counts
+
+
+class Metrics():
+    """Metrics class recording the Asana API calls (count, latency histogram, retries
+    and rate limits per endpoint) and the time spent in every phase of the migration.
+    Phases that run once per goal (e.g. create or metric) add up the time of every goal
+    across all worker threads, while the other phases (e.g. bootstrap) are wall time.
+    The stages of the migration pipeline record their throughput and the time they spent
+    busy, waiting for the previous stage and blocked by the next stage.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self.endpoints = {}
+        self.phases = {}
+        self.counters = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def _get_endpoint(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {
+                'requests': 0, 'retries': 0, 'rate_limited': 0, 'latency': LatencyHistogram()}
+        return self.endpoints[endpoint]
+
+    def record_call(self, endpoint, seconds):
+        """Records an API call to an endpoint and its latency, including any retries."""
+        with self._lock:
+            endpoint_metrics = self._get_endpoint(endpoint)
+            endpoint_metrics['requests'] += 1
+            endpoint_metrics['latency'].observe(seconds)
+
+    def record_retry(self, endpoint, is_rate_limited=False):
+        """Records a retried API call to an endpoint."""
+        with self._lock:
+            endpoint_metrics = self._get_endpoint(endpoint)
+            endpoint_metrics['retries'] += 1
+            if is_rate_limited:
+                endpoint_metrics['rate_limited'] += 1
+
+    def record_stage(self, name, items, busy_seconds, waiting_seconds=0.0, blocked_seconds=0.0,
+                     workers=1):
+        """Records the items handled by a pipeline stage and the time it spent busy, waiting
+        for items and blocked by the next stage. The busy time of a stage run by several
+        worker threads adds up the time of every worker."""
+        with self._lock:
+            stage = self.stages.setdefault(name, {
+                'items': 0, 'busy_seconds': 0.0, 'waiting_seconds': 0.0, 'blocked_seconds': 0.0,
+                'workers': workers,
+            })
+            stage['items'] += items
+            stage['busy_seconds'] += busy_seconds
+            stage['waiting_seconds'] += waiting_seconds
+            stage['blocked_seconds'] += blocked_seconds
+
+    def log_stages(self):
+        """Logs the throughput of every pipeline stage and the slowest stage, which the
+        other stages wait for."""
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+        for name, stage in stages.items():
+            busy_seconds = stage['busy_seconds'] / stage['workers']
+            rate = stage['items'] / busy_seconds if busy_seconds > 0 else 0.0
+            log_info(
+                f'Stage <{name}>: <{stage["items"]}> item(s), <{rate:.1f}> item(s)/s while busy '
+                f'for <{busy_seconds:.1f}> seconds, waited <{stage["waiting_seconds"]:.1f}> '
+                f'seconds for items and was blocked for <{stage["blocked_seconds"]:.1f}> seconds.'
+            )
+        if stages:
+            slowest = max(
+                stages, key=lambda name: stages[name]['busy_seconds'] / stages[name]['workers'])
+            log_info(f'The slowest stage of the pipeline is <{slowest}>.')
+
+    def increment(self, name, value=1):
+        """Increments a counter, e.g. the number of processed goals."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager adding the time spent in it to a phase of the migration."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started_at
+            with self._lock:
+                phase_metrics = self.phases.setdefault(name, {'seconds': 0.0, 'count': 0})
+                phase_metrics['seconds'] += seconds
+                phase_metrics['count'] += 1
+
+    def get_summary(self):
+        """Gets a JSON serializable summary of all the metrics."""
+        with self._lock:
+            return {
+                'duration_seconds': round(time.time() - self.started_at, 3),
+                'counters': dict(self.counters),
+                'phases': {
+                    name: {'seconds': round(phase['seconds'], 3), 'count': phase['count']}
+                    for name, phase in self.phases.items()
+                },
+                'stages': {
+                    name: {
+                        key: round(value, 3) if isinstance(value, float) else value
+                        for key, value in stage.items()
+                    }
+                    for name, stage in self.stages.items()
+                },
+                'endpoints': {
+                    endpoint: {
+                        'requests': endpoint_metrics['requests'],
+                        'retries': endpoint_metrics['retries'],
+                        'rate_limited': endpoint_metrics['rate_limited'],
+                        'latency_seconds_sum': round(endpoint_metrics['latency'].sum, 3),
+                        'latency_buckets': dict(
+                            endpoint_metrics['latency'].get_cumulative_counts()),
+                    }
+                    for endpoint, endpoint_metrics in self.endpoints.items()
+                },
+            }
+
+    def get_prometheus_text(self, summary=None):
+        """Gets all the metrics (or a summary of them) in the Prometheus text exposition format."""
+        summary = summary or self.get_summary()
+        lines = []
+
+        def add_metric(name, metric_type, help_text, samples):
+            lines.append(f'# HELP {METRICS_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRICS_PREFIX}_{name} {metric_type}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                label_text = f'{{{label_text}}}' if label_text else ''
+                lines.append(f'{METRICS_PREFIX}_{name}{suffix}{label_text} {value}')
+
+        endpoints = summary['endpoints']
+        add_metric('api_requests_total', 'counter', 'Asana API requests per endpoint.', [
+            ('', {'endpoint': endpoint}, endpoint_metrics['requests'])
+            for endpoint, endpoint_metrics in endpoints.items()
+        ])
+        add_metric('api_retries_total', 'counter', 'Retried Asana API requests per endpoint.', [
+            ('', {'endpoint': endpoint}, endpoint_metrics['retries'])
+            for endpoint, endpoint_metrics in endpoints.items()
+        ])
+        add_metric('api_rate_limited_total', 'counter',
+                   'Rate limited Asana API requests per endpoint.', [
+                       ('', {'endpoint': endpoint}, endpoint_metrics['rate_limited'])
+                       for endpoint, endpoint_metrics in endpoints.items()
+                   ])
+        latency_samples = []
+        for endpoint, endpoint_metrics in endpoints.items():
+            for upper_bound, count in endpoint_metrics['latency_buckets'].items():
+                latency_samples.append(
+                    ('_bucket', {'endpoint': endpoint, 'le': upper_bound}, count))
+            latency_samples.append(
+                ('_sum', {'endpoint': endpoint}, endpoint_metrics['latency_seconds_sum']))
+            latency_samples.append(('_count', {'endpoint': endpoint}, endpoint_metrics['requests']))
+        add_metric('api_request_duration_seconds', 'histogram',
+                   'Latency of the Asana API requests per endpoint, including retries.',
+                   latency_samples)
+        stages = summary.get('stages', {})
+        add_metric('stage_items_total', 'counter', 'Items handled by every pipeline stage.', [
+            ('', {'stage': name}, stage['items']) for name, stage in stages.items()
+        ])
+        add_metric('stage_seconds_total', 'counter',
+                   'Seconds every pipeline stage spent busy, waiting for items or blocked.', [
+                       ('', {'stage': name, 'state': state}, stage[f'{state}_seconds'])
+                       for name, stage in stages.items() for state in ('busy', 'waiting', 'blocked')
+                   ])
+        add_metric('phase_seconds_total', 'counter',
+                   'Seconds spent in every phase of the migration.', [
+                       ('', {'phase': name}, phase['seconds'])
+                       for name, phase in summary['phases'].items()
+                   ])
+        for name, value in summary['counters'].items():
+            add_metric(f'{name}_total', 'counter', f'Number of {name.replace("_", " ")}.', [
+                ('', {}, value)
+            ])
+        add_metric('duration_seconds', 'gauge', 'Seconds since the migration started.', [
+            ('', {}, summary['duration_seconds'])
+        ])
+        return '\n'.join(lines) + '\n'
+
+    def export(self, json_file_path=METRICS_JSON_FILE_PATH,
+               prometheus_file_path=METRICS_PROMETHEUS_FILE_PATH, summary=None):
+        """Writes the metrics summary (or a given summary, e.g. merged from several shards)
+        as JSON and, unless its file path is None, in the Prometheus text format."""
+        summary = summary or self.get_summary()
+        with open(json_file_path, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=2)
+        if prometheus_file_path:
+            with open(prometheus_file_path, 'w', encoding='utf-8') as file:
+                file.write(self.get_prometheus_text(summary))
+        log_info(f'Exported the migration metrics to {json_file_path}.')
+
+
+def merge_summaries(summaries):
+    """Merges the metrics summaries of several processes, e.g. the shards of a migration,
+    into one: counters, phase times and API calls add up, while the duration is the longest."""
+    merged = {'duration_seconds': 0.0, 'counters': {}, 'phases': {}, 'stages': {}, 'endpoints': {}}
+    for summary in summaries:
+        merged['duration_seconds'] = max(merged['duration_seconds'], summary['duration_seconds'])
+        for name, value in summary['counters'].items():
+            merged['counters'][name] = merged['counters'].get(name, 0) + value
+        for name, phase in summary['phases'].items():
+            merged_phase = merged['phases'].setdefault(name, {'seconds': 0.0, 'count': 0})
+            merged_phase['seconds'] = round(merged_phase['seconds'] + phase['seconds'], 3)
+            merged_phase['count'] += phase['count']
+        for name, stage in summary.get('stages', {}).items():
+            merged_stage = merged['stages'].setdefault(name, {
+                'items': 0, 'busy_seconds': 0.0, 'waiting_seconds': 0.0, 'blocked_seconds': 0.0,
+                'workers': 0,
+            })
+            merged_stage['items'] += stage['items']
+            for key in ('busy_seconds', 'waiting_seconds', 'blocked_seconds'):
+                merged_stage[key] = round(merged_stage[key] + stage[key], 3)
+            merged_stage['workers'] += stage['workers']
+        for endpoint, endpoint_metrics in summary['endpoints'].items():
+            merged_metrics = merged['endpoints'].setdefault(endpoint, {
+                'requests': 0, 'retries': 0, 'rate_limited': 0, 'latency_seconds_sum': 0.0,
+                'latency_buckets': {},
+            })
+            for name in ('requests', 'retries', 'rate_limited'):
+                merged_metrics[name] += endpoint_metrics[name]
+            merged_metrics['latency_seconds_sum'] = round(
+                merged_metrics['latency_seconds_sum'] + endpoint_metrics['latency_seconds_sum'], 3)
+            for upper_bound, count in endpoint_metrics['latency_buckets'].items():
+                buckets = merged_metrics['latency_buckets']
+                buckets[upper_bound] = buckets.get(upper_bound, 0) + count
+    return merged
+
+
+class ProgressReporter():
+    """ProgressReporter class logging a progress line with the number of items done,
+    the items per second and the estimated time left every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, name, total, interval=PROGRESS_INTERVAL) -> None:
+        self.name = name
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.started_at = time.monotonic()
+        self.reported_at = self.started_at
+        self._lock = threading.Lock()
+
+    def update(self, count=1):
+        """Adds to the number of items done and logs a progress line when it is due."""
+        with self._lock:
+            self.done += count
+            now = time.monotonic()
+            if now - self.reported_at < self.interval:
+                return
+            self.reported_at = now
+            done = self.done
+        self.report(done, now)
+
+    def report(self, done=None, now=None):
+        """Logs a progress line."""
+        done = self.done if done is None else done
+        elapsed = (now or time.monotonic()) - self.started_at
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - done, 0)
+        eta = f'{remaining / rate:.0f}s' if rate > 0 else 'unknown'
+        log_info(
+            f'Progress: <{done}/{self.total}> {self.name} done, '
+            f'<{rate:.1f}> {self.name}/s, ETA <{eta}>.'
+        )
+
+
+# Shared metrics to export and use throughout
+metrics = Metrics()
@@ -1,141 +1,420 @@
 """ migrator.py file to handle the main execution and migration of CSV to Asana goals."""
 # pylint: disable=wrong-import-position
-import os
 import sys
 sys.path.append('.')
 sys.path.append('./utils')
 # pylint: enable=wrong-import-position
 import argparse
-import numpy as np
-import pandas as pd
-import parsers
-import mappings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from goal import Goal
-from logger import log_info
+from workspace import workspace
+from pagination import DEFAULT_PAGE_SIZE
+from auth import client as asana_client, check_token
+from planner import build_alignment_plan
+from ingest import (
+    iterate_goal_records, iterate_goal_alignments, iterate_goal_chunks, map_goal_chunk)
+from workers import run_bounded, run_stage, timed_stage, consume_stage
+from state import StateStore, STEP_CREATED, STEP_LINKED, STEP_SUBGOAL_METRIC
+from backfill import backfill_status_updates
+from dry_run import DryRunSession, API_PLAN_FILE_PATH
+from rate_limiting import ASANA_RATE_LIMIT, ASANA_POOL_SIZE, UnconfirmedWriteError
+from batching import batch_writer, ASANA_BATCH_SIZE
+from metrics import metrics, ProgressReporter
+from sharding import run_shards, get_shard_metrics_file_path
+from options import (
+    MigrationOptions, DEFAULT_WORKERS, PHASES, PHASE_ALL, PHASE_GOALS, PHASE_STATUS_UPDATES)
+from logger import log_info, log_error
 
 
-processed_goals = {}
+def link_child_goals(parent_goal, child_goals, has_linked_children=False):
+    """Links all the child goals to their already created parent goal.
+    If the parent goal has its own parent, its metric is switched once before
+    the first child goal is linked, or right away if child goals were already linked to
+    it (e.g. a parent goal updated again in a sync). Child goals linked in a previous run
+    are skipped, and every child goal is marked as completely processed once linked.
+    A child goal whose link may have been applied without being confirmed is left to be
+    checked in the next run instead, see is_linked_to_parent_goal.
+    """
+    parent_goal_has_parent = bool(parent_goal.data['aligned_to'])
+    if parent_goal_has_parent and has_linked_children:
+        parent_goal.set_subgoal_metric()
+    for child_goal in child_goals:
+        if not child_goal.has_completed(STEP_LINKED):
+            try:
+                if not is_linked_to_parent_goal(child_goal, parent_goal):
+                    parent_goal.link_child_goal(child_goal.gid, parent_goal_has_parent)
+            except UnconfirmedWriteError as ex:
+                child_goal.mark_unconfirmed(STEP_LINKED, ex)
+                continue
+            child_goal.complete_step(STEP_LINKED)
+            parent_goal_has_parent = False
+        finish_goal(child_goal, parent_goal.data['id'])
 
 
-def get_goal_row_from_id(goals_df, goal_id):
-    """Gets a dataframe row (Series) based on a search value of the ID column"""
-    # Squeeze to convert to pandas Series data type
-    return goals_df.loc[goals_df['Id'] == goal_id].squeeze()
+def is_linked_to_parent_goal(child_goal, parent_goal):
+    """Checks if a child goal whose link to its parent goal was unconfirmed in a previous
+    run was linked after all, so it isn't linked twice. Any other child goal isn't linked."""
+    if not child_goal.is_unconfirmed(STEP_LINKED):
+        return False
+    is_linked = parent_goal.gid in child_goal.get_parent_goal_gids()
+    log_info(f'Found unconfirmed link of goal ID <{child_goal.data["id"]}> applied: {is_linked}')
+    return is_linked
 
 
-def link_aligned_goals(goals_df, child_goal):
-    """Creates or updates a new 'parent' goal from a child goal's
-    aligned to reference and links the child goal to the parent goal.
-    """
-    # If this goal is aligned (sub-goal) of another goal, get it
-    goal_id = parsers.parse_goal_id(child_goal.data['aligned_to'])
-    aligned_goal_data_row = get_goal_row_from_id(goals_df, goal_id)
-    goal_has_parent = aligned_goal_data_row['Aligned To (weight, Objective ID)']
-
-    # If this goal is aligned to another, create/update and link it
-    if not aligned_goal_data_row.empty:
-        aligned_goal = Goal(aligned_goal_data_row)
-        already_processed = aligned_goal.data['id'] in processed_goals
-        # Skip creating/updating the aligned goal since we've already created it
-        if already_processed:
-            # Get and set the gid to be used in link child goals below
-            aligned_goal.gid = processed_goals[aligned_goal.data['id']]
-        else:
-            aligned_goal.create_or_update_goal()
-            processed_goals[aligned_goal.data['id']] = aligned_goal.gid
-        aligned_goal.link_child_goal(child_goal, goal_has_parent)
-
-
-def create_or_read_output_csv(file_path):
-    """Create or reads an existing output CSV file for the processed
-    goal data.
+def finish_goal(goal, parent_id=None):
+    """Marks a goal as completely processed in its migration state, along with the hash
+    of its goal data to compare against in the next sync and the ID of the parent goal
+    it was linked to, if any."""
+    goal.state.finish(goal.gid, goal.data.get_payload_hash(), parent_id)
+
+
+def has_linked_child_goals(parent_goal, plan, state_store):
+    """Checks if a parent goal that was created or updated in this run needs its metric
+    switched to subgoal progress again, since child goals were linked to it in a previous
+    run. Its metric is then recreated with the goal, while its child goals may be skipped.
     """
-    headers = ['goal_index', 'goal_id', 'asana_goal_gid']
-    df = None
-    if not os.path.isfile(file_path):
-        df = pd.DataFrame(columns=headers)
-        df.to_csv(file_path, index=False)
+    if not parent_goal.data['aligned_to'] or parent_goal.has_completed(STEP_SUBGOAL_METRIC):
+        return False
+    for child_id in plan.children.get(parent_goal.data['id'], []):
+        child_state = state_store.get_goal_state(child_id)
+        if child_state and STEP_LINKED in child_state.steps:
+            return True
+    return False
+
+
+def unlink_previous_parent_goal(goal, parent_id, state_store):
+    """Removes a goal from the parent goal it was linked to before (e.g. in a sync),
+    if it is now aligned to another parent goal or none, so it isn't aligned to both."""
+    previous_parent_id = goal.state.parent_id
+    if not previous_parent_id or previous_parent_id == parent_id or not goal.gid:
+        return
+    previous_parent_state = state_store.get_goal_state(previous_parent_id)
+    if previous_parent_state and previous_parent_state.gid:
+        goal.unlink_parent_goal(previous_parent_state.gid)
     else:
-        df = pd.read_csv(file_path, dtype=str)
-    return df
+        log_error(
+            f'Missing Asana goal for previous parent goal ID <{previous_parent_id}> '
+            f'of goal ID <{goal.data["id"]}>. Skipping unlinking.'
+        )
+    goal.state.unlink()
 
 
-def preprocess_df(df):
-    """Formats the input dataframe to handle blank values and convert them to None types"""
-    # Convert and handle NaN values to None
-    df = df.replace({np.nan: None})
-    df = df.astype(str)
-    df = df.replace({'None': None})
+def migrate_goal(goal, parent_id, state_store):
+    """Creates or updates a single goal along with its owner, metric and status,
+    and removes it from its previous parent goal if it was re-aligned.
+    Runs inside a worker thread, so it only touches this goal's own API objects.
+    """
+    goal.create_or_update_goal()
+    unlink_previous_parent_goal(goal, parent_id, state_store)
+    return goal
 
-    # Remove duplicate rows
-    df = df.drop_duplicates()
-    return df
 
-# A flag to indicate if we should skip updating the goals
-# for processed goal IDs found in the output CSV
+def iterate_level_goals(goal_records, plan, level_number, skipped_goal_ids, state_store,
+                        parent_goals, keep_links=False):
+    """A generator yielding a Goal for every goal of the given alignment level out of the
+    (row index, GoalRecord object) pairs of the goals CSV.
+    Every goal resumes from its migration state, if it was only partially processed before.
+    The records of skipped goals that are parents are added to parent_goals for linking.
+    With keep_links, goals still aligned to the same parent aren't linked to it again.
+    """
+    for index, record in goal_records:
+        goal_id = record.id
+        if not plan.is_planned_goal(index, record) or plan.goal_levels[goal_id] != level_number:
+            continue
+        # Skip any goals that have already been processed and found in the state store
+        if goal_id in skipped_goal_ids:
+            log_info(f'Skipping goal ID: {goal_id}')
+            if goal_id in plan.children:
+                parent_goals[goal_id] = record
+            continue
+        yield Goal(record, state_store.start_goal(
+            goal_id, index, plan.parents.get(goal_id), keep_links))
+
+
+def run_level_pipeline(goals_file_path, plan, level_number, skipped_goal_ids, state_store,
+                       parent_goals, keep_links=False):
+    """Runs the stages of the pipeline feeding the writer pool with the goals of an
+    alignment level, each stage in a thread of its own connected by bounded queues:
+    the reader streams the goals CSV in chunks (again for every level instead of keeping
+    it in memory) and keeps only the rows of the level's goals, the mapper maps them into
+    goal records and the resolver looks up the workspace data every goal of the level
+    needs (see Goal.resolve). Skipped goals are only read if they are parents.
+    Returns the resolved goals as they come out of the last stage.
+    """
+    level_goal_ids = {
+        goal_id for goal_id in plan.levels[level_number]
+        if goal_id not in skipped_goal_ids or goal_id in plan.children
+    }
+    chunks = run_stage(
+        'read', iterate_goal_chunks(goals_file_path, goal_ids=level_goal_ids), queue_size=2)
+    goal_records = run_stage('map', chunks, map_goal_chunk, expand=True)
+    level_goals = iterate_level_goals(
+        goal_records, plan, level_number, skipped_goal_ids, state_store, parent_goals, keep_links)
+    return run_stage('resolve', level_goals, Goal.resolve)
+
+
+def plan_goals(goals_file_path, shard=None):
+    """Builds the alignment plan of the goals CSV, or of only the goals in a shard
+    given as a (shard number, shard count) pair. Only the columns of the plan are read."""
+    plan = build_alignment_plan(iterate_goal_alignments(goals_file_path))
+    if shard:
+        plan = plan.get_shard(*shard)
+    return plan
+
+
+def find_unchanged_goals(goals_file_path, payload_hashes):
+    """Finds the IDs of the goals whose data hasn't changed since they were last migrated,
+    based on the hashes of their goal data stored in the state store. Only the goals with
+    a stored hash are mapped, since any other goal is new."""
+    unchanged_goal_ids = set()
+    for _, record in iterate_goal_records(goals_file_path, goal_ids=payload_hashes.keys()):
+        if payload_hashes.get(record.id) == record.get_payload_hash():
+            unchanged_goal_ids.add(record.id)
+    return unchanged_goal_ids
+
+
+def migrate_goals(executor, plan, goals_file_path, skipped_goal_ids, state_store, max_pending,
+                  workers=DEFAULT_WORKERS, keep_links=False):
+    """Creates or updates the planned goals one alignment level at a time and links
+    each level to its parents from the previous level. Every step is recorded in the
+    state store, and goals are marked as completely processed once they are linked.
+
+    Every level runs as a pipeline (see run_level_pipeline) into the writer pool of the
+    executor, whose results are checkpointed by this thread, so reading, mapping and
+    resolving the next goals overlaps with the API requests of the goals before them.
+    With keep_links (in a sync), goals still aligned to the same parent aren't linked again,
+    while goals aligned to another parent are removed from their previous one first.
+    """
+    progress = ProgressReporter(
+        'goals', sum(1 for goal_id in plan.goal_ids if goal_id not in skipped_goal_ids))
+    parent_goals = {}
+    for level_number, level in enumerate(plan.levels):
+        log_info(f'Processing level <{level_number}> with <{len(level)}> goal(s).')
+        level_parent_goals = {}
+        level_goals = run_level_pipeline(
+            goals_file_path, plan, level_number, skipped_goal_ids, state_store, level_parent_goals,
+            keep_links)
 
+        # Create or update every goal in the level independently of each other
+        children_by_parent = {}
+        write_goal = timed_stage('write', lambda goal: migrate_goal(
+            goal, plan.parents.get(goal.data['id']), state_store), workers)
+        written_goals = run_bounded(executor, write_goal, level_goals, max_pending)
+        for goal in consume_stage('checkpoint', written_goals):
+            goal_id = goal.data['id']
+            log_info(f'Processed goal ID: {goal_id}')
+            metrics.increment('goals_processed')
+            progress.update()
+            if goal_id in plan.children:
+                level_parent_goals[goal_id] = goal
+            parent_id = plan.parents.get(goal_id)
+            if parent_id and goal.gid:
+                children_by_parent.setdefault(parent_id, []).append(goal)
+            elif not goal.is_unconfirmed(STEP_CREATED):
+                # A goal whose creation is unconfirmed is looked up again in the next run
+                finish_goal(goal)
 
-def main(skip_processed=True):
+        # Link the goals of this level to their parents from the previous level
+        futures = []
+        for parent_id, parent_goal in parent_goals.items():
+            child_goals = children_by_parent.get(parent_id, [])
+            has_linked_children = (
+                isinstance(parent_goal, Goal)
+                and has_linked_child_goals(parent_goal, plan, state_store))
+            if not child_goals and not has_linked_children:
+                continue
+            if not isinstance(parent_goal, Goal):
+                parent_goal = Goal(parent_goal, state_store.get_goal_state(parent_id))
+            if not parent_goal.gid:
+                log_error(f'Missing Asana goal for parent goal ID <{parent_id}>. Skipping linking.')
+                # The child goals of a parent goal whose creation is unconfirmed are linked
+                # in the next run, once it is found
+                if not parent_goal.is_unconfirmed(STEP_CREATED):
+                    for child_goal in child_goals:
+                        finish_goal(child_goal)
+                continue
+            futures.append(executor.submit(
+                link_child_goals, parent_goal, child_goals, has_linked_children))
+        for future in as_completed(futures):
+            future.result()
+        parent_goals = level_parent_goals
+    progress.report()
+    metrics.log_stages()
+
+
+def expire_unconfirmed_goals(state_store):
+    """Expires the cached workspace goals if the creation of a goal was unconfirmed in a
+    previous run, so the goal is found by its Ally reference ID if it was created after all.
+    """
+    unconfirmed_goal_ids = state_store.get_unconfirmed_goal_ids(STEP_CREATED)
+    if unconfirmed_goal_ids:
+        log_info(f'Fetching the workspace goals again for <{len(unconfirmed_goal_ids)}> goal(s) '
+                 'whose creation is unconfirmed.')
+        workspace.expire('goals')
+
+
+def main(options=MigrationOptions()):
     """Main function for the migrator script to process goals from a CSV
-    and create Goal class objects to create goals in Asana
+    and create Goal class objects to create goals in Asana.
+
+    Goals are created concurrently by a pool of worker threads, one alignment
+    level at a time. Since a goal must exist before it can be linked, each level
+    is created first and then linked to its parents from the previous levels.
+    The workspace users, time periods and goals are only loaded once needed.
+    Once all goals are processed, the historical status updates of the created goals
+    are backfilled concurrently per goal. Either phase can be run on its own.
+    In sync mode, only goals that are new or changed since they were last migrated
+    are created or updated.
+
+    Given a directory of workspace snapshots, the migration is planned offline instead:
+    no requests are sent to Asana and the state store isn't changed, but every request
+    that would be made is written to the API plan.
+
+    With several shards, the migration is split across as many processes (see run_shards),
+    each running this function on its own shard given as a (shard number, shard count) pair.
+    See MigrationOptions for all the options of a run.
     """
     log_info('Beginning main execution of goals migrator.')
-    log_info(f'skip_processed flag set to: {skip_processed}')
-    if skip_processed:
+    # Only planning offline can do without an Asana token
+    if not options.snapshot_dir:
+        check_token()
+    log_info(f'skip_processed flag set to: {options.skip_processed}')
+    workspace.refresh_cache = options.refresh_cache
+    workspace.page_size = options.page_size
+    if options.refresh_cache:
+        log_info('Refreshing the cached workspace data.')
+    log_info(f'Using <{options.workers}> worker(s) for Asana API calls.')
+    log_info(f'Running the <{options.phase}> phase(s) of the migration.')
+    if options.sync:
+        log_info(
+            'Syncing only new and changed goals. See migration_state.db for more information.'
+        )
+    elif options.skip_processed:
         log_info(
-            'Ignoring previously processed goals. See goals_processed.csv for more information.'
+            'Ignoring previously processed goals. See migration_state.db for more information.'
         )
     else:
         log_info(
             'Processing all goals and ingore previously procssed goals.'
         )
 
-    # Import and read the goals data CSV
-    # TODO: For now hard-code column names to handle blank column names that hold
-    # additional check-in notes in rows
-    column_names = mappings.CSV_COLUMN_NAMES
+    asana_client.configure_pool(options.workers, options.pool_size)
+    batch_writer.configure(options.workers, options.batch_size)
 
-    goals_df = pd.read_csv('./goals.csv',  names=column_names)
-    goals_df = preprocess_df(goals_df)
-    log_info(f'Imported <{len(goals_df)}> goals.')
+    if options.shards > 1 and options.shard is None:
+        run_shards(options, prefetch=options.phase != PHASE_STATUS_UPDATES)
+        log_info('COMPLETE: Finished main execution of goals migrator.')
+        return
+    if options.shard:
+        log_info(f'Running shard <{options.shard[0]}> of <{options.shard[1]}> shards.')
 
-    # If it doesn't already exist, create the csv file to keep track of processed goals
-    processed_file_path = './goals_processed.csv'
-    processed_df = create_or_read_output_csv(processed_file_path)
+    dry_run_session = None
+    if options.snapshot_dir:
+        log_info(
+            f'Planning the migration offline against the snapshots in {options.snapshot_dir}.')
+        dry_run_session = DryRunSession(options.snapshot_dir)
+        asana_client.session = dry_run_session
+        asana_client.bucket = None
+        workspace.cache_dir = None
 
-    for index, row in goals_df.iterrows():
-        if index == 0:  # skip processing the column row
-            continue
+    goals_file_path = './goals.csv'
+    plan = None
+    with StateStore(in_memory=dry_run_session is not None) as state_store, \
+            ThreadPoolExecutor(max_workers=options.workers) as executor:
+        if options.phase in (PHASE_ALL, PHASE_GOALS):
+            with metrics.phase('mapping'):
+                if options.sync:
+                    # Only skip the goals whose data is the same as when they were last migrated
+                    skipped_goal_ids = find_unchanged_goals(
+                        goals_file_path, state_store.get_payload_hashes())
+                    log_info(f'Found <{len(skipped_goal_ids)}> unchanged goal(s) to skip.')
+                elif options.skip_processed:
+                    skipped_goal_ids = state_store.get_processed_goal_ids()
+                else:
+                    skipped_goal_ids = set()
 
-        # Skip any goals that have already been processed and found in the output csv
-        if skip_processed and not processed_df.empty:
-            goal_id = row['Id']
-            if goal_id in processed_df['goal_id'].values:
-                log_info(f'Skipping goal ID: {goal_id}')
-                continue
+                # Plan the alignment graph up front so that every parent goal is
+                # created before its child goals are linked to it
+                plan = plan_goals(goals_file_path, options.shard)
+                log_info(f'Imported <{len(plan.goal_ids)}> goals.')
+                plan.log_report()
+
+            # Load the workspace data all at once, but only if there are goals left to process
+            if any(goal_id not in skipped_goal_ids for goal_id in plan.goal_ids):
+                with metrics.phase('bootstrap'):
+                    # The coordinator of a sharded migration already fetched them again
+                    if not options.shard:
+                        expire_unconfirmed_goals(state_store)
+                    workspace.prefetch()
+
+            migrate_goals(executor, plan, goals_file_path, skipped_goal_ids, state_store,
+                          options.workers * 2, options.workers, keep_links=options.sync)
 
-        log_info(f'Processing goal index: {index}')
-        goal = Goal(row)
-        goal.create_or_update_goal()
-        processed_goals[goal.data['id']] = goal.gid
-        link_aligned_goals(goals_df, goal)
-
-        # Write the processed goal data to the ouput CSV
-        if os.path.exists(processed_file_path):
-            data_df = pd.DataFrame([{
-                'goal_index': index,
-                'goal_id': goal.data['id'],
-                'asana_goal_gid': goal.gid,
-            }],)
-            data_df.to_csv(processed_file_path, mode='a',
-                           index=False, header=False)
+        if options.phase in (PHASE_ALL, PHASE_STATUS_UPDATES):
+            # The historical status updates of the created goals are backfilled
+            # in their own phase that can be resumed from the state store
+            # A shard only backfills its own goals
+            shard_goal_ids = None
+            if options.shard:
+                if plan is None:
+                    plan = plan_goals(goals_file_path, options.shard)
+                shard_goal_ids = plan.goal_ids
+            with metrics.phase('status_backfill'):
+                backfill_status_updates(
+                    executor, goals_file_path, state_store, options.workers * 2, shard_goal_ids)
 
+    asana_client.log_stats()
+    if options.shard:
+        # The coordinator merges the metrics of every shard
+        metrics.export(get_shard_metrics_file_path(options.shard[0]), None)
+    else:
+        metrics.export()
+    if dry_run_session:
+        dry_run_session.write_plan(API_PLAN_FILE_PATH, ASANA_RATE_LIMIT)
     log_info('COMPLETE: Finished main execution of goals migrator.')
 
 
-if __name__ == "__main__":
+def parse_options(arguments=None):
+    """Parses the command line arguments (by default of this process) into the
+    MigrationOptions of the run."""
     parser = argparse.ArgumentParser()
-    parser.add_argument("-a", "--all", action="store_true")
-    args = parser.parse_args()
-    skip_arg = not args.all
-    main(skip_arg)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("-a", "--all", action="store_true")
+    mode.add_argument("-s", "--sync", action="store_true",
+                      help="only create or update the goals that are new or changed "
+                           "since the last run")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of concurrent workers for Asana API calls")
+    parser.add_argument("-r", "--refresh-cache", action="store_true",
+                        help="ignore the cached workspace data and fetch it from Asana again")
+    parser.add_argument("-p", "--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help="number of items per page when fetching workspace data (max 100)")
+    parser.add_argument("--phase", choices=PHASES, default=PHASE_ALL,
+                        help="run only the goals or the status updates phase of the migration")
+    parser.add_argument("--plan", metavar="SNAPSHOT_DIR",
+                        help="plan the migration offline against snapshots of the workspace "
+                             "users, time periods and goals, writing the API calls "
+                             "to api_plan.jsonl")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="number of processes to split the migration across, "
+                             "by independent trees of aligned goals")
+    parser.add_argument("--pool-size", type=int, default=ASANA_POOL_SIZE,
+                        help="number of keep-alive connections to the Asana API "
+                             "(defaults to the number of workers)")
+    parser.add_argument("--batch-size", type=int, default=ASANA_BATCH_SIZE,
+                        help="maximum number of small writes of the workers to send together "
+                             "in a batch request (max 10), 1 to not batch")
+    # The shard of a process started by the coordinator of a sharded migration
+    parser.add_argument("--shard", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(arguments)
+    if args.plan and args.shards > 1:
+        parser.error('--plan can only be used without --shards')
+    return MigrationOptions(
+        skip_processed=not args.all, workers=args.workers, refresh_cache=args.refresh_cache,
+        page_size=args.page_size, phase=args.phase, sync=args.sync, snapshot_dir=args.plan,
+        shards=args.shards, shard=(args.shard, args.shards) if args.shard is not None else None,
+        pool_size=args.pool_size, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main(parse_options())
@@ -0,0 +1,34 @@
+""" options.py file for the options of a migration run, as given on the command line."""
+from collections import namedtuple
+from pagination import DEFAULT_PAGE_SIZE
+from rate_limiting import ASANA_POOL_SIZE
+from batching import ASANA_BATCH_SIZE
+
+# Default number of worker threads used to make concurrent Asana API calls
+DEFAULT_WORKERS = 1
+
+# Phases of the migration that can be run on their own
+PHASE_ALL = 'all'
+PHASE_GOALS = 'goals'
+PHASE_STATUS_UPDATES = 'status-updates'
+PHASES = [PHASE_ALL, PHASE_GOALS, PHASE_STATUS_UPDATES]
+
+# The options of a migration run, passed as a whole from the command line to the migrator
+# and on to the shard processes, see migrator.main:
+# - skip_processed: skip the goals processed in a previous run (unless --all)
+# - workers: number of worker threads making concurrent Asana API calls
+# - refresh_cache: fetch the workspace data from Asana again instead of from its cache
+# - page_size: number of items per page when fetching workspace data
+# - phase: the phase(s) of the migration to run, see PHASES
+# - sync: only create or update the goals that are new or changed since the last run
+# - snapshot_dir: plan the migration offline against the workspace snapshots in it
+# - shards: number of processes to split the migration across
+# - shard: the (shard number, shard count) pair of a shard process, if any
+# - pool_size: number of keep-alive connections to the Asana API
+# - batch_size: maximum number of small writes sent together in a batch request
+MigrationOptions = namedtuple(
+    'MigrationOptions',
+    ['skip_processed', 'workers', 'refresh_cache', 'page_size', 'phase', 'sync', 'snapshot_dir',
+     'shards', 'shard', 'pool_size', 'batch_size'],
+    defaults=[True, DEFAULT_WORKERS, False, DEFAULT_PAGE_SIZE, PHASE_ALL, False, None,
+              1, None, ASANA_POOL_SIZE, ASANA_BATCH_SIZE])
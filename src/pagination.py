@@ -0,0 +1,30 @@
+""" pagination.py file to handle the Asana API's pagination scheme for collection endpoints."""
+import os
+
+# Number of items to request per page, the Asana API allows up to 100
+DEFAULT_PAGE_SIZE = int(os.getenv('ASANA_PAGE_SIZE', '100'))
+
+
+def iterate_pages(fetch_page, params, page_size=DEFAULT_PAGE_SIZE):
+    """A generator yielding the data of every page of an Asana API collection.
+    Takes the client method for the collection endpoint (e.g. asana_client.goals.get_goals)
+    and follows the next_page offsets until the last page.
+    API Reference: https://developers.asana.com/docs/pagination
+    """
+    offset = None
+    while True:
+        result = fetch_page(
+            params, offset=offset, full_payload=True, limit=page_size, iterator_type=None,
+            opt_pretty=True)
+        yield result['data']
+        if 'next_page' in result and result['next_page'] is not None:
+            offset = result['next_page']['offset']
+        else:
+            break
+
+
+def iterate_items(fetch_page, params, page_size=DEFAULT_PAGE_SIZE):
+    """A generator yielding every item of an Asana API collection, page by page,
+    so callers can start processing before the last page is fetched."""
+    for page in iterate_pages(fetch_page, params, page_size):
+        yield from page
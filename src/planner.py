@@ -0,0 +1,181 @@
+""" planner.py file to plan the order goals are migrated in based on their alignment."""
+import parsers
+from logger import log_info, log_error
+
+
+class AlignmentPlan():
+    """AlignmentPlan class holding the parent/child graph of the goals in the CSV
+    and the order (levels) in which they can be created and linked.
+    Every goal in a level only has parents in previous levels.
+    """
+
+    def __init__(self) -> None:
+        self.goal_ids = {}
+        self.aligned_ids = set()
+        self.goal_levels = {}
+        self.parents = {}
+        self.children = {}
+        self.levels = []
+        self.cycles = []
+        self.dangling = {}
+        self.duplicates = {}
+
+    def add_goal(self, index, record):
+        """Adds a goal's mapped record to the plan and parses its aligned to reference once.
+        Only the goal ID and its row index are kept, not the record itself.
+        Duplicate goal IDs keep the first row found."""
+        goal_id = record.id
+        if goal_id in self.goal_ids:
+            self.duplicates.setdefault(goal_id, [self.goal_ids[goal_id]]).append(index)
+            return
+        self.goal_ids[goal_id] = index
+        aligned_to = record.aligned_to
+        if aligned_to:
+            self.aligned_ids.add(goal_id)
+        parent_id = parsers.parse_goal_id(aligned_to)
+        if parent_id:
+            self.parents[goal_id] = parent_id
+
+    def build(self):
+        """Resolves the dangling parents and cycles and orders the goals into levels."""
+        # Parents that aren't part of the CSV can't be created or linked
+        for goal_id, parent_id in list(self.parents.items()):
+            if parent_id not in self.goal_ids:
+                self.dangling[goal_id] = parent_id
+                del self.parents[goal_id]
+
+        goal_levels = self.goal_levels
+        for goal_id in self.goal_ids:
+            # Walk up the parents until a goal with a known level (or a root) is found
+            path = []
+            path_positions = {}
+            node = goal_id
+            while node is not None and node not in goal_levels and node not in path_positions:
+                path_positions[node] = len(path)
+                path.append(node)
+                node = self.parents.get(node)
+
+            if node is None:
+                level = 0
+            elif node in path_positions:
+                # A cycle can't be ordered, so break it by not aligning any of its goals
+                cycle = path[path_positions[node]:]
+                self.cycles.append(cycle)
+                for member in cycle:
+                    del self.parents[member]
+                    goal_levels[member] = 0
+                path = path[:path_positions[node]]
+                level = 1
+            else:
+                level = goal_levels[node] + 1
+
+            for member in reversed(path):
+                goal_levels[member] = level
+                level += 1
+
+        for goal_id, parent_id in self.parents.items():
+            self.children.setdefault(parent_id, []).append(goal_id)
+
+        max_level = max(goal_levels.values(), default=-1)
+        self.levels = [[] for _ in range(max_level + 1)]
+        for goal_id, level in goal_levels.items():
+            self.levels[level].append(goal_id)
+        return self
+
+    def log_report(self):
+        """Logs the plan summary along with any duplicate goal IDs, dangling parents
+        and cycles found."""
+        for goal_id, indexes in self.duplicates.items():
+            log_error(
+                f'Goal ID <{goal_id}> is found in rows <{", ".join(map(str, indexes))}>. '
+                f'Only row <{indexes[0]}> will be migrated.'
+            )
+        for goal_id, parent_id in self.dangling.items():
+            log_error(
+                f'Goal ID <{goal_id}> is aligned to goal ID <{parent_id}> which is not in the CSV. '
+                'It will not be linked.'
+            )
+        for cycle in self.cycles:
+            log_error(
+                f'Found an alignment cycle between goal IDs <{", ".join(cycle)}>. '
+                'These goals will not be linked.'
+            )
+        log_info(
+            f'Planned <{len(self.goal_ids)}> goals in <{len(self.levels)}> level(s) '
+            f'with <{len(self.parents)}> alignment link(s).'
+        )
+
+    def assign_shards(self, shard_count):
+        """Partitions the goals into shards of connected alignment components, so that
+        every goal is in the same shard as its parent and child goals. Components are
+        assigned largest first to the shard with the fewest goals, which is the same
+        for every process given the same goals CSV.
+        Returns a dict of goal IDs to shard numbers (0 to shard_count - 1)."""
+        # Every goal has at most one parent, so each component is a tree with a root in level 0
+        component_roots = {}
+        for level in self.levels:
+            for goal_id in level:
+                parent_id = self.parents.get(goal_id)
+                component_roots[goal_id] = component_roots[parent_id] if parent_id else goal_id
+        components = {}
+        for goal_id, root_id in component_roots.items():
+            components.setdefault(root_id, []).append(goal_id)
+
+        shard_sizes = [0] * shard_count
+        goal_shards = {}
+        for root_id in sorted(components, key=lambda root_id: (-len(components[root_id]),
+                                                                 self.goal_ids[root_id])):
+            shard_number = shard_sizes.index(min(shard_sizes))
+            shard_sizes[shard_number] += len(components[root_id])
+            for goal_id in components[root_id]:
+                goal_shards[goal_id] = shard_number
+        return goal_shards
+
+    def get_shard(self, shard_number, shard_count):
+        """Gets the plan of only the goals in one of the shards, see assign_shards."""
+        goal_shards = self.assign_shards(shard_count)
+        shard = AlignmentPlan()
+        shard.goal_ids = {
+            goal_id: index for goal_id, index in self.goal_ids.items()
+            if goal_shards[goal_id] == shard_number
+        }
+        shard.aligned_ids = self.aligned_ids & shard.goal_ids.keys()
+        shard.goal_levels = {goal_id: self.goal_levels[goal_id] for goal_id in shard.goal_ids}
+        shard.parents = {
+            goal_id: parent_id for goal_id, parent_id in self.parents.items()
+            if goal_id in shard.goal_ids
+        }
+        shard.children = {
+            parent_id: child_ids for parent_id, child_ids in self.children.items()
+            if parent_id in shard.goal_ids
+        }
+        shard.levels = [
+            [goal_id for goal_id in level if goal_id in shard.goal_ids] for level in self.levels
+        ]
+        # Drop the trailing levels without any goals of this shard
+        while shard.levels and not shard.levels[-1]:
+            shard.levels.pop()
+        shard.cycles = [cycle for cycle in self.cycles if cycle[0] in shard.goal_ids]
+        shard.dangling = {
+            goal_id: parent_id for goal_id, parent_id in self.dangling.items()
+            if goal_id in shard.goal_ids
+        }
+        shard.duplicates = {
+            goal_id: indexes for goal_id, indexes in self.duplicates.items()
+            if goal_id in shard.goal_ids
+        }
+        return shard
+
+    def is_planned_goal(self, index, record):
+        """Checks if the goal's row is the one planned for its goal ID, as opposed to
+        a later row with a duplicate goal ID."""
+        return self.goal_ids.get(record.id) == index
+
+
+def build_alignment_plan(goal_records):
+    """Parses every aligned to reference from the (row index, GoalRecord object) pairs
+    of the goals CSV once and builds the alignment plan before any API call is made."""
+    plan = AlignmentPlan()
+    for index, record in goal_records:
+        plan.add_goal(index, record)
+    return plan.build()
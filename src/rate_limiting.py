@@ -0,0 +1,247 @@
+""" rate_limiting.py file for the rate limited Asana client used for every Asana API request."""
+import os
+import time
+import random
+import threading
+import asana
+import requests
+from requests.adapters import HTTPAdapter
+import parsers
+from logger import log_info
+from metrics import metrics
+
+# Asana allows 1500 requests per minute for paid workspaces (150 for free workspaces)
+# API Reference: https://developers.asana.com/docs/rate-limits
+ASANA_RATE_LIMIT = int(os.getenv('ASANA_RATE_LIMIT', '1500'))
+ASANA_MAX_RETRIES = int(os.getenv('ASANA_MAX_RETRIES', '5'))
+# Maximum number of seconds to back off for between retries of transient errors
+MAX_RETRY_DELAY = 60.0
+# Seconds to wait to connect to and for a response from the Asana API before retrying
+ASANA_CONNECT_TIMEOUT = float(os.getenv('ASANA_CONNECT_TIMEOUT', '10'))
+ASANA_READ_TIMEOUT = float(os.getenv('ASANA_READ_TIMEOUT', '60'))
+# Number of keep-alive connections to the Asana API, by default one per worker thread
+ASANA_POOL_SIZE = int(os.getenv('ASANA_POOL_SIZE', '0'))
+# Number of workspace datasets loaded concurrently before the worker threads start
+WORKSPACE_LOADS = 3
+# POST endpoints that overwrite what they were sent before instead of adding to it,
+# or remove something that stays removed
+IDEMPOTENT_POST_ENDPOINTS = {
+    'POST /goals/{gid}/setMetric',
+    'POST /goals/{gid}/removeSupportingRelationship',
+}
+
+
+def is_idempotent(endpoint):
+    """Checks if sending a request to an endpoint (e.g. POST /status_updates) again has
+    no other effect than sending it once, which is the case for every method but POST
+    and for the POST endpoints that overwrite, e.g. setting a goal metric."""
+    return not endpoint.startswith('POST ') or endpoint in IDEMPOTENT_POST_ENDPOINTS
+
+
+def may_have_been_applied(error):
+    """Checks if a failed request may have been applied by the Asana API anyway, e.g. when
+    the API failed (5xx) or the connection broke after the request was sent, as opposed to
+    a rate limited (429) or otherwise rejected request, or a connection that timed out."""
+    if isinstance(error.__context__, requests.exceptions.Timeout):
+        # The client raises timeouts as retryable errors
+        error = error.__context__
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    return isinstance(error, (asana.error.ServerError, requests.exceptions.RequestException))
+
+
+class UnconfirmedWriteError(Exception):
+    """UnconfirmedWriteError class for a write that isn't idempotent (see is_idempotent)
+    and failed in a way it may have been applied (see may_have_been_applied), e.g. a status
+    update whose response timed out. It isn't retried, so it is never applied twice, and
+    the caller records it to check whether it was applied in the next run."""
+
+    def __init__(self, endpoint, error) -> None:
+        super().__init__(f'{endpoint} may have been applied: {error!r}')
+        self.endpoint = endpoint
+        self.error = error
+
+
+class TokenBucket():
+    """TokenBucket class to pace requests to a per-minute quota.
+    The bucket holds up to a burst of tokens and refills continuously,
+    each request takes one token and waits for it if the bucket is empty.
+    """
+
+    def __init__(self, requests_per_minute, burst=None) -> None:
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token from the bucket, waiting until one is available.
+        Returns the number of seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        """Pauses the bucket so no requests are made for the given number of seconds,
+        e.g. when the API asks to retry after a rate limit was enforced."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # Start refilling from empty once the pause is over
+            self.tokens = 0.0
+            self.updated_at = self.paused_until
+
+
+class RateLimitedClient(asana.Client):
+    """RateLimitedClient class wrapping the Asana client to pace every request with
+    a client-side token bucket, honor the Retry-After of rate limited (429) requests
+    for all threads and retry transient errors with a jittered exponential backoff.
+    Requests time out (and are retried) after the connect and read timeouts, and reuse
+    the keep-alive connections of a pool sized to the worker threads (see configure_pool).
+    A request that isn't idempotent (e.g. creating a goal) isn't retried once it failed in
+    a way it may have been applied already (e.g. its response timed out or the API failed),
+    but raises an UnconfirmedWriteError instead, see check_unconfirmed_write.
+    """
+
+    def __init__(self, session=None, auth=None, rate_limit=ASANA_RATE_LIMIT, **options) -> None:
+        options.setdefault('max_retries', ASANA_MAX_RETRIES)
+        options.setdefault('timeout', (ASANA_CONNECT_TIMEOUT, ASANA_READ_TIMEOUT))
+        super().__init__(session, auth, **options)
+        self.adapter = None
+        # Requests aren't paced without a rate limit, e.g. when planning offline
+        self.bucket = TokenBucket(rate_limit) if rate_limit else None
+        self.stats = {
+            'requests': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'throttled_seconds': 0.0,
+        }
+        self._stats_lock = threading.Lock()
+        # The endpoint of the request being made by each thread, to attribute its retries
+        self._local = threading.local()
+
+    def configure_pool(self, workers, pool_size=ASANA_POOL_SIZE):
+        """Sizes the pool of keep-alive connections to the Asana API for the number of
+        worker threads making requests (or the concurrent workspace data loads), so
+        connections are reused instead of opened (with a TLS handshake) per request.
+        Threads wait for a free connection rather than opening extra ones."""
+        pool_size = pool_size or max(workers, WORKSPACE_LOADS)
+        if not hasattr(self.session, 'mount'):
+            return  # e.g. when planning offline
+        # Retries are made by the client itself, see _handle_retryable_error
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount(self.options['base_url'], self.adapter)
+        log_info(f'Using a pool of up to <{pool_size}> connection(s) to the Asana API.')
+
+    def get_connection_stats(self):
+        """Gets the number of connections opened to the Asana API and the number of
+        requests made over them, across every connection pool of the session."""
+        connections = 0
+        request_count = 0
+        if self.adapter:
+            pool_manager = self.adapter.poolmanager
+            for key in pool_manager.pools.keys():
+                pool = pool_manager.pools.get(key)
+                if pool:
+                    connections += pool.num_connections
+                    request_count += pool.num_requests
+        return connections, request_count
+
+    def request(self, method, path, **options):
+        """Dispatches a request to the Asana HTTP API once a token is available."""
+        self._throttle()
+        self._increment_stat('requests')
+        endpoint = parsers.parse_api_endpoint(method, path)
+        self._local.endpoint = endpoint
+        started_at = time.perf_counter()
+        try:
+            return super().request(method, path, **options)
+        except (asana.error.RetryableAsanaError, requests.exceptions.RequestException) as ex:
+            # e.g. once no retries are left
+            self.check_unconfirmed_write(endpoint, ex)
+            raise
+        finally:
+            metrics.record_call(endpoint, time.perf_counter() - started_at)
+
+    def reserve(self, count):
+        """Waits for count more tokens on top of the one every request takes,
+        e.g. for the additional actions of a batch request."""
+        for _ in range(count):
+            self._throttle()
+
+    def check_unconfirmed_write(self, endpoint, error):
+        """Raises an UnconfirmedWriteError for a failed request to an endpoint that isn't
+        idempotent if it may have been applied, instead of retrying it or raising its error."""
+        if is_idempotent(endpoint) or not may_have_been_applied(error):
+            return
+        metrics.increment('unconfirmed_writes')
+        log_info(f'Request to <{endpoint}> failed and may have been applied, not retrying.')
+        raise UnconfirmedWriteError(endpoint, error) from error
+
+    def _handle_retryable_error(self, e, retry_count):
+        """Sleeps before retrying based on the type of retryable error and then
+        waits for a token like any other request.
+        A request that isn't idempotent and may have been applied isn't retried,
+        see check_unconfirmed_write."""
+        endpoint = getattr(self._local, 'endpoint', None)
+        self.check_unconfirmed_write(endpoint, e)
+        self._increment_stat('retries')
+        is_rate_limited = isinstance(e, asana.error.RateLimitEnforcedError)
+        metrics.record_retry(endpoint, is_rate_limited)
+        if is_rate_limited:
+            self.wait_for_rate_limit(e.retry_after)
+        else:
+            # Full jitter keeps concurrent retries from hitting the API at the same time
+            delay = min(MAX_RETRY_DELAY, self.RETRY_DELAY * (self.RETRY_BACKOFF ** retry_count))
+            time.sleep(random.uniform(0, delay))
+        self._throttle()
+
+    def wait_for_rate_limit(self, retry_after=None):
+        """Honors the Retry-After seconds of a rate limited (429) response, e.g. of a request
+        or of an action in a batch request, before the next request is made."""
+        self._increment_stat('rate_limited')
+        retry_after = retry_after or self.RETRY_DELAY
+        # Every thread shares the same quota, so pause them all
+        if self.bucket:
+            self.bucket.pause(retry_after)
+        else:
+            time.sleep(retry_after)
+        log_info(f'Rate limit enforced, retrying after <{retry_after}> seconds.')
+
+    def _throttle(self):
+        if not self.bucket:
+            return
+        waited = self.bucket.acquire()
+        if waited:
+            self._increment_stat('throttled_seconds', waited)
+            metrics.increment('throttled_seconds', waited)
+
+    def _increment_stat(self, name, value=1):
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def log_stats(self):
+        """Logs the request, retry, throttling and connection reuse counters."""
+        log_info(
+            f'Made <{self.stats["requests"]}> Asana API request(s) with '
+            f'<{self.stats["retries"]}> retries (<{self.stats["rate_limited"]}> rate limited), '
+            f'throttled for <{self.stats["throttled_seconds"]:.1f}> seconds.'
+        )
+        connections, request_count = self.get_connection_stats()
+        if connections:
+            log_info(
+                f'Opened <{connections}> connection(s) to the Asana API, reused for '
+                f'<{request_count - connections}> of <{request_count}> HTTP request(s).'
+            )
+            metrics.increment('connections_opened', connections)
+            metrics.increment('connections_reused', request_count - connections)
@@ -0,0 +1,146 @@
+""" sharding.py file to run the migration in several processes,
+each migrating a shard of the goals."""
+import os
+import sys
+import json
+import subprocess
+from workspace import workspace
+from planner import build_alignment_plan
+from ingest import iterate_goal_alignments
+from state import StateStore, STEP_CREATED
+from rate_limiting import ASANA_RATE_LIMIT
+from metrics import metrics, merge_summaries
+from logger import log_info, log_error
+
+# Comma separated tokens (e.g. of several service accounts) for the shards to take turns
+# using instead of ASANA_TOKEN, each with its own ASANA_RATE_LIMIT
+ASANA_SHARD_TOKENS = [
+    token.strip() for token in os.getenv('ASANA_SHARD_TOKENS', '').split(',') if token.strip()
+]
+MIGRATOR_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrator.py')
+
+
+def get_shard_metrics_file_path(shard_number):
+    """Gets the file path a shard process exports its metrics summary to."""
+    return f'./metrics_shard_{shard_number}.json'
+
+
+def get_shard_environments(shard_count):
+    """Gets the environment variables of every shard process: the token it uses and its
+    share of the rate limit, which is split evenly between the shards using the same token."""
+    tokens = ASANA_SHARD_TOKENS or [os.getenv('ASANA_TOKEN')]
+    if len(tokens) > shard_count:
+        log_info(f'Only <{shard_count}> of the <{len(tokens)}> shard tokens will be used.')
+    shard_tokens = [tokens[shard_number % len(tokens)] for shard_number in range(shard_count)]
+    environments = []
+    for token in shard_tokens:
+        rate_limit = ASANA_RATE_LIMIT
+        if rate_limit:
+            rate_limit = max(1, rate_limit // shard_tokens.count(token))
+        environments.append(
+            {**os.environ, 'ASANA_TOKEN': token, 'ASANA_RATE_LIMIT': str(rate_limit)})
+    return environments
+
+
+def get_shard_arguments(options, shard_number):
+    """Gets the command line of a shard process, which runs the migrator on its own shard
+    with the options (MigrationOptions) of the coordinator. The workspace data is refreshed
+    by the coordinator, so the shards read it from the cache."""
+    arguments = [
+        sys.executable, MIGRATOR_FILE_PATH,
+        '--shard', str(shard_number), '--shards', str(options.shards),
+        '--workers', str(options.workers), '--page-size', str(options.page_size),
+        '--phase', options.phase,
+    ]
+    if options.pool_size:
+        arguments.extend(['--pool-size', str(options.pool_size)])
+    if options.batch_size is not None:
+        arguments.extend(['--batch-size', str(options.batch_size)])
+    if options.sync:
+        arguments.append('--sync')
+    elif not options.skip_processed:
+        arguments.append('--all')
+    return arguments
+
+
+def log_shards(plan, shard_count):
+    """Logs the number of goals in every shard of the alignment plan."""
+    shard_sizes = [0] * shard_count
+    for shard_number in plan.assign_shards(shard_count).values():
+        shard_sizes[shard_number] += 1
+    for shard_number, shard_size in enumerate(shard_sizes):
+        log_info(f'Shard <{shard_number}> has <{shard_size}> goal(s).')
+    if shard_sizes and min(shard_sizes) == 0:
+        log_info('There are fewer independent goal trees than shards, some shards have no goals.')
+
+
+def run_shards(options, prefetch=True):
+    """Coordinates a migration sharded across several processes with the options
+    (MigrationOptions) of the run. The goals are partitioned into connected alignment
+    components (see AlignmentPlan.assign_shards), so a goal is always created in the
+    same process as its parent and child goals are linked to it.
+    Every shard process runs the migrator on its own shard with its own token and rate
+    limit (see get_shard_environments) and records its progress in the shared state store,
+    which is in WAL mode for concurrent writers. Once all shards exit, their metrics are
+    merged and the combined results are logged.
+    """
+    shard_count = options.shards
+    log_info(f'Running the migration in <{shard_count}> shard process(es).')
+    goals_file_path = './goals.csv'
+    plan = build_alignment_plan(iterate_goal_alignments(goals_file_path))
+    plan.log_report()
+    log_shards(plan, shard_count)
+
+    # Create the state store (importing any earlier output CSVs) once, before the shards share it
+    with StateStore() as state_store:
+        processed_count = len(state_store.get_processed_goal_ids())
+        log_info(f'Found <{processed_count}> previously processed goal(s).')
+        # The goals are fetched again to look up the goals whose creation is unconfirmed
+        if state_store.get_unconfirmed_goal_ids(STEP_CREATED):
+            workspace.expire('goals')
+
+    # Load the workspace data once, so every shard reads it from the cache instead of the API
+    workspace.refresh_cache = options.refresh_cache
+    workspace.page_size = options.page_size
+    if prefetch and workspace.cache_dir:
+        with metrics.phase('bootstrap'):
+            workspace.prefetch()
+
+    processes = []
+    for shard_number, environment in enumerate(get_shard_environments(shard_count)):
+        metrics_file_path = get_shard_metrics_file_path(shard_number)
+        if os.path.isfile(metrics_file_path):
+            os.remove(metrics_file_path)
+        arguments = get_shard_arguments(options, shard_number)
+        processes.append(subprocess.Popen(arguments, env=environment))  # pylint: disable=consider-using-with
+
+    failed_shards = []
+    for shard_number, process in enumerate(processes):
+        return_code = process.wait()
+        if return_code != 0:
+            failed_shards.append(shard_number)
+            log_error(f'Shard <{shard_number}> failed with exit code <{return_code}>.')
+
+    # Merge the metrics of every shard with the ones of the coordinator
+    summaries = [metrics.get_summary()]
+    for shard_number in range(shard_count):
+        metrics_file_path = get_shard_metrics_file_path(shard_number)
+        if os.path.isfile(metrics_file_path):
+            with open(metrics_file_path, encoding='utf-8') as file:
+                summaries.append(json.load(file))
+    summary = merge_summaries(summaries)
+    metrics.export(summary=summary)
+
+    api_requests = sum(endpoint['requests'] for endpoint in summary['endpoints'].values())
+    log_info(
+        f'Shards processed <{summary["counters"].get("goals_processed", 0)}> goal(s) and '
+        f'backfilled <{summary["counters"].get("goals_backfilled", 0)}> with <{api_requests}> '
+        f'Asana API request(s) in <{summary["duration_seconds"]:.1f}> seconds.'
+    )
+    if failed_shards:
+        msg = (
+            f'Shard(s) <{", ".join(map(str, failed_shards))}> failed. '
+            'Run the migrator again to resume their remaining goals.'
+        )
+        log_error(msg)
+        raise RuntimeError(msg)
@@ -0,0 +1,288 @@
+""" state.py file for the local SQLite store of the migration state of every goal."""
+import os
+import sqlite3
+import threading
+from checkpoint import read_checkpoint_rows
+from logger import log_info
+
+STATE_FILE_PATH = './migration_state.db'
+# Output CSVs of earlier versions of the migrator that are imported into a new state store
+PROCESSED_FILE_PATH = './goals_processed.csv'
+STATUS_UPDATES_FILE_PATH = './status_updates_processed.csv'
+STATUS_UPDATES_CHECKPOINT_HEADERS = ('goal_id', 'asana_goal_gid', 'status_updates_created')
+# Seconds to wait for another writer (e.g. another migrator process) to release its lock
+STATE_BUSY_TIMEOUT = 30.0
+
+# The steps of migrating a goal, each of which is only completed once per goal
+STEP_CREATED = 'created'
+STEP_METRIC = 'metric_set'
+STEP_OWNER = 'owner_set'
+STEP_LINKED = 'linked'
+STEP_SUBGOAL_METRIC = 'subgoal_metric_set'
+STEPS = [STEP_CREATED, STEP_METRIC, STEP_OWNER, STEP_LINKED, STEP_SUBGOAL_METRIC]
+# The steps of linking a goal to its parent, which don't need to be repeated in a sync
+# unless the goal is aligned to another parent
+LINK_STEPS = [STEP_LINKED, STEP_SUBGOAL_METRIC]
+# Creating the next status update of a goal, whose write can be unconfirmed like a step's
+STEP_STATUS_UPDATE = 'status_update'
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS goals (
+    goal_id TEXT PRIMARY KEY,
+    goal_index INTEGER,
+    asana_goal_gid TEXT,
+    is_new INTEGER NOT NULL DEFAULT 0,
+    {' '.join(f'{step} INTEGER NOT NULL DEFAULT 0,' for step in STEPS)}
+    processed INTEGER NOT NULL DEFAULT 0,
+    payload_hash TEXT,
+    parent_id TEXT,
+    unconfirmed_step TEXT,
+    status_updates_queued INTEGER NOT NULL DEFAULT 0,
+    status_updates_created INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS goals_status_updates_queued
+    ON goals (goal_id) WHERE status_updates_queued = 1;
+'''
+
+
+class GoalState():
+    """GoalState class holding the Asana goal GID, the completed steps of a goal, the ID
+    of the parent goal it was last linked to and the step whose write may have been applied
+    without being confirmed, if any, and recording every newly completed step in the state
+    store right away."""
+
+    def __init__(self, store, goal_id, gid=None, is_new=False, steps=()) -> None:
+        self.store = store
+        self.goal_id = goal_id
+        self.gid = gid
+        self.is_new = is_new
+        self.steps = set(steps)
+        self.parent_id = None
+        self.unconfirmed_step = None
+
+    def complete(self, step, gid, is_new=False):
+        """Records a completed step along with the goal's GID."""
+        self.gid = gid
+        self.is_new = is_new
+        self.steps.add(step)
+        if self.unconfirmed_step == step:
+            self.unconfirmed_step = None
+        self.store.complete_step(self.goal_id, step, self.gid, self.is_new)
+
+    def mark_unconfirmed(self, step):
+        """Records that the write of a step may have been applied without being confirmed,
+        to check whether it was in the next run instead of making it again."""
+        self.unconfirmed_step = step
+        self.store.mark_unconfirmed(self.goal_id, step)
+
+    def finish(self, gid, payload_hash, parent_id=None):
+        """Marks the goal as completely processed."""
+        self.gid = gid
+        self.parent_id = parent_id
+        self.store.finish_goal(self.goal_id, gid, payload_hash, parent_id)
+
+    def unlink(self):
+        """Records that the goal was removed from the parent goal it was linked to."""
+        self.parent_id = None
+        self.store.set_parent_id(self.goal_id, None)
+
+
+class StateStore():
+    """StateStore class to keep the migration state of every goal in a local SQLite
+    database: its Asana goal GID, the steps completed so far, the hash of the goal data
+    it was migrated with and the progress of its status updates backfill.
+    Every change is committed right away in WAL mode, so a crashed run resumes at the
+    exact step it stopped at, and the store can be written to from several threads
+    (sharing a connection) and processes.
+    """
+
+    def __init__(self, file_path=STATE_FILE_PATH, in_memory=False) -> None:
+        self.file_path = file_path
+        # An in-memory state store starts from a copy of the state store on disk,
+        # but never saves any changes, e.g. when planning offline
+        self.in_memory = in_memory
+        self.connection = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        """Opens the state store, creating it if needed. A new state store imports the
+        output CSVs of earlier versions of the migrator, if any."""
+        is_new_store = not os.path.isfile(self.file_path)
+        if self.in_memory:
+            self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+            if not is_new_store:
+                source = sqlite3.connect(self.file_path, timeout=STATE_BUSY_TIMEOUT)
+                try:
+                    source.backup(self.connection)
+                finally:
+                    source.close()
+        else:
+            self.connection = sqlite3.connect(
+                self.file_path, timeout=STATE_BUSY_TIMEOUT, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self._lock, self.connection:
+            self.connection.executescript(SCHEMA)
+            # State stores of earlier versions of the migrator don't know the parent goals
+            # or unconfirmed steps
+            columns = [column[1] for column in self.connection.execute('PRAGMA table_info(goals)')]
+            for column in ['parent_id', 'unconfirmed_step']:
+                if column not in columns:
+                    self.connection.execute(f'ALTER TABLE goals ADD COLUMN {column} TEXT')
+        if is_new_store:
+            self.import_checkpoints()
+
+    def close(self):
+        """Closes the state store."""
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def import_checkpoints(self, processed_file_path=PROCESSED_FILE_PATH,
+                           status_updates_file_path=STATUS_UPDATES_FILE_PATH):
+        """Imports the processed goals and status updates output CSVs, if they exist,
+        marking every processed goal as completed."""
+        processed_rows = [
+            (int(goal_index), goal_id, goal_gid or None, payload_hash or None)
+            for goal_index, goal_id, goal_gid, payload_hash
+            in read_checkpoint_rows(processed_file_path)
+        ]
+        status_updates_rows = [
+            (goal_id, goal_gid or None, int(created_count))
+            for goal_id, goal_gid, created_count
+            in read_checkpoint_rows(status_updates_file_path, STATUS_UPDATES_CHECKPOINT_HEADERS)
+        ]
+        if not processed_rows and not status_updates_rows:
+            return
+        completed_steps = ', '.join(f'{step} = 1' for step in STEPS)
+        with self._lock, self.connection:
+            self.connection.executemany(
+                '''INSERT INTO goals (goal_index, goal_id, asana_goal_gid, payload_hash)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (goal_id) DO UPDATE SET goal_index = excluded.goal_index,
+                    asana_goal_gid = excluded.asana_goal_gid,
+                    payload_hash = excluded.payload_hash''',
+                processed_rows)
+            self.connection.execute(f'UPDATE goals SET processed = 1, {completed_steps}')
+            self.connection.executemany(
+                '''INSERT INTO goals (goal_id, asana_goal_gid, status_updates_queued,
+                    status_updates_created)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT (goal_id) DO UPDATE SET status_updates_queued = 1,
+                    status_updates_created = excluded.status_updates_created''',
+                status_updates_rows)
+        log_info(
+            f'Imported <{len(processed_rows)}> processed goal(s) and <{len(status_updates_rows)}> '
+            f'status updates row(s) into {self.file_path}.'
+        )
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def _execute(self, sql, params=()):
+        with self._lock, self.connection:
+            self.connection.execute(sql, params)
+
+    def get_processed_goal_ids(self):
+        """Gets the set of IDs of the goals that were completely processed."""
+        rows = self._query('SELECT goal_id FROM goals WHERE processed = 1')
+        return {goal_id for goal_id, in rows}
+
+    def get_payload_hashes(self):
+        """Gets a dict of goal ID to the hash of the goal data it was last migrated with.
+        Goals that failed or were processed before hashes were stored are left out."""
+        return dict(self._query(
+            '''SELECT goal_id, payload_hash FROM goals
+            WHERE processed = 1 AND asana_goal_gid IS NOT NULL AND payload_hash IS NOT NULL'''))
+
+    def get_goal_state(self, goal_id):
+        """Gets the GoalState of a goal, or None if it was never processed."""
+        rows = self._query(
+            f'SELECT asana_goal_gid, is_new, parent_id, unconfirmed_step, {", ".join(STEPS)} '
+            'FROM goals WHERE goal_id = ?',
+            (goal_id,))
+        if not rows:
+            return None
+        gid, is_new, parent_id, unconfirmed_step, *completed = rows[0]
+        steps = [step for step, is_completed in zip(STEPS, completed) if is_completed]
+        goal_state = GoalState(self, goal_id, gid, bool(is_new), steps)
+        goal_state.parent_id = parent_id
+        goal_state.unconfirmed_step = unconfirmed_step
+        return goal_state
+
+    def start_goal(self, goal_id, goal_index, parent_id=None, keep_links=False):
+        """Gets the GoalState of a goal about to be processed. A goal that was completely
+        processed before is processed again from the start, while a goal that was only
+        partially processed resumes after its last completed step.
+        With keep_links (e.g. in a sync), a goal processed again that is still aligned to
+        the same parent goal isn't linked to it again, see LINK_STEPS."""
+        reset_steps = ', '.join(
+            f'{step} = CASE WHEN ? AND parent_id IS ? THEN {step} ELSE 0 END'
+            if step in LINK_STEPS else f'{step} = 0'
+            for step in STEPS)
+        link_params = [keep_links, parent_id] * len(LINK_STEPS)
+        self._execute(
+            f'''INSERT INTO goals (goal_id, goal_index) VALUES (?, ?)
+            ON CONFLICT (goal_id) DO UPDATE SET goal_index = excluded.goal_index,
+                {reset_steps}, is_new = 0, processed = 0 WHERE processed = 1''',
+            (goal_id, goal_index, *link_params))
+        return self.get_goal_state(goal_id)
+
+    def complete_step(self, goal_id, step, gid=None, is_new=False):
+        """Records a completed step of a goal, along with its GID.
+        The step is no longer unconfirmed, if it was."""
+        self._execute(
+            f'''UPDATE goals SET {step} = 1, asana_goal_gid = ?, is_new = is_new OR ?,
+                unconfirmed_step = NULLIF(unconfirmed_step, ?)
+            WHERE goal_id = ?''',
+            (gid, is_new, step, goal_id))
+
+    def finish_goal(self, goal_id, gid, payload_hash, parent_id=None):
+        """Marks a goal as completely processed with the hash of its goal data and the
+        ID of the parent goal it is linked to, if any.
+        Newly created goals are queued for their status updates to be backfilled."""
+        self._execute(
+            '''UPDATE goals SET processed = 1, asana_goal_gid = ?, payload_hash = ?, parent_id = ?,
+                status_updates_queued = status_updates_queued OR (is_new AND ? IS NOT NULL)
+            WHERE goal_id = ?''',
+            (gid, payload_hash if gid else None, parent_id, gid, goal_id))
+
+    def mark_unconfirmed(self, goal_id, step):
+        """Records the step of a goal (see STEPS and STEP_STATUS_UPDATE) whose write may
+        have been applied without being confirmed, until the step is completed."""
+        self._execute('UPDATE goals SET unconfirmed_step = ? WHERE goal_id = ?', (step, goal_id))
+
+    def get_unconfirmed_goal_ids(self, step):
+        """Gets the set of IDs of the goals whose write of the given step is unconfirmed."""
+        rows = self._query('SELECT goal_id FROM goals WHERE unconfirmed_step = ?', (step,))
+        return {goal_id for goal_id, in rows}
+
+    def set_parent_id(self, goal_id, parent_id):
+        """Records the ID of the parent goal a goal is linked to, or None once it was
+        removed from it."""
+        self._execute('UPDATE goals SET parent_id = ? WHERE goal_id = ?', (parent_id, goal_id))
+
+    def get_goals_to_backfill(self):
+        """Gets a dict of goal ID to the Asana goal GID and the number of its status updates
+        created so far, for every goal queued for its status updates to be backfilled."""
+        rows = self._query(
+            '''SELECT goal_id, asana_goal_gid, status_updates_created FROM goals
+            WHERE status_updates_queued = 1''')
+        return {goal_id: (gid, created_count) for goal_id, gid, created_count in rows}
+
+    def set_status_updates_created(self, goal_id, created_count):
+        """Records the number of status updates created for a goal so far, which confirms
+        its last status update if it was unconfirmed."""
+        self._execute(
+            '''UPDATE goals SET status_updates_created = ?,
+                unconfirmed_step = NULLIF(unconfirmed_step, ?)
+            WHERE goal_id = ?''',
+            (created_count, STEP_STATUS_UPDATE, goal_id))
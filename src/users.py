@@ -3,6 +3,7 @@
 import os
 import pandas as pd
 from auth import client as asana_client
+from pagination import iterate_items, DEFAULT_PAGE_SIZE
 
 WORKSPACE_GID = os.getenv('WORKSPACE_GID')
 
@@ -20,27 +21,13 @@ def get_members_data():
     return formatted_members_data
 
 
-def get_all_users():
+def get_all_users(page_size=DEFAULT_PAGE_SIZE):
     """A helper method to get all users for the given workspace.
     Note this is utilizes the Asana API's pagination scheme and makes multiple
     calls to get all users in the workspace.
     API Reference: https://developers.asana.com/reference/getusers"""
-    offset = None
     params = {
         'opt_fields': 'gid,email,name',
         'workspace': WORKSPACE_GID,
     }
-    data = []
-    while True:
-        result = asana_client.users.get_users(
-            params, offset=offset, full_payload=True, limit=100, iterator_type=None, opt_pretty=True)
-        data += result['data']
-        if 'next_page' in result and result['next_page'] is not None:
-            offset = result['next_page']['offset']
-        else:
-            break
-    return data
-
-
-# Constant variables to export and use throughout
-MEMBERS_MAPPINGS = get_members_data()
+    return iterate_items(asana_client.users.get_users, params, page_size)
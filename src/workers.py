@@ -0,0 +1,143 @@
+""" workers.py file for helpers to run work concurrently on a pool of worker threads."""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED
+from metrics import metrics
+
+# Number of results a pipeline stage can get ahead of the stage consuming them
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '100'))
+# Seconds between checks of a blocked stage whether its consumer stopped
+STAGE_POLL_INTERVAL = 0.1
+# Marks the end of the results of a pipeline stage
+_STAGE_END = object()
+
+
+def run_bounded(executor, func, items, max_pending):
+    """Submits func for every item to the executor and yields the results as they
+    complete, while keeping at most max_pending items in flight. Items are only
+    pulled from the (possibly lazy) iterable once there is room for them.
+    """
+    pending = set()
+    for item in items:
+        pending.add(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    for future in as_completed(pending):
+        yield future.result()
+
+
+class StageError():
+    """StageError class passing an exception raised in a pipeline stage on to its consumer."""
+
+    def __init__(self, error) -> None:
+        self.error = error
+
+
+def run_stage(name, items, func=None, queue_size=PIPELINE_QUEUE_SIZE, expand=False):
+    """Runs a stage of a pipeline in a thread of its own: pulls every item from the
+    (possibly lazy) iterable, applies func to it, if any, and yields the results in order.
+    Without func, the stage is the iterable itself, e.g. a file being read.
+    With expand, every result is a list whose items are yielded one by one.
+    At most queue_size results wait for the consumer, so a stage can run ahead of a slower
+    stage but is blocked (backpressure) once the queue is full. The number of results and
+    the time spent busy, waiting for items and blocked by the consumer are recorded in the
+    metrics. Exceptions are raised again in the consumer.
+    Returns a generator yielding the results.
+    """
+    results = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+    # Register the stage right away, so the stages are reported in the order of the pipeline
+    metrics.record_stage(name, 0, 0.0)
+
+    def put(result):
+        while not stopped.is_set():
+            try:
+                results.put(result, timeout=STAGE_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        count = 0
+        busy_seconds = waiting_seconds = blocked_seconds = 0.0
+        try:
+            iterator = iter(items)
+            while True:
+                started_at = time.perf_counter()
+                item = next(iterator, _STAGE_END)
+                fetched_at = time.perf_counter()
+                if func:
+                    waiting_seconds += fetched_at - started_at
+                else:
+                    # The first stage does its work in the iterable itself, e.g. reading a file
+                    busy_seconds += fetched_at - started_at
+                if item is _STAGE_END:
+                    break
+                result = func(item) if func else item
+                processed_at = time.perf_counter()
+                busy_seconds += processed_at - fetched_at
+                for output in (result if expand else [result]):
+                    if not put(output):
+                        return
+                    count += 1
+                blocked_seconds += time.perf_counter() - processed_at
+            put(_STAGE_END)
+        except Exception as ex:  # pylint: disable=broad-except
+            put(StageError(ex))
+        finally:
+            metrics.record_stage(name, count, busy_seconds, waiting_seconds, blocked_seconds)
+
+    def iterate_results():
+        try:
+            while True:
+                result = results.get()
+                if result is _STAGE_END:
+                    return
+                if isinstance(result, StageError):
+                    raise result.error
+                yield result
+        finally:
+            stopped.set()
+
+    # The stage starts running ahead right away, not once its first result is needed
+    threading.Thread(target=run, name=f'stage-{name}', daemon=True).start()
+    return iterate_results()
+
+
+def timed_stage(name, func, workers=1):
+    """Wraps func to record every call as an item of a pipeline stage run by a pool of
+    worker threads, e.g. the writer pool, along with the time spent in it."""
+    def run(item):
+        started_at = time.perf_counter()
+        try:
+            return func(item)
+        finally:
+            metrics.record_stage(name, 1, time.perf_counter() - started_at, workers=workers)
+    metrics.record_stage(name, 0, 0.0, workers=workers)
+    return run
+
+
+def consume_stage(name, items):
+    """Yields the items to the final stage of a pipeline, e.g. the checkpoint sink,
+    recording the time spent waiting for every item and handling it."""
+    count = 0
+    busy_seconds = waiting_seconds = 0.0
+    iterator = iter(items)
+    try:
+        while True:
+            started_at = time.perf_counter()
+            item = next(iterator, _STAGE_END)
+            fetched_at = time.perf_counter()
+            waiting_seconds += fetched_at - started_at
+            if item is _STAGE_END:
+                return
+            yield item
+            count += 1
+            busy_seconds += time.perf_counter() - fetched_at
+    finally:
+        metrics.record_stage(name, count, busy_seconds, waiting_seconds)
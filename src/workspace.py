@@ -0,0 +1,254 @@
+""" workspace.py file to lazily load and cache the Asana workspace data used by the migrator."""
+# pylint: disable=maybe-no-member
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logger import log_info, log_error
+from users import get_all_users, get_members_data
+from indexes import WorkspaceGoalIndex, OwnerResolver, TimePeriodIndex
+from auth import client as asana_client
+from pagination import iterate_items, DEFAULT_PAGE_SIZE
+
+WORKSPACE_GID = os.getenv('WORKSPACE_GID')
+WORKSPACE_CACHE_DIR = os.getenv('WORKSPACE_CACHE_DIR', './workspace_cache')
+# Number of seconds a cached workspace dataset stays valid for
+WORKSPACE_CACHE_TTL = int(os.getenv('WORKSPACE_CACHE_TTL', '3600'))
+
+
+def get_all_time_periods(start_on='', end_on='', page_size=DEFAULT_PAGE_SIZE):
+    """Gets all time periods existing in the workspace, page by page
+    API Reference: https://developers.asana.com/reference/gettimeperiods
+    """
+    params = {'workspace': WORKSPACE_GID}
+    if start_on:
+        params['start_on'] = start_on
+    if end_on:
+        params['end_on'] = end_on
+    return iterate_items(asana_client.time_periods.get_time_periods, params, page_size)
+
+
+def get_all_goals(page_size=DEFAULT_PAGE_SIZE):
+    """Gets all the goals existing in the workspace, page by page
+    API Reference: https://developers.asana.com/reference/getgoals
+    """
+    params = {
+        'workspace': WORKSPACE_GID,
+        'opt_fields': 'notes'
+    }
+    return iterate_items(asana_client.goals.get_goals, params, page_size)
+
+
+def get_content_hash(data):
+    """Gets a stable hash of JSON serializable data to validate cached content."""
+    content = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class WorkspaceContext():
+    """WorkspaceContext class to lazily load the workspace users, time periods and goals
+    on first use. Each dataset is cached on disk per workspace so repeated and resumed
+    runs don't have to crawl the Asana API again until the cache expires.
+    Without a cache directory, nothing is read from or written to disk.
+    """
+
+    def __init__(self, workspace_gid, cache_dir=WORKSPACE_CACHE_DIR,
+                 cache_ttl=WORKSPACE_CACHE_TTL) -> None:
+        self.workspace_gid = workspace_gid
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.refresh_cache = False
+        self.page_size = DEFAULT_PAGE_SIZE
+        self._datasets = {}
+        # The cached datasets to fetch again in this run, see expire
+        self._expired = set()
+        self._goal_index = None
+        self._owner_resolver = None
+        self._time_period_index = None
+        self._lock = threading.Lock()
+        self._dataset_locks = {}
+
+    @property
+    def users(self):
+        """All the users in the workspace."""
+        return self._get_dataset('users', lambda: get_all_users(page_size=self.page_size))
+
+    @property
+    def time_periods(self):
+        """All the time periods in the workspace."""
+        return self._get_dataset(
+            'time_periods', lambda: get_all_time_periods(page_size=self.page_size))
+
+    @property
+    def members_mappings(self):
+        """The member email to name mappings from the members.csv export."""
+        with self._get_dataset_lock('members'):
+            if 'members' not in self._datasets:
+                self._datasets['members'] = get_members_data()
+            return self._datasets['members']
+
+    @property
+    def time_period_index(self):
+        """The index of the time periods by dates and display name, built once on first use."""
+        with self._get_dataset_lock('time_period_index'):
+            if self._time_period_index is None:
+                self._time_period_index = TimePeriodIndex(self.time_periods)
+            return self._time_period_index
+
+    @property
+    def owner_resolver(self):
+        """The resolver of goal owners to workspace user GIDs, built once on first use."""
+        with self._get_dataset_lock('owner_resolver'):
+            if self._owner_resolver is None:
+                self._owner_resolver = OwnerResolver(self.members_mappings, self.users)
+            return self._owner_resolver
+
+    @property
+    def goal_index(self):
+        """The index of all the goals in the workspace by their Ally reference ID.
+        Goals created in previous runs since the goals were cached are replayed
+        from the cache journal. Goals are indexed as each page arrives."""
+        with self._get_dataset_lock('goal_index'):
+            if self._goal_index is None:
+                goal_index = WorkspaceGoalIndex()
+                self._get_dataset(
+                    'goals', lambda: get_all_goals(page_size=self.page_size),
+                    on_item=lambda goal: goal_index.add(goal['gid'], goal['notes']))
+                for goal in self._read_goals_journal():
+                    goal_index.add(goal['gid'], goal['notes'])
+                # Only the index is needed from here on, not the goals' notes
+                self._datasets.pop('goals', None)
+                self._goal_index = goal_index
+            return self._goal_index
+
+    def prefetch(self):
+        """Loads the workspace users, time periods and goals concurrently
+        instead of one after another on first use."""
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(lambda: self.users),
+                executor.submit(lambda: self.time_periods),
+                executor.submit(lambda: self.goal_index),
+            ]
+            for future in futures:
+                future.result()
+
+    def add_goal(self, goal_gid, notes):
+        """Adds a newly created goal to the goal index and the cache journal
+        so the cached goals stay in sync with the workspace."""
+        goal_index = self.goal_index
+        goal_index.add(goal_gid, notes)
+        if not goal_gid or not self.cache_dir:
+            return
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            journal_path = self._get_cache_path('goals_journal', 'jsonl')
+            with open(journal_path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps({'gid': goal_gid, 'notes': notes}) + '\n')
+
+    def expire(self, name):
+        """Expires a dataset loaded or cached so far, e.g. the goals when a goal may have been
+        created by a request whose response was lost, so it is fetched again on first use."""
+        with self._get_dataset_lock(name):
+            self._expired.add(name)
+            self._datasets.pop(name, None)
+        if name == 'goals':
+            with self._get_dataset_lock('goal_index'):
+                self._goal_index = None
+
+    def _get_dataset(self, name, fetch, on_item=None):
+        """Gets a dataset from memory, the disk cache or by fetching it.
+        An optional on_item callback is called for every item as it is loaded."""
+        with self._get_dataset_lock(name):
+            if name not in self._datasets:
+                data = self._read_cache(name)
+                if data is None:
+                    log_info(f'Loading workspace {name}.')
+                    data = []
+                    for item in fetch():
+                        data.append(item)
+                        if on_item:
+                            on_item(item)
+                    self._write_cache(name, data)
+                elif on_item:
+                    for item in data:
+                        on_item(item)
+                self._datasets[name] = data
+            return self._datasets[name]
+
+    def _get_dataset_lock(self, name):
+        """Gets the lock for a dataset so different datasets can load at the same time."""
+        with self._lock:
+            return self._dataset_locks.setdefault(name, threading.Lock())
+
+    def _get_cache_path(self, name, extension='json'):
+        return os.path.join(self.cache_dir, f'{self.workspace_gid}_{name}.{extension}')
+
+    def _read_cache(self, name):
+        """Reads a cached dataset if it exists, hasn't expired and its content is intact."""
+        if self.refresh_cache or not self.cache_dir or name in self._expired:
+            return None
+        cache_path = self._get_cache_path(name)
+        if not os.path.isfile(cache_path):
+            return None
+        try:
+            with open(cache_path, encoding='utf-8') as file:
+                cache = json.load(file)
+        except (OSError, ValueError) as ex:
+            log_error(f'Could not read the workspace {name} cache: {ex}')
+            return None
+
+        is_expired = time.time() - cache.get('fetched_at', 0) > self.cache_ttl
+        is_valid = (
+            cache.get('workspace_gid') == self.workspace_gid
+            and cache.get('hash') == get_content_hash(cache.get('data'))
+        )
+        if is_expired or not is_valid:
+            return None
+        log_info(f'Loaded <{len(cache["data"])}> workspace {name} from cache.')
+        return cache['data']
+
+    def _write_cache(self, name, data):
+        """Writes a dataset to the cache. Writing to a temporary file first
+        prevents a crash from leaving a partially written cache behind."""
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_path = self._get_cache_path(name)
+        temp_path = f'{cache_path}.tmp'
+        cache = {
+            'workspace_gid': self.workspace_gid,
+            'fetched_at': time.time(),
+            'hash': get_content_hash(data),
+            'data': data,
+        }
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(cache, file)
+        os.replace(temp_path, cache_path)
+
+        # Freshly fetched goals already include every previously journaled goal
+        if name == 'goals':
+            journal_path = self._get_cache_path('goals_journal', 'jsonl')
+            if os.path.isfile(journal_path):
+                os.remove(journal_path)
+
+    def _read_goals_journal(self):
+        if not self.cache_dir:
+            return []
+        journal_path = self._get_cache_path('goals_journal', 'jsonl')
+        if not os.path.isfile(journal_path):
+            return []
+        goals = []
+        with open(journal_path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    goals.append(json.loads(line))
+                except ValueError:
+                    continue  # skip a partially written line from a crashed run
+        return goals
+
+
+# Shared workspace context to export and use throughout
+workspace = WorkspaceContext(WORKSPACE_GID)
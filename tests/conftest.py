@@ -0,0 +1,93 @@
+""" conftest.py file to import the migrator modules in the tests like the migrator does."""
+# pylint: disable=wrong-import-position
+import os
+import csv
+import sys
+import weakref
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+sys.path[:0] = [
+    REPO_DIR, os.path.join(REPO_DIR, 'src'), os.path.join(REPO_DIR, 'utils'),
+    os.path.join(REPO_DIR, 'bench'),
+]
+# The logger writes to the output_logs directory of the working directory
+os.makedirs('./output_logs', exist_ok=True)
+# The migrator reads its settings on import, the tests run against the mock Asana API
+for name, value in {
+        'ASANA_TOKEN': 'test', 'WORKSPACE_GID': '1', 'SUPER_ADMIN_GID': 'u1',
+        'ASANA_RATE_LIMIT': '0', 'OAUTHLIB_INSECURE_TRANSPORT': '1'}.items():
+    os.environ.setdefault(name, value)
+# pylint: enable=wrong-import-position
+import pytest
+from mock_asana import MockAsanaState, MockAsanaServer
+import mappings
+from goal_record import GoalRecord
+
+# The values of a goal row for the columns a test doesn't set
+GOAL_ROW_DEFAULTS = {
+    'Title': 'Test Goal',
+    'OKR type': 'Team',
+    'Creator': 'Ada Admin',
+    'Period': 'Q1 2024',
+    'Start Date': '2024-01-01',
+    'End Date': '2024-03-31',
+    'Target': '100.0',
+    'Start': '0.0',
+    'Progress %': '50.0',
+    'Status': 'On Track',
+}
+
+
+@pytest.fixture
+def mock_asana(monkeypatch):
+    """Runs the mock Asana API with a single user and time period, and points the Asana
+    client and a fresh workspace context (without a disk cache) at it.
+    Yields the MockAsanaState to add goals, faults and check the writes made."""
+    # pylint: disable=import-outside-toplevel,unnecessary-dunder-call
+    # The modules share the workspace context, so it is reset in place
+    from auth import client as asana_client
+    from workspace import workspace
+
+    state = MockAsanaState(
+        users=[{'gid': 'u1', 'name': 'Ada Admin', 'email': 'ada@example.com'}],
+        time_periods=[{
+            'gid': 'tp1', 'display_name': 'Q1 FY24', 'period': 'Q1',
+            'start_on': '2024-01-01', 'end_on': '2024-03-31',
+        }],
+        retry_after=0.01)
+    with MockAsanaServer(state) as server:
+        monkeypatch.setitem(asana_client.options, 'base_url', server.base_url)
+        # Retries of transient errors back off for a few milliseconds instead of seconds
+        monkeypatch.setattr(asana_client, 'RETRY_DELAY', 0.01)
+        workspace.__init__(workspace.workspace_gid, cache_dir=None)
+        yield state
+    workspace.__init__(workspace.workspace_gid, cache_dir=None)
+
+
+@pytest.fixture
+def goals_csv(tmp_path, monkeypatch):
+    """Runs the test in a temporary working directory with a members.csv, and gets a function
+    writing the given goal rows (dicts of CSV column values, with a list of check-in cell
+    values as 'Checkins') as its goals.csv like the Ally export. The function returns
+    the goals.csv file path."""
+    monkeypatch.chdir(tmp_path)
+    # Records still referenced by an earlier test (e.g. its failure) aren't reused
+    monkeypatch.setattr(GoalRecord, '_interned', weakref.WeakValueDictionary())
+    os.makedirs('./output_logs', exist_ok=True)
+    with open('./members.csv', 'w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows([['Name', 'Email Address'], ['Ada Admin', 'ada@example.com']])
+
+    def write_goals_csv(*rows):
+        first_checkin_column = mappings.CSV_COLUMN_NAMES.index('Checkins')
+        with open('./goals.csv', 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(mappings.CSV_COLUMN_NAMES)
+            for row in rows:
+                row = {**GOAL_ROW_DEFAULTS, **row}
+                values = [row.get(column, '') for column in mappings.CSV_COLUMN_NAMES]
+                checkins = row.get('Checkins') or ['']
+                values[first_checkin_column:first_checkin_column + len(checkins)] = checkins
+                writer.writerow(values)
+        return './goals.csv'
+    return write_goals_csv
@@ -0,0 +1,63 @@
+""" test_backfill.py file to test backfilling the status updates of the created goals."""
+from concurrent.futures import ThreadPoolExecutor
+from backfill import backfill_status_updates
+from state import StateStore, STEP_CREATED
+
+
+def get_checkin(day, status):
+    """Gets a check-in cell value of the goals CSV on the given day of January 2024."""
+    return (
+        f'[2024-01-{day:02} 10:00:00 UTC] Status: {status}\nNote: Day {day}\n'
+        'Metric Name: Progress')
+
+
+def queue_goal(state_store, goal_id, gid, created_count=0):
+    """Records a newly created goal, which queues it to be backfilled."""
+    state_store.start_goal(goal_id, int(goal_id))
+    state_store.complete_step(goal_id, STEP_CREATED, gid, is_new=True)
+    state_store.finish_goal(goal_id, gid, 'hash')
+    state_store.set_status_updates_created(goal_id, created_count)
+
+
+def backfill(state_store, goal_ids=None):
+    """Backfills the status updates of the queued goals with two worker threads."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        backfill_status_updates(executor, './goals.csv', state_store, 4, goal_ids)
+
+
+def test_backfill(mock_asana, goals_csv):
+    """The status updates of every queued goal are created in timestamp order."""
+    goals_csv(
+        {'Id': '1', 'Checkins': [get_checkin(3, 'Behind'), get_checkin(2, 'At Risk')]},
+        {'Id': '2', 'Checkins': [get_checkin(1, 'On Track')]},
+        {'Id': '3', 'Checkins': [get_checkin(1, 'On Track')]},
+    )
+    with StateStore() as state_store:
+        queue_goal(state_store, '1', 'g1')
+        queue_goal(state_store, '2', 'g2')
+        backfill(state_store)
+
+        status_updates = [
+            (status_update['parent'], status_update['status_type'])
+            for status_update in mock_asana.status_updates
+        ]
+        assert sorted(status_updates) == [
+            ('g1', 'at_risk'), ('g1', 'off_track'), ('g2', 'on_track')]
+        assert status_updates.index(('g1', 'at_risk')) < status_updates.index(('g1', 'off_track'))
+        assert state_store.get_goals_to_backfill() == {'1': ('g1', 2), '2': ('g2', 1)}
+
+
+def test_resume(mock_asana, goals_csv):
+    """Status updates created before are skipped, and only the given goals are backfilled."""
+    goals_csv(
+        {'Id': '1', 'Checkins': [get_checkin(3, 'Behind'), get_checkin(2, 'At Risk')]},
+        {'Id': '2', 'Checkins': [get_checkin(1, 'On Track')]},
+    )
+    with StateStore() as state_store:
+        queue_goal(state_store, '1', 'g1', created_count=1)
+        queue_goal(state_store, '2', 'g2')
+        backfill(state_store, goal_ids={'1'})
+    assert [
+        (status_update['parent'], status_update['status_type'])
+        for status_update in mock_asana.status_updates
+    ] == [('g1', 'off_track')]
@@ -0,0 +1,75 @@
+""" test_batching.py file to test packing the small writes into batch requests."""
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from auth import client as asana_client
+from batching import BatchWriter
+from rate_limiting import UnconfirmedWriteError
+
+# The writes of three goals, sent together in a single batch request
+WRITES = (
+    ('put', '/goals/g1', {'owner': 'u1'}),
+    ('post', '/goals/g2/setMetric', {'progress_source': 'manual'}),
+    ('post', '/status_updates', {'parent': 'g3', 'title': 'Status Update'}),
+)
+
+
+def write_all(writes=WRITES):
+    """Makes the writes from a worker thread each with a batch writer for as many threads,
+    and gets the result or the error of every write."""
+    batch_writer = BatchWriter(asana_client, linger=1.0)
+    batch_writer.configure(len(writes), len(writes))
+
+    def write(method, path, data):
+        try:
+            return batch_writer.write(method, path, data)
+        except UnconfirmedWriteError as ex:
+            return ex
+    with ThreadPoolExecutor(max_workers=len(writes)) as executor:
+        return list(executor.map(lambda item: write(*item), writes))
+
+
+def test_batch(mock_asana):
+    """The writes are sent in a single batch request, and every write gets its own result."""
+    results = write_all()
+    assert mock_asana.request_counts['POST /batch'] == 1
+    assert sorted(mock_asana.writes) == sorted(
+        (method.upper(), path, data) for method, path, data in WRITES)
+    assert results[0]['gid'] == 'g1'
+    assert results[2]['parent'] == 'g3'
+
+
+def test_retry_failed_actions(mock_asana):
+    """Actions that fail in a batch request are retried on their own, while the actions that
+    aren't idempotent aren't retried if they may have been applied."""
+    mock_asana.add_fault('PUT /goals/{gid}', 500)
+    mock_asana.add_fault('POST /goals/{gid}/setMetric', 429, headers={'Retry-After': '0.01'})
+    mock_asana.add_fault('POST /status_updates', 503)
+    results = write_all()
+    assert mock_asana.request_counts['POST /batch'] == 1
+    assert mock_asana.request_counts['PUT /goals/{gid}'] == 2
+    assert mock_asana.request_counts['POST /goals/{gid}/setMetric'] == 2
+    assert mock_asana.request_counts['POST /status_updates'] == 1
+    assert results[0]['gid'] == 'g1'
+    assert isinstance(results[2], UnconfirmedWriteError)
+    assert results[2].endpoint == 'POST /status_updates'
+    assert len(mock_asana.status_updates) == 1
+
+
+@pytest.mark.parametrize('status_code, is_applied', [(429, False), (500, True)])
+def test_failed_batch_request(mock_asana, status_code, is_applied):
+    """A failed batch request isn't sent again: its actions are retried on their own,
+    or only its idempotent actions if it may have been applied."""
+    mock_asana.add_fault(
+        'POST /batch', status_code, applied=is_applied, headers={'Retry-After': '0.01'})
+    results = write_all()
+    assert mock_asana.request_counts['POST /batch'] == 1
+    assert mock_asana.request_counts['PUT /goals/{gid}'] == (2 if is_applied else 1)
+    assert isinstance(results[2], UnconfirmedWriteError) == is_applied
+    assert len(mock_asana.status_updates) == 1
+
+
+def test_write_one(mock_asana):
+    """A write that isn't batched only sends its own data."""
+    write_all(WRITES[:1])
+    assert mock_asana.request_counts['POST /batch'] == 0
+    assert mock_asana.writes == [('PUT', '/goals/g1', {'owner': 'u1'})]
@@ -0,0 +1,69 @@
+""" test_dry_run.py file to test planning the migration offline."""
+import json
+from auth import client as asana_client
+from dry_run import DryRunSession
+import migrator
+from options import MigrationOptions
+
+
+def write_snapshots(snapshot_dir):
+    """Writes the snapshots of a workspace with a goal of Ally ID 1 and a cached user."""
+    snapshot_dir.mkdir()
+    (snapshot_dir / 'goals.json').write_text(json.dumps(
+        [{'gid': 'g1', 'notes': '[Ref: Ally Id: 1]\n\n'}]), encoding='utf-8')
+    (snapshot_dir / 'users.json').write_text(json.dumps(
+        {'data': [{'gid': 'u1', 'name': 'Ada Admin', 'email': 'ada@example.com'}]}),
+        encoding='utf-8')
+    (snapshot_dir / 'time_periods.json').write_text(json.dumps([{
+        'gid': 'tp1', 'display_name': 'Q1 FY24',
+        'start_on': '2024-01-01', 'end_on': '2024-03-31',
+    }]), encoding='utf-8')
+
+
+def test_session(tmp_path):
+    """Snapshots are served page by page and writes get planned GIDs, while every request
+    is recorded with the goal ID it is made for."""
+    write_snapshots(tmp_path / 'snapshots')
+    session = DryRunSession(str(tmp_path / 'snapshots'))
+    page = session.get('https://app.asana.com/api/1.0/goals', params={'limit': 1}).json()
+    assert page == {'data': [{'gid': 'g1', 'notes': '[Ref: Ally Id: 1]\n\n'}], 'next_page': None}
+
+    session.put('https://app.asana.com/api/1.0/goals/g1', data=json.dumps({'data': {}}))
+    created = session.post('https://app.asana.com/api/1.0/goals', data=json.dumps(
+        {'data': {'notes': '[Ref: Ally Id: 2]\n\n'}})).json()['data']
+    batch = session.post('https://app.asana.com/api/1.0/batch', data=json.dumps({'data': {
+        'actions': [
+            {'method': 'post', 'relative_path': '/status_updates', 'data': {'parent': 'g1'}},
+            {'method': 'post', 'relative_path': f'/goals/{created["gid"]}/setMetric'},
+        ]}})).json()['data']
+    assert [result['status_code'] for result in batch] == [200, 200]
+    assert [
+        (operation['endpoint'], operation['goal_id'], operation.get('batch'))
+        for operation in session.operations
+    ] == [
+        ('GET /goals', None, None),
+        ('PUT /goals/{gid}', '1', None),
+        ('POST /goals', None, None),
+        ('POST /status_updates', '1', 1),
+        ('POST /goals/{gid}/setMetric', '2', 1),
+    ]
+
+
+def test_plan(mock_asana, goals_csv, tmp_path, monkeypatch):
+    """Planning sends no requests and leaves the state store unchanged, but writes every
+    request that would be made to the API plan."""
+    monkeypatch.setattr(asana_client, 'session', asana_client.session)
+    monkeypatch.setattr(asana_client, 'bucket', asana_client.bucket)
+    write_snapshots(tmp_path / 'snapshots')
+    goals_csv({'Id': '1'}, {'Id': '2', 'Aligned To (weight, Objective ID)': 'Id: 1'})
+    migrator.main(MigrationOptions(snapshot_dir=str(tmp_path / 'snapshots')))
+
+    assert not mock_asana.request_counts
+    assert not (tmp_path / 'migration_state.db').exists()
+    with open('./api_plan.jsonl', encoding='utf-8') as file:
+        operations = [json.loads(line) for line in file]
+    assert [operation['endpoint'] for operation in operations if operation['method'] != 'GET'] == [
+        'PUT /goals/{gid}', 'POST /goals/{gid}/setMetric', 'PUT /goals/{gid}',
+        'POST /goals', 'POST /goals/{gid}/setMetric', 'PUT /goals/{gid}',
+        'POST /goals/{gid}/addSupportingRelationship',
+    ]
@@ -0,0 +1,35 @@
+""" test_goal.py file to test the Asana API requests made for a goal."""
+from goal import Goal
+from goal_record import GoalRecord
+import goal as goal_module
+
+
+def get_goal(**data):
+    """Gets a goal created in Asana with the given goal data."""
+    goal = Goal(GoalRecord({'id': '1', 'name': 'Grow revenue', **data}))
+    goal.gid = 'g1'
+    return goal
+
+
+def test_create_goal_metric(monkeypatch):
+    """A manual goal metric is set with the percentages of the goal as numbers."""
+    writes = []
+    monkeypatch.setattr(
+        goal_module.batch_writer, 'write', lambda *write: writes.append(write) or {'gid': 'g1'})
+    goal = get_goal(initial_number_value='10.0', current_number_value='50.0',
+                    target_number_value='100.0')
+    goal.create_goal_metric()
+    assert writes == [('post', '/goals/g1/setMetric', {
+        'progress_source': 'manual', 'precision': 1, 'unit': 'percentage',
+        'initial_number_value': 0.1, 'current_number_value': 0.5, 'target_number_value': 1.0,
+    })]
+
+
+def test_create_parent_goal_metric(monkeypatch):
+    """A parent goal's metric tracks the progress of its subgoals without numbers."""
+    writes = []
+    monkeypatch.setattr(
+        goal_module.batch_writer, 'write', lambda *write: writes.append(write) or {'gid': 'g1'})
+    get_goal(current_number_value='50.0').create_goal_metric(is_parent_goal=True)
+    assert writes == [('post', '/goals/g1/setMetric', {
+        'progress_source': 'subgoal_progress', 'precision': 1, 'unit': 'percentage'})]
@@ -0,0 +1,32 @@
+""" test_goal_record.py file to test the immutable goal records."""
+import gc
+import pytest
+from goal_record import GoalRecord
+
+
+def test_intern():
+    """The record of a goal is shared by its Ally ID while it is in use."""
+    record = GoalRecord.intern({'id': '1', 'name': 'Grow revenue'})
+    assert GoalRecord.intern({'id': '1', 'name': 'Grow revenue'}) is record
+    assert GoalRecord.intern({'id': '2', 'name': 'Grow revenue'}) is not record
+
+    del record
+    gc.collect()
+    assert GoalRecord.intern({'id': '1', 'name': 'Win deals'}).name == 'Win deals'
+
+
+def test_immutable():
+    """Records can't be changed, and their check-ins are kept as tuples."""
+    record = GoalRecord({'id': '1', 'status_updates': [('On Track', '2024-01-01', 'Notes')]})
+    assert record['status_updates'] == (('On Track', '2024-01-01', 'Notes'),)
+    with pytest.raises(AttributeError):
+        record.name = 'Win deals'
+    with pytest.raises(KeyError):
+        record['gid']  # pylint: disable=pointless-statement
+
+
+def test_payload_hash():
+    """The payload hash changes with any of the goal data."""
+    payload_hash = GoalRecord({'id': '1', 'name': 'Grow revenue'}).get_payload_hash()
+    assert GoalRecord({'id': '1', 'name': 'Grow revenue'}).get_payload_hash() == payload_hash
+    assert GoalRecord({'id': '1', 'name': 'Win deals'}).get_payload_hash() != payload_hash
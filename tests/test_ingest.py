@@ -0,0 +1,23 @@
+""" test_ingest.py file to test streaming and mapping the goals CSV."""
+from ingest import iterate_goal_chunks, iterate_goal_records
+
+
+def test_duplicate_rows(goals_csv):
+    """Duplicate rows are skipped, also when they are in different chunks."""
+    file_path = goals_csv({'Id': '1'}, {'Id': '2'}, {'Id': '1'}, {'Id': '1', 'Title': 'Renamed'})
+    records = list(iterate_goal_records(file_path, chunk_size=2))
+    assert [(index, record.id) for index, record in records] == [(1, '1'), (2, '2'), (4, '1')]
+
+
+def test_blank_values(goals_csv):
+    """Blank cells are read as None rather than NaN."""
+    file_path = goals_csv({'Id': '1', 'Status': ''})
+    chunk = next(iterate_goal_chunks(file_path))
+    assert chunk.loc[1, 'Status'] is None
+
+
+def test_goal_ids(goals_csv):
+    """Given goal IDs, only their rows are read."""
+    file_path = goals_csv({'Id': '1'}, {'Id': '2'}, {'Id': '3'})
+    records = iterate_goal_records(file_path, chunk_size=1, goal_ids={'1', '3'})
+    assert [record.id for _, record in records] == ['1', '3']
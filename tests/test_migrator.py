@@ -0,0 +1,113 @@
+""" test_migrator.py file to test the migration end to end against the mock Asana API."""
+import asana
+import pytest
+import migrator
+from options import MigrationOptions
+
+CHECKIN = '[2024-02-01 10:00:00 UTC] Status: At Risk\nNote: Slow start\nMetric Name: Progress'
+
+
+def test_migrate_goals(mock_asana, goals_csv):
+    """Every goal is created, linked to its parent goal and gets its status updates."""
+    goals_csv(
+        {'Id': '1', 'Title': 'Grow revenue', 'OKR type': 'Organization'},
+        {'Id': '2', 'Title': 'Win deals', 'Aligned To (weight, Objective ID)': 'weight: 1, Id: 1',
+         'Checkins': [CHECKIN]},
+    )
+    migrator.main(MigrationOptions(workers=2))
+
+    created_goals = [data for method, path, data in mock_asana.writes if path == '/goals']
+    assert [data['name'] for data in created_goals] == ['Grow revenue', 'Win deals']
+    assert all(data['time_period'] == 'tp1' for data in created_goals)
+    goal_gids = mock_asana.get_goal_gids()
+    assert mock_asana.relationships == {(goal_gids['1'], goal_gids['2'])}
+    assert [(update['parent'], update['status_type']) for update in mock_asana.status_updates] == [
+        (goal_gids['2'], 'at_risk')]
+
+
+def test_resume(mock_asana, goals_csv):
+    """Goals migrated by a previous run aren't created again."""
+    goals_csv({'Id': '1'}, {'Id': '2'})
+    migrator.main()
+    write_count = len(mock_asana.writes)
+    migrator.main()
+    assert len(mock_asana.writes) == write_count
+
+
+def test_sync_realigned_goal(mock_asana, goals_csv):
+    """A goal aligned to another parent goal in a sync is removed from its previous one."""
+    goals_csv({'Id': '1'}, {'Id': '2'}, {'Id': '3', 'Aligned To (weight, Objective ID)': 'Id: 1'})
+    migrator.main()
+    goals_csv({'Id': '1'}, {'Id': '2'}, {'Id': '3', 'Aligned To (weight, Objective ID)': 'Id: 2'})
+    migrator.main(MigrationOptions(sync=True))
+
+    goal_gids = mock_asana.get_goal_gids()
+    assert mock_asana.relationships == {(goal_gids['2'], goal_gids['3'])}
+    assert mock_asana.request_counts['POST /goals/{gid}/removeSupportingRelationship'] == 1
+
+    goals_csv({'Id': '1'}, {'Id': '2'}, {'Id': '3'})
+    migrator.main(MigrationOptions(sync=True))
+    assert mock_asana.relationships == set()
+
+
+def test_resume_failed_step(mock_asana, goals_csv):
+    """A run that failed after creating a goal resumes at the step it failed at."""
+    goals_csv({'Id': '1'})
+    mock_asana.add_fault('PUT /goals/{gid}', 400, applied=False)
+    with pytest.raises(asana.error.InvalidRequestError):
+        migrator.main()
+    migrator.main()
+    assert mock_asana.request_counts['POST /goals'] == 1
+    assert mock_asana.request_counts['POST /goals/{gid}/setMetric'] == 1
+    assert mock_asana.request_counts['PUT /goals/{gid}'] == 2
+    assert [data['owner'] for method, _, data in mock_asana.writes if method == 'PUT'] == ['u1']
+
+
+@pytest.mark.parametrize('applied', [True, False])
+def test_resume_unconfirmed_goal(mock_asana, goals_csv, applied):
+    """A goal whose creation failed on the Asana side isn't retried, the run carries on with
+    the other goals, and the next run only creates it again if it wasn't created."""
+    goals_csv({'Id': '1', 'Checkins': [CHECKIN]}, {'Id': '2'})
+    mock_asana.add_fault('POST /goals', 500, applied=applied)
+    migrator.main()
+    assert mock_asana.request_counts['POST /goals'] == 2
+    assert set(mock_asana.get_goal_gids()) == ({'1', '2'} if applied else {'2'})
+
+    migrator.main()
+    assert mock_asana.request_counts['POST /goals'] == (2 if applied else 3)
+    goal_gids = mock_asana.get_goal_gids()
+    assert len(mock_asana.collections['/goals']) == 2
+    assert [update['parent'] for update in mock_asana.status_updates] == [goal_gids['1']]
+
+
+@pytest.mark.parametrize('applied', [True, False])
+def test_resume_unconfirmed_link(mock_asana, goals_csv, applied):
+    """A goal whose link to its parent goal failed on the Asana side is only linked again
+    in the next run if it wasn't linked."""
+    goals_csv({'Id': '1'}, {'Id': '2', 'Aligned To (weight, Objective ID)': 'Id: 1'})
+    mock_asana.add_fault('POST /goals/{gid}/addSupportingRelationship', 500, applied=applied)
+    migrator.main()
+    migrator.main()
+    goal_gids = mock_asana.get_goal_gids()
+    assert mock_asana.relationships == {(goal_gids['1'], goal_gids['2'])}
+    assert mock_asana.request_counts['POST /goals/{gid}/addSupportingRelationship'] == (
+        1 if applied else 2)
+    assert mock_asana.request_counts['GET /goals/{gid}/parentGoals'] == 1
+
+
+@pytest.mark.parametrize('applied', [True, False])
+def test_resume_unconfirmed_status_update(mock_asana, goals_csv, monkeypatch, applied):
+    """A status update whose response timed out isn't retried, and is only created again
+    in the next run if it wasn't created."""
+    # pylint: disable=import-outside-toplevel
+    from auth import client as asana_client
+    monkeypatch.setitem(asana_client.options, 'timeout', (1, 0.2))
+    goals_csv({'Id': '1', 'Checkins': [CHECKIN]})
+    # The mock API only fails the request once the client timed out
+    mock_asana.add_fault('POST /status_updates', 500, delay=0.5, applied=applied)
+    migrator.main()
+    assert len(mock_asana.status_updates) == (1 if applied else 0)
+
+    migrator.main()
+    assert len(mock_asana.status_updates) == 1
+    assert mock_asana.request_counts['POST /status_updates'] == (1 if applied else 2)
@@ -0,0 +1,78 @@
+""" test_parsers.py file to test the check-in tokenizer against the patterns it replaces."""
+import re
+import random
+import pytest
+import parsers
+
+# The pattern strings earlier versions of the migrator searched every check-in with
+LEGACY_STATUS_PATTERN = r'Status:\s(.*)'
+LEGACY_TIMESTAMP_PATTERN = r'(\[.*UTC.*\]).*'
+LEGACY_NOTES_PATTERN = r'Note:\s(.*[\s\S]+)Metric Name:'
+# The metric name is the rest of the line after the last "Metric Name:"
+METRIC_PATTERN = r'[\s\S]*Metric Name:(.*)'
+# Fragments of check-in cell values, including edge cases of every marker
+CHECKIN_PIECES = [
+    '[', ']', '] ', 'UTC', 'Status:', 'Status: ', 'Note:', 'Note: ', 'Metric Name:', ' ', '\n',
+    '\t', ':', 'x', 'On Track', '2023-01-01 00:00:00', 'Progress',
+]
+
+
+def parse_legacy(checkin):
+    """Parses a check-in with a search of the legacy patterns per value."""
+    values = []
+    for pattern in [LEGACY_STATUS_PATTERN, LEGACY_TIMESTAMP_PATTERN, LEGACY_NOTES_PATTERN]:
+        match = re.search(pattern, checkin)
+        values.append(match.group(1) if match else None)
+    match = re.match(METRIC_PATTERN, checkin)
+    values.append(match.group(1).strip() or None if match else None)
+    return tuple(values)
+
+
+def generate_checkins(count, seed=0):
+    """Generates random check-in cell values out of the check-in pieces."""
+    rng = random.Random(seed)
+    return [
+        ''.join(rng.choice(CHECKIN_PIECES) for _ in range(rng.randrange(1, 15)))
+        for _ in range(count)
+    ]
+
+
+def test_tokenize_checkin():
+    """The tokenizer parses every value of a check-in in a single scan."""
+    checkin = (
+        '[2023-01-01 10:00:00 UTC] Status: On Track\n'
+        'Note: Check-in notes\nwith a second line\nMetric Name: Progress'
+    )
+    assert parsers.tokenize_checkin(checkin) == (
+        'On Track', '[2023-01-01 10:00:00 UTC]', 'Check-in notes\nwith a second line\n', 'Progress')
+
+
+@pytest.mark.parametrize('checkin', [None, '', 'No markers at all'])
+def test_tokenize_checkin_without_values(checkin):
+    """Values that aren't found are None."""
+    assert parsers.tokenize_checkin(checkin) == (None, None, None, None)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_tokenize_checkin_matches_legacy_patterns(seed):
+    """The tokenizer parses the same values as a search of the legacy patterns per value."""
+    for checkin in generate_checkins(10000, seed):
+        assert parsers.tokenize_checkin(checkin) == parse_legacy(checkin), repr(checkin)
+
+
+@pytest.mark.parametrize('parse, pattern', [
+    (parsers.parse_checkin_status, LEGACY_STATUS_PATTERN),
+    (parsers.parse_checkin_timestamp, LEGACY_TIMESTAMP_PATTERN),
+    (parsers.parse_checkin_notes, LEGACY_NOTES_PATTERN),
+])
+def test_parse_checkin_values_match_legacy_patterns(parse, pattern):
+    """The precompiled patterns parse the same values as the legacy patterns."""
+    for checkin in generate_checkins(5000):
+        match = re.search(pattern, checkin)
+        assert parse(checkin) == (match.group(1) if match else None), repr(checkin)
+
+
+def test_regex_parse_compiles_pattern_strings_once():
+    """Pattern strings are compiled once and reused."""
+    assert parsers.regex_parse('Array::Check-in 1', 'Array::(.*)') == 'Check-in 1'
+    assert parsers.compile_pattern('Array::(.*)') is parsers.compile_pattern('Array::(.*)')
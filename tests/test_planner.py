@@ -0,0 +1,63 @@
+""" test_planner.py file to test the alignment plan of the goals CSV."""
+from planner import build_alignment_plan
+from ingest import GoalAlignment
+
+
+def get_aligned_to(parent_id):
+    """Gets the aligned to cell value of a goal aligned to the given goal ID."""
+    return f'(weight: 100, Id: {parent_id})' if parent_id else None
+
+
+def plan(*goals):
+    """Builds the alignment plan of (goal ID, parent goal ID) pairs in row order."""
+    return build_alignment_plan(
+        (index, GoalAlignment(goal_id, get_aligned_to(parent_id)))
+        for index, (goal_id, parent_id) in enumerate(goals, start=1)
+    )
+
+
+def test_levels():
+    """Every goal is planned in the level after its parent goal's."""
+    alignment_plan = plan(('1', None), ('3', '2'), ('2', '1'), ('4', '1'))
+    assert alignment_plan.levels == [['1'], ['2', '4'], ['3']]
+    assert alignment_plan.goal_levels == {'1': 0, '2': 1, '3': 2, '4': 1}
+    assert alignment_plan.parents == {'3': '2', '2': '1', '4': '1'}
+    assert alignment_plan.children == {'2': ['3'], '1': ['2', '4']}
+    assert alignment_plan.goal_ids == {'1': 1, '3': 2, '2': 3, '4': 4}
+
+
+def test_dangling_parents():
+    """Goals aligned to a goal that isn't in the CSV are planned without a parent."""
+    alignment_plan = plan(('1', None), ('2', '99'), ('3', '2'))
+    assert alignment_plan.dangling == {'2': '99'}
+    assert alignment_plan.parents == {'3': '2'}
+    assert alignment_plan.levels == [['1', '2'], ['3']]
+
+
+def test_cycles():
+    """The goals of an alignment cycle are planned without a parent, while goals aligned
+    to one of them are still linked to it."""
+    alignment_plan = plan(('1', '2'), ('2', '1'), ('3', '1'), ('4', '4'))
+    assert alignment_plan.cycles == [['1', '2'], ['4']]
+    assert alignment_plan.parents == {'3': '1'}
+    assert alignment_plan.levels == [['1', '2', '4'], ['3']]
+
+
+def test_duplicate_goal_ids():
+    """Only the first row of a duplicate goal ID is planned."""
+    alignment_plan = plan(('1', None), ('2', '1'), ('1', '2'))
+    assert alignment_plan.duplicates == {'1': [1, 3]}
+    assert alignment_plan.parents == {'2': '1'}
+    assert alignment_plan.is_planned_goal(1, GoalAlignment('1', None))
+    assert not alignment_plan.is_planned_goal(3, GoalAlignment('1', get_aligned_to('2')))
+
+
+def test_assign_shards():
+    """Every goal is assigned to the same shard as its parent and child goals."""
+    alignment_plan = plan(('1', None), ('2', '1'), ('3', '2'), ('4', None), ('5', '4'), ('6', None))
+    goal_shards = alignment_plan.assign_shards(2)
+    assert goal_shards['1'] == goal_shards['2'] == goal_shards['3']
+    assert goal_shards['4'] == goal_shards['5'] != goal_shards['1']
+    shard = alignment_plan.get_shard(goal_shards['4'], 2)
+    assert shard.levels == [['4', '6'], ['5']]
+    assert shard.parents == {'5': '4'}
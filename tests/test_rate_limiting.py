@@ -0,0 +1,51 @@
+""" test_rate_limiting.py file to test pacing and retrying the Asana API requests."""
+import time
+import asana
+import pytest
+from auth import client as asana_client
+from rate_limiting import TokenBucket
+from users import get_all_users
+
+
+def test_token_bucket():
+    """Requests wait for a token once the burst is used up, and for a pause to be over."""
+    bucket = TokenBucket(600, burst=2)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.1, abs=0.05)
+    bucket.pause(0.2)
+    assert bucket.acquire() >= 0.2
+
+
+def test_retry_after(mock_asana, monkeypatch):
+    """A rate limited request is retried once its Retry-After has passed, and every other
+    request waits for it as well."""
+    bucket = TokenBucket(60000)
+    monkeypatch.setattr(asana_client, 'bucket', bucket)
+    mock_asana.add_fault('GET /users', 429, headers={'Retry-After': '0.2'})
+    rate_limited = asana_client.stats['rate_limited']
+    started_at = time.monotonic()
+    assert list(get_all_users()) == mock_asana.collections['/users']
+    assert time.monotonic() - started_at >= 0.2
+    assert asana_client.stats['rate_limited'] == rate_limited + 1
+    assert bucket.paused_until >= started_at + 0.2
+    assert mock_asana.request_counts['GET /users'] == 2
+
+
+def test_backoff(mock_asana, monkeypatch):
+    """Transient errors are retried with a backoff until the maximum number of retries."""
+    delays = []
+    monkeypatch.setattr(
+        'rate_limiting.random.uniform', lambda low, high: delays.append(high) or low)
+    monkeypatch.setitem(asana_client.options, 'max_retries', 2)
+    for _ in range(2):
+        mock_asana.add_fault('GET /users', 503)
+    assert list(get_all_users()) == mock_asana.collections['/users']
+    assert delays == [
+        asana_client.RETRY_DELAY, asana_client.RETRY_DELAY * asana_client.RETRY_BACKOFF]
+
+    for _ in range(3):
+        mock_asana.add_fault('GET /users', 500)
+    with pytest.raises(asana.error.ServerError):
+        list(get_all_users())
+    assert mock_asana.request_counts['GET /users'] == 6
@@ -0,0 +1,34 @@
+""" test_sharding.py file to test running the migration in several shard processes."""
+import sharding
+from sharding import get_shard_arguments, get_shard_environments
+from migrator import parse_options
+from options import MigrationOptions, PHASE_GOALS
+
+
+def test_shard_arguments():
+    """A shard process runs with the options of the coordinator on its own shard,
+    reading the workspace data from the cache the coordinator refreshed."""
+    options = MigrationOptions(
+        skip_processed=False, workers=4, refresh_cache=True, page_size=50, phase=PHASE_GOALS,
+        shards=3, pool_size=8, batch_size=5)
+    shard_options = parse_options(get_shard_arguments(options, 2)[2:])
+    assert shard_options == options._replace(refresh_cache=False, shard=(2, 3))
+
+    options = MigrationOptions(sync=True, shards=2, pool_size=0)
+    shard_options = parse_options(get_shard_arguments(options, 0)[2:])
+    assert shard_options == options._replace(shard=(0, 2))
+
+
+def test_shard_environments(monkeypatch):
+    """The shards take turns using the shard tokens, and the shards using the same token
+    split its rate limit evenly."""
+    monkeypatch.setattr(sharding, 'ASANA_SHARD_TOKENS', ['a', 'b'])
+    monkeypatch.setattr(sharding, 'ASANA_RATE_LIMIT', 1500)
+    environments = get_shard_environments(3)
+    assert [
+        (environment['ASANA_TOKEN'], environment['ASANA_RATE_LIMIT'])
+        for environment in environments
+    ] == [('a', '750'), ('b', '1500'), ('a', '750')]
+
+    monkeypatch.setattr(sharding, 'ASANA_RATE_LIMIT', 0)
+    assert {environment['ASANA_RATE_LIMIT'] for environment in get_shard_environments(2)} == {'0'}
@@ -0,0 +1,109 @@
+""" test_state.py file to test resuming goals from the migration state store."""
+import pytest
+from state import (
+    StateStore, STEP_CREATED, STEP_METRIC, STEP_LINKED, STEP_SUBGOAL_METRIC, STEP_STATUS_UPDATE)
+
+
+@pytest.fixture(name='state_store')
+def fixture_state_store(tmp_path, monkeypatch):
+    """A new state store, without any output CSVs of earlier versions to import."""
+    monkeypatch.chdir(tmp_path)
+    with StateStore(file_path=str(tmp_path / 'migration_state.db')) as state_store:
+        yield state_store
+
+
+def test_start_new_goal(state_store):
+    """A goal that was never processed starts without a GID or completed steps."""
+    goal_state = state_store.start_goal('1', 1)
+    assert goal_state.gid is None
+    assert goal_state.steps == set()
+    assert not goal_state.is_new
+
+
+def test_resume_partially_processed_goal(state_store):
+    """A partially processed goal resumes after its last completed step."""
+    state_store.start_goal('1', 1).complete(STEP_CREATED, 'gid1', is_new=True)
+    goal_state = state_store.start_goal('1', 1)
+    assert goal_state.gid == 'gid1'
+    assert goal_state.steps == {STEP_CREATED}
+    assert goal_state.is_new
+    assert state_store.get_processed_goal_ids() == set()
+
+
+def test_restart_processed_goal(state_store):
+    """A completely processed goal is processed again from the start, keeping its GID,
+    and a newly created goal is queued for its status updates to be backfilled."""
+    goal_state = state_store.start_goal('1', 1)
+    goal_state.complete(STEP_CREATED, 'gid1', is_new=True)
+    goal_state.complete(STEP_METRIC, 'gid1', is_new=True)
+    goal_state.finish('gid1', 'hash1')
+    assert state_store.get_processed_goal_ids() == {'1'}
+    assert state_store.get_payload_hashes() == {'1': 'hash1'}
+    assert state_store.get_goals_to_backfill() == {'1': ('gid1', 0)}
+
+    goal_state = state_store.start_goal('1', 2)
+    assert goal_state.gid == 'gid1'
+    assert goal_state.steps == set()
+    assert not goal_state.is_new
+    assert state_store.get_processed_goal_ids() == set()
+
+
+def test_import_checkpoints(state_store, tmp_path):
+    """The output CSVs of earlier versions are imported, without a partially written row."""
+    processed_file_path = tmp_path / 'goals_processed.csv'
+    processed_file_path.write_text(
+        'goal_index,goal_id,asana_goal_gid,payload_hash\n1,1,gid1,hash1\n2,2,gid2\n3,3,gi',
+        encoding='utf-8')
+    status_updates_file_path = tmp_path / 'status_updates_processed.csv'
+    status_updates_file_path.write_text(
+        'goal_id,asana_goal_gid,status_updates_created\n1,gid1,2\n', encoding='utf-8')
+    state_store.import_checkpoints(str(processed_file_path), str(status_updates_file_path))
+
+    assert state_store.get_processed_goal_ids() == {'1', '2'}
+    assert state_store.get_payload_hashes() == {'1': 'hash1'}
+    assert state_store.get_goals_to_backfill() == {'1': ('gid1', 2)}
+
+
+def test_keep_links_of_same_parent(state_store):
+    """With keep_links, a processed goal still aligned to the same parent goal keeps its
+    link steps, while a goal aligned to another parent goal is linked again."""
+    for goal_id in ['2', '3']:
+        goal_state = state_store.start_goal(goal_id, int(goal_id), '1')
+        for step in [STEP_CREATED, STEP_LINKED, STEP_SUBGOAL_METRIC]:
+            goal_state.complete(step, f'gid{goal_id}')
+        goal_state.finish(f'gid{goal_id}', 'hash', '1')
+
+    assert state_store.start_goal('2', 2, '1', keep_links=True).steps == {
+        STEP_LINKED, STEP_SUBGOAL_METRIC}
+    goal_state = state_store.start_goal('3', 3, '4', keep_links=True)
+    assert goal_state.steps == set()
+    # The goal is still linked to its previous parent goal until it is removed from it
+    assert goal_state.parent_id == '1'
+    goal_state.unlink()
+    assert state_store.get_goal_state('3').parent_id is None
+
+
+def test_reset_links_without_keep_links(state_store):
+    """Without keep_links, a processed goal is linked to its parent goal again."""
+    goal_state = state_store.start_goal('2', 2, '1')
+    goal_state.complete(STEP_LINKED, 'gid2')
+    goal_state.finish('gid2', 'hash', '1')
+    assert state_store.start_goal('2', 2, '1').steps == set()
+
+
+def test_unconfirmed_steps(state_store):
+    """An unconfirmed step is kept across runs until that step is completed."""
+    state_store.start_goal('1', 1).mark_unconfirmed(STEP_CREATED)
+    goal_state = state_store.start_goal('1', 1)
+    assert goal_state.unconfirmed_step == STEP_CREATED
+    assert state_store.get_unconfirmed_goal_ids(STEP_CREATED) == {'1'}
+    goal_state.complete(STEP_CREATED, 'gid1', is_new=True)
+    assert state_store.get_goal_state('1').unconfirmed_step is None
+
+    goal_state.mark_unconfirmed(STEP_LINKED)
+    goal_state.complete(STEP_METRIC, 'gid1')
+    assert state_store.get_unconfirmed_goal_ids(STEP_LINKED) == {'1'}
+
+    state_store.mark_unconfirmed('1', STEP_STATUS_UPDATE)
+    state_store.set_status_updates_created('1', 1)
+    assert state_store.get_goal_state('1').unconfirmed_step is None
@@ -0,0 +1,41 @@
+""" test_workspace.py file to test loading and caching the workspace data."""
+import json
+from workspace import WorkspaceContext
+
+
+def test_cache(mock_asana, tmp_path):
+    """A dataset is fetched once and read from the cache until it expires."""
+    users = mock_asana.collections['/users']
+    assert WorkspaceContext('1', cache_dir=tmp_path).users == users
+    assert WorkspaceContext('1', cache_dir=tmp_path).users == users
+    assert mock_asana.request_counts['GET /users'] == 1
+
+    assert WorkspaceContext('1', cache_dir=tmp_path, cache_ttl=-1).users == users
+    assert mock_asana.request_counts['GET /users'] == 2
+
+
+def test_changed_cache(mock_asana, tmp_path):
+    """A cache whose content doesn't match its hash, or of another workspace, isn't used."""
+    users = mock_asana.collections['/users']
+    assert WorkspaceContext('1', cache_dir=tmp_path).users == users
+    cache_path = tmp_path / '1_users.json'
+    cache = json.loads(cache_path.read_text(encoding='utf-8'))
+    cache['data'][0]['gid'] = 'u2'
+    cache_path.write_text(json.dumps(cache), encoding='utf-8')
+    assert WorkspaceContext('1', cache_dir=tmp_path).users == users
+    assert mock_asana.request_counts['GET /users'] == 2
+
+    (tmp_path / '2_users.json').write_bytes(cache_path.read_bytes())
+    assert WorkspaceContext('2', cache_dir=tmp_path).users == users
+    assert mock_asana.request_counts['GET /users'] == 3
+
+
+def test_goals_journal(mock_asana, tmp_path):
+    """Goals created since the goals were cached are replayed from the journal."""
+    mock_asana.add_goal('g1', '[Ref: Ally Id: 1]\n\nExisting goal')
+    workspace = WorkspaceContext('1', cache_dir=tmp_path)
+    workspace.add_goal('g2', '[Ref: Ally Id: 2]\n\n')
+
+    goal_index = WorkspaceContext('1', cache_dir=tmp_path).goal_index
+    assert (goal_index.get('1'), goal_index.get('2')) == ('g1', 'g2')
+    assert mock_asana.request_counts['GET /goals'] == 1
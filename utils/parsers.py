@@ -1,42 +1,151 @@
 """parsers.py file for utility helper methods to parse information from strings."""
 import re
+from functools import lru_cache
+
+# Precompiled patterns of the helper methods, so no pattern is looked up or compiled per call
+GOAL_ID_PATTERN = re.compile(r'Id:\s(\d+)')
+GOAL_WEIGHT_PATTERN = re.compile(r'weight:\s(\d+)')
+REFERENCE_ID_PATTERN = re.compile(r'Ref: Ally Id:\s(\d+)')
+PERIOD_YEAR_PATTERN = re.compile(r'.*\s(\d+)')
+PERIOD_QUARTER_PATTERN = re.compile(r'(Q\d)\s\d+')
+
+# Precompiled patterns to parse the checkin cell values, e.g. for vectorized parsing
+CHECKIN_TIMESTAMP_PATTERN = re.compile(r'(\[.*UTC.*\]).*')
+CHECKIN_STATUS_PATTERN = re.compile(r'Status:\s(.*)')
+# Matches the same notes as r'Note:\s(.*[\s\S]+)Metric Name:' without backtracking
+# over every way to split the notes between both repeats
+CHECKIN_NOTES_PATTERN = re.compile(r'Note:\s([\s\S]+)Metric Name:')
+
+# A path segment of an Asana API request holding a GID, e.g. /goals/123/setMetric
+API_GID_SEGMENT_PATTERN = re.compile(r'/[^/]*[0-9][^/]*')
+
+# The markers the checkin tokenizer looks for in a checkin cell value
+CHECKIN_STATUS_MARKER = 'Status:'
+CHECKIN_NOTES_MARKER = 'Note:'
+CHECKIN_METRIC_MARKER = 'Metric Name:'
+# A timestamp starting at a '[', e.g. [2023-01-01 10:00:00 UTC]
+CHECKIN_TIMESTAMP_TOKEN_PATTERN = re.compile(r'\[.*UTC.*\]')
 
 
 def parse_goal_id(input_string):
     """ A helper method to parse the goal ID from a string."""
-    return regex_parse(input_string, r'Id:\s(\d+)')
+    return regex_parse(input_string, GOAL_ID_PATTERN)
 
 
 def parse_goal_weight(input_string):
     """ A helper method to parse the goal weight from a string."""
-    return regex_parse(input_string, r'weight:\s(\d+)')
+    return regex_parse(input_string, GOAL_WEIGHT_PATTERN)
+
+
+def parse_reference_id(input_string):
+    """ A helper method to parse the Ally reference ID from a goal's notes."""
+    return regex_parse(input_string, REFERENCE_ID_PATTERN)
 
 
 def parse_checkin_timestamp(input_string):
     """ A helper method to parse the checkin timestamp from a string."""
-    return regex_parse(input_string, r'(\[.*UTC.*\]).*')
+    return regex_parse(input_string, CHECKIN_TIMESTAMP_PATTERN)
 
 
 def parse_checkin_status(input_string):
     """ A helper method to parse the checkin status from a string."""
-    return regex_parse(input_string, r'Status:\s(.*)')
+    return regex_parse(input_string, CHECKIN_STATUS_PATTERN)
 
 
 def parse_checkin_notes(input_string):
     """ A helper method to parse the checkin notes from a string."""
-    return regex_parse(input_string, r'Note:\s(.*[\s\S]+)Metric Name:')
+    return regex_parse(input_string, CHECKIN_NOTES_PATTERN)
+
+
+def tokenize_checkin(input_string):
+    """ A helper method to parse the (status, timestamp, notes, metric name) of a checkin
+    cell value in a single scan for its markers, instead of one regex search per value.
+    The status, timestamp and notes are the same as parse_checkin_status,
+    parse_checkin_timestamp and parse_checkin_notes find: the rest of the line after the
+    first "Status:", the first bracketed timestamp with "UTC" in it, and everything from
+    the first "Note:" up to the last "Metric Name:". The metric name is the rest of the
+    line after the last "Metric Name:". Values that aren't found are None."""
+    if not input_string:
+        return None, None, None, None
+    status = timestamp = notes = metric = None
+
+    status_end = find_marker(input_string, CHECKIN_STATUS_MARKER)
+    if status_end is not None:
+        status = get_rest_of_line(input_string, status_end)
+
+    if 'UTC' in input_string:
+        start = input_string.find('[')
+        while start >= 0 and timestamp is None:
+            # Only the line the '[' is on is matched, so this never scans past it
+            match = CHECKIN_TIMESTAMP_TOKEN_PATTERN.match(input_string, start)
+            if match:
+                timestamp = match.group(0)
+            start = input_string.find('[', start + 1)
+
+    metric_start = input_string.rfind(CHECKIN_METRIC_MARKER)
+    if metric_start >= 0:
+        metric_end = metric_start + len(CHECKIN_METRIC_MARKER)
+        metric = get_rest_of_line(input_string, metric_end).strip() or None
+        notes_start = find_marker(input_string, CHECKIN_NOTES_MARKER, metric_start)
+        if notes_start is not None and notes_start < metric_start:
+            notes = input_string[notes_start:metric_start]
+    return status, timestamp, notes, metric
+
+
+def find_marker(input_string, marker, end=None):
+    """ A helper method to find the first marker followed by a whitespace character
+    (as matched by the marker followed by \\s in a pattern) in a string, optionally
+    before an end position. Returns the position after the whitespace character, or None."""
+    start = input_string.find(marker, 0, end)
+    while start >= 0:
+        start += len(marker)
+        if input_string[start:start + 1].isspace():
+            return start + 1
+        start = input_string.find(marker, start, end)
+    return None
+
+
+def get_rest_of_line(input_string, start):
+    """ A helper method to get the rest of the line of a string from a position on."""
+    end = input_string.find('\n', start)
+    return input_string[start:] if end < 0 else input_string[start:end]
+
+
+def parse_api_endpoint(method, path):
+    """ A helper method to get the endpoint of an Asana API request, with any GIDs in its
+    path replaced by a placeholder, e.g. POST /goals/{gid}/setMetric."""
+    return f'{method.upper()} {API_GID_SEGMENT_PATTERN.sub("/{gid}", path)}'
+
+
+@lru_cache(maxsize=None)
+def parse_period_display_name(input_string):
+    """ A helper method to convert a period string (e.g. "Q1 2022" or "Annual 2022")
+    to its Asana time period display name (e.g. "Q1 FY22" or "FY22").
+    Memoized since most CSVs only use a handful of different periods."""
+    year_text = regex_parse(input_string, PERIOD_YEAR_PATTERN)
+    quarter_text = regex_parse(input_string, PERIOD_QUARTER_PATTERN)
+    display_value = ''
+    if year_text and 'Annual' in input_string:
+        # Get the last two characters of year string
+        display_value = f'FY{year_text[-2:]}'
+    elif quarter_text and year_text:
+        display_value = f'{quarter_text} FY{year_text[-2:]}'
+    return display_value
+
+
+@lru_cache(maxsize=None)
+def compile_pattern(regex):
+    """ A helper method to compile a pattern string once."""
+    return re.compile(regex)
 
 
 def regex_parse(input_string, regex):
     """A base method to search for a capturing group match
-    based on a given input string and a corresponding regex."""
-    invalid_input = (
-        not input_string
-        or not regex
-        or len(input_string) <= 0
-        or len(regex) <= 0
-    )
-    if invalid_input:
+    based on a given input string and a corresponding regex,
+    either a precompiled pattern or a pattern string that is compiled once."""
+    if not input_string or not regex:
         return None
-    result = re.search(regex, input_string)
+    if isinstance(regex, str):
+        regex = compile_pattern(regex)
+    result = regex.search(input_string)
     return result.group(1) if result else None